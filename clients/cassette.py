@@ -0,0 +1,165 @@
+"""
+Record/replay cassettes for the provider clients.
+
+In record mode every request a client sends is passed through to the provider and the
+request/response pair is stored in a cassette. In replay mode the same request is
+answered from the cassette without touching the network, after sleeping for the
+recorded latency multiplied by `latency_scale` (0 replays as fast as possible).
+
+A cassette is a single SQLite file. Interactions are indexed by a hash of the
+normalized request, and the response payloads are stored as zlib-compressed JSON.
+When the same request was recorded several times (e.g. a weekly run collected over
+several weeks), replay cycles through the recordings in the order they were made.
+
+Clients describe each call as a plain dict (service, model, prompt, sampling settings)
+and hand a zero-argument `send` function to `Client._request`, which routes it through
+the active cassette if there is one.
+
+The output token limit is stored with each interaction but left out of the key: it is
+learned from the output file's history and from the order responses come in (see
+source/token_limits.py), so a replay into a fresh output file asks with other limits than
+the recording did. Cassettes recorded when the limit was part of the key still replay.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from clients.exceptions import CassetteMissError
+
+MODES = ("record", "replay")
+
+_active_cassette = None
+
+
+def activate(cassette):
+    """Routes all client requests through `cassette` until deactivate() is called."""
+    global _active_cassette
+    _active_cassette = cassette
+
+
+def deactivate():
+    global _active_cassette
+    _active_cassette = None
+
+
+def active_cassette():
+    return _active_cassette
+
+
+def is_replaying():
+    """True when requests are answered from a cassette, so clients must not need the network."""
+    return _active_cassette is not None and _active_cassette.mode == "replay"
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        # line endings and trailing whitespace in prompt files should not change the key
+        lines = value.replace("\r\n", "\n").strip().split("\n")
+        return "\n".join(line.rstrip() for line in lines)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items()) if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+# request fields that do not identify the interaction
+UNKEYED_FIELDS = ("max_tokens", "max_output_tokens")
+
+
+def request_key(request, unkeyed=UNKEYED_FIELDS):
+    """Returns the hash used to index a request in the cassette."""
+    keyed = {field: value for field, value in request.items() if field not in unkeyed}
+    normalized = json.dumps(_normalize(keyed), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    def __init__(self, path, mode="replay", latency_scale=1.0, logger=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}', expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.logger = logger
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+        self._lock = threading.Lock()
+        self._replay_positions = {}
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS interactions (
+                   key TEXT NOT NULL,
+                   seq INTEGER NOT NULL,
+                   service TEXT,
+                   request TEXT NOT NULL,
+                   response BLOB NOT NULL,
+                   latency REAL NOT NULL,
+                   recorded_at TEXT NOT NULL,
+                   PRIMARY KEY (key, seq)
+               )"""
+        )
+        self._connection.commit()
+
+    def play(self, request, send):
+        """Answers `request` from the cassette (replay) or by calling `send` and storing the result (record)."""
+        key = request_key(request)
+        if self.mode == "replay":
+            return self._replay(key, request, legacy_key=request_key(request, unkeyed=()))
+
+        start = time.perf_counter()
+        response = send()
+        latency = time.perf_counter() - start
+        self._record(key, request, response, latency)
+        return response
+
+    def _record(self, key, request, response, latency):
+        payload = zlib.compress(json.dumps(response, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            (seq,) = self._connection.execute(
+                "SELECT COUNT(*) FROM interactions WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT INTO interactions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, seq, request.get("service"), json.dumps(_normalize(request), ensure_ascii=False),
+                 payload, latency, datetime.now().isoformat(timespec="seconds")),
+            )
+            self._connection.commit()
+            self.recorded += 1
+
+    def _replay(self, key, request, legacy_key=None):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT response, latency FROM interactions WHERE key = ? ORDER BY seq", (key,)
+            ).fetchall()
+            if not rows and legacy_key:
+                # recorded while the token limit was part of the key
+                key = legacy_key
+                rows = self._connection.execute(
+                    "SELECT response, latency FROM interactions WHERE key = ? ORDER BY seq", (key,)
+                ).fetchall()
+            if not rows:
+                self.misses += 1
+                raise CassetteMissError(f"No recorded response for {request.get('service')} request {key[:12]}")
+            position = self._replay_positions.get(key, 0)
+            self._replay_positions[key] = position + 1
+            self.hits += 1
+        payload, latency = rows[position % len(rows)]
+
+        if self.latency_scale > 0:
+            time.sleep(latency * self.latency_scale)
+        return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+    def stats(self):
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses, "recorded": self.recorded}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
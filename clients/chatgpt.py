@@ -1,18 +1,22 @@
 import tenacity
 from openai import OpenAI
 
+from clients import retries
 from clients.client import Client
+from clients.exceptions import CassetteMissError
 from clients.translation_map import TRANSLATION_MAP
 
 # Client to interact with the ChatGPT API 
 class ChatGPTClient(Client):
-    def __init__(self, key, logger):
-        super().__init__(key, logger)
+    def __init__(self, key, logger, stream=False):
+        super().__init__(key, logger, stream=stream)
         self.model = "gpt-5.4-nano-2026-03-17"
 
     @tenacity.retry(
             wait=tenacity.wait_exponential(multiplier=1, min=6, max=180),
             stop=tenacity.stop_after_attempt(3),
+            retry=tenacity.retry_if_not_exception_type(CassetteMissError),
+            before_sleep=retries.note_retry,
             reraise=True
         )
     
@@ -35,8 +39,6 @@ class ChatGPTClient(Client):
             url=url
         )
 
-        client = OpenAI(api_key=self.key)
-        
         # response = client.chat.completions.create(
         #     model=self.model,
         #     messages=[
@@ -47,12 +49,53 @@ class ChatGPTClient(Client):
         #     top_p=self.top_p
         # )
 
-        response = client.responses.create(
+        request = {
+            "service": "chatgpt",
+            "model": self.model,
+            "input": prompt,
+            "temperature": self.temperature,
+            "max_output_tokens": self.token_limit(),
+            "stream": self.stream,
+        }
+
+        def send():
+            client = OpenAI(api_key=self.key)
+            if self.stream:
+                return self._consume_stream(self._stream_events(client, prompt), self.output_char_limit(prompt_file))
+
+            response = client.responses.create(
+                model=self.model,
+                input=prompt,
+                temperature=self.temperature,
+                max_output_tokens=self.token_limit(),
+            )
+            return self._completion(response.output_text,
+                                    response.usage.output_tokens if response.usage else None,
+                                    self._finish_reason(response))
+
+        return self._request(request, send)["text"]
+
+    def _stream_events(self, client, prompt):
+        stream = client.responses.create(
             model=self.model,
             input=prompt,
             temperature=self.temperature,
-            max_output_tokens=self.max_tokens,
+            max_output_tokens=self.token_limit(),
+            stream=True,
         )
+        try:
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    yield event.delta, None, None
+                elif event.type in ("response.completed", "response.incomplete"):
+                    usage = event.response.usage
+                    yield None, usage.output_tokens if usage else None, self._finish_reason(event.response)
+        finally:
+            stream.close()
 
-        return response.output_text
+    def _finish_reason(self, response):
+        # the Responses API marks outputs cut off by max_output_tokens as incomplete
+        if response.status == "incomplete" and response.incomplete_details:
+            return response.incomplete_details.reason
+        return response.status
 
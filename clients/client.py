@@ -1,17 +1,36 @@
+import os
+import re
+import time
 import tenacity
 import openai
-from clients.exceptions import QuotaExhaustedError
+from clients import cassette, retries
+from clients.exceptions import QuotaExhaustedError, CassetteMissError
 from google.genai import errors as genai_errors
 
+# finish reasons providers report when an output stopped at the token limit
+TRUNCATION_REASONS = {"length", "max_tokens", "max_output_tokens", "MAX_TOKENS"}
+
+def is_truncated(finish_reason):
+    return finish_reason in TRUNCATION_REASONS
+
 # Abstract Client parent
 class Client:
-    def __init__(self, key, logger):
+    def __init__(self, key, logger, stream=False):
         self.key = key
         self.temperature = 1.0
         self.max_tokens = 300
         #self.max_tokens = 2048      
+        # limit for the next request picked from observed usage (see source/token_limits.py); None uses max_tokens
+        self.output_token_limit = None
+        # the scheduler's RateLimiter for the service (see source/scheduler.py), waited on by every attempt
+        self.limiter = None
         self.top_p = 1.0
         self.logger = logger
+        # streaming LLM clients record time to first token and stop runaway outputs
+        self.stream = stream
+        self.overrun_factor = 2.0   # abort once the output is this many times the prompt's character limit
+        # anything the last request reported besides the text (timings, usage, ...)
+        self.response_metadata = {}
 
     # we aren't actually using these additional arguments for sending_agency, location, url
     def gather_prompt(self, prompt_file, disaster, language, sending_agency=None, location=None, time=None, url=None):
@@ -29,15 +48,100 @@ class Client:
                 prompt_text = prompt_text.replace("{TIME}", time)
 
         return prompt_text
+
+    def token_limit(self):
+        """Returns the output token limit to send with the next request."""
+        return self.output_token_limit or self.max_tokens
+
+    def _completion(self, text, output_tokens=None, finish_reason=None):
+        """Builds the payload for `_request` from a finished completion and its usage."""
+        return {
+            "text": text,
+            "output_tokens": output_tokens,
+            "finish_reason": finish_reason,
+            "truncated": is_truncated(finish_reason),
+        }
+
+    def output_char_limit(self, prompt_file):
+        """Returns the character limit a prompt asks for (e.g. 360 for prompt_simple_360.txt), or None."""
+        match = re.search(r"_(\d+)\.txt$", os.path.basename(prompt_file))
+        return int(match.group(1)) if match else None
+
+    def _request(self, request, send):
+        """
+        Sends one provider request. `request` describes the call (service, model, prompt, settings)
+        and `send` performs it, returning a JSON-serializable dict with at least a "text" key.
+        When a cassette is active the call is recorded or replayed instead of sent directly.
+        Everything in the returned dict except the text is kept in `response_metadata`.
+        Each call, retries included, first waits on `limiter`, and raises QuotaExhaustedError
+        once the run has used the service's requests per day.
+        """
+        if self.limiter is not None and not self.limiter.wait():
+            raise QuotaExhaustedError(f"{request.get('service')}: the run has used its requests per day")
+        active = cassette.active_cassette()
+        payload = send() if active is None else active.play(request, send)
+        self.response_metadata = {key: value for key, value in payload.items() if key != "text"}
+        return payload
+
+    def _consume_stream(self, events, char_limit=None):
+        """
+        Reads a streamed completion. `events` yields (text_delta, output_tokens, finish_reason)
+        triples, where output_tokens and finish_reason are None until the provider reports them.
+
+        Stops reading, and closes the stream, once the text runs past `overrun_factor` times
+        `char_limit`. Returns a payload for `_request` with the text plus time to first token,
+        output tokens per second, usage, whether the provider cut the output off at the token
+        limit ("truncated") and whether it was stopped here for running on ("aborted").
+        """
+        start = time.perf_counter()
+        first_token_at = None
+        parts = []
+        length = 0
+        chunks = 0
+        output_tokens = None
+        finish_reason = None
+        aborted = False
+
+        try:
+            for delta, tokens, reason in events:
+                if tokens is not None:
+                    output_tokens = tokens
+                if reason is not None:
+                    finish_reason = reason
+                if not delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(delta)
+                length += len(delta)
+                chunks += 1
+                if char_limit and length > char_limit * self.overrun_factor:
+                    aborted = True
+                    break
+        finally:
+            if hasattr(events, "close"):
+                events.close()
+
+        end = time.perf_counter()
+        generated = output_tokens or chunks
+        generation_time = end - first_token_at if first_token_at is not None else 0.0
+        payload = self._completion("".join(parts), output_tokens, finish_reason)
+        payload.update({
+            "ttft": round(first_token_at - start, 3) if first_token_at is not None else None,
+            "tokens_per_second": round(generated / generation_time, 1) if generation_time > 0 else None,
+            "aborted": aborted,
+        })
+        return payload
     
     @tenacity.retry(
             reraise=True,
             wait=tenacity.wait_exponential(multiplier=2, min=5, max=120), # adjust to model limits
             stop=tenacity.stop_after_attempt(10),
-            retry = tenacity.retry_if_not_exception_type(QuotaExhaustedError),
+            retry = tenacity.retry_if_not_exception_type((QuotaExhaustedError, CassetteMissError)),
+            before_sleep=retries.note_retry,
         )
     
     def safe_chat(self, prompt_file, language, disaster):
         # IMPORTANT: don't catch-and-log here unless you re-raise,
         # otherwise Tenacity thinks it succeeded and won't retry.
-        return self.chat(prompt_file=prompt_file, language=language, disaster=disaster)
\ No newline at end of file
+        return self.chat(prompt_file=prompt_file, language=language, disaster=disaster)
\ No newline at end of file
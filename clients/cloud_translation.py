@@ -1,6 +1,7 @@
 from google.cloud import translate
 from google.api_core import exceptions
 from clients.client import Client
+from clients.exceptions import CassetteMissError, QuotaExhaustedError
 from clients.translation_map import TRANSLATION_MAP
 
 class GoogleCloudTranslationClient(Client):
@@ -27,18 +28,27 @@ class GoogleCloudTranslationClient(Client):
         if target_language_code in self._DISABLED_LANGUAGES:
             return prompt
 
-        translate_client = translate.TranslationServiceClient(
-            client_options={"quota_project_id": self.project_id}
-        )
         parent = f"projects/{self.project_id}"
+        request = {
+            "service": "google_translate",
+            "parent": parent,
+            "contents": [prompt],
+            "target_language_code": target_language_code,
+        }
 
-        try:
+        def send():
+            translate_client = translate.TranslationServiceClient(
+                client_options={"quota_project_id": self.project_id}
+            )
             result = translate_client.translate_text(
                 parent=parent,
                 contents=[prompt],
                 target_language_code=target_language_code
             )
-            return result.translations[0].translated_text
+            return {"text": result.translations[0].translated_text}
+
+        try:
+            return self._request(request, send)["text"]
 
         except exceptions.ResourceExhausted as e:
             # This is the "Quota Exceeded" 429 error
@@ -60,6 +70,10 @@ class GoogleCloudTranslationClient(Client):
             self.logger.error(f"Unsupported language code '{target_language_code}': {e}")
             return prompt
             
+        except (CassetteMissError, QuotaExhaustedError):
+            # the run must not store the English prompt as a translation
+            raise
+
         except Exception as e:
             self.logger.error(f"Unexpected translation error: {e}")
             return prompt
\ No newline at end of file
@@ -1,5 +1,7 @@
 import deepl
+from clients import cassette, retries
 from clients.client import Client
+from clients.exceptions import CassetteMissError
 import tenacity
 from clients.translation_map import TRANSLATION_MAP
 
@@ -8,20 +10,27 @@ class DeepLClient(Client):
     def __init__(self, key: str, logger=None):
 
         super().__init__(key, logger)
-        self.client = deepl.Translator(auth_key=self.key)   # deepL library selects the Free or Pro API endpoint based on key
+        # deepL library selects the Free or Pro API endpoint based on key; no key is needed when replaying a cassette
+        self.client = None if cassette.is_replaying() else deepl.Translator(auth_key=self.key)
         #self.logger.info("DeepLClient initialized.")
 
         # Fetch and store supported target languages during initialization
         self.supported_target_languages_ids = set()
         try:
             # get_target_languages() returns a list of deepl.Language objects
-            for lang in self.client.get_target_languages():
-                self.supported_target_languages_ids.add(lang.code)
-                # self.logger.info(f"Added supported target language: {lang.code} ({lang.name})")
+            request = {"service": "deepL", "operation": "get_target_languages"}
+            languages = self._request(
+                request, lambda: {"codes": [lang.code for lang in self.client.get_target_languages()]}
+            )
+            self.supported_target_languages_ids.update(languages["codes"])
+        except CassetteMissError:
+            raise
         except Exception as e:
             self.logger.error(f"Failed to fetch supported DeepL target languages: {e}.")
 
-    @tenacity.retry(wait=tenacity.wait_exponential(multiplier=0.5, min=3, max=180), stop=tenacity.stop_after_attempt(3))
+    @tenacity.retry(wait=tenacity.wait_exponential(multiplier=0.5, min=3, max=180), stop=tenacity.stop_after_attempt(3),
+                    retry=tenacity.retry_if_not_exception_type(CassetteMissError), before_sleep=retries.note_retry,
+                    reraise=True)
     def translate(self, text: str, target_language: str, source_language: str = None) -> str:
 
         if not text.strip():
@@ -47,18 +56,32 @@ class DeepLClient(Client):
         # translate things
         try:
             self.logger.info(f"Attempting to translate text to {target_language_code} (source: {source_lang_code or 'auto-detect'})...")
-            result = self.client.translate_text(
-                text,
-                source_lang=source_lang_code,
-                target_lang=target_language_code
-            )
-            translated_content = result.text
+            request = {
+                "service": "deepL",
+                "operation": "translate_text",
+                "text": text,
+                "source_lang": source_lang_code,
+                "target_lang": target_language_code,
+            }
+
+            def send():
+                result = self.client.translate_text(
+                    text,
+                    source_lang=source_lang_code,
+                    target_lang=target_language_code
+                )
+                return {"text": result.text}
+
+            translated_content = self._request(request, send)["text"]
             self.logger.info(f"Successfully translated {target_language_code}.")
             return translated_content
         except deepl.DeepLException as e:
             self.logger.error(f"DeepL translation failed '{target_language}': {e}")
             #raise # Re-raise the exception after logging
             return ""
+        except CassetteMissError:
+            # a replayed run must not store an empty translation
+            raise
         except Exception as e:
             self.logger.error(f"An unexpected error occurred during DeepL translation: {e}")
             return ""
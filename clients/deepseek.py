@@ -2,7 +2,9 @@ import time
 import tenacity
 import httpx
 from openai import OpenAI
+from clients import retries
 from clients.client import Client
+from clients.exceptions import CassetteMissError
 from clients.translation_map import TRANSLATION_MAP
 
 # Client to interact with the DeepSeek API via OpenRouter
@@ -24,8 +26,8 @@ def wait_on_rate_limit(retry_state):
     return tenacity.wait_exponential(multiplier=1, min=3, max=60)(retry_state)
 
 class DeepSeekClient(Client):
-    def __init__(self, key, logger, max_tokens=400):
-        super().__init__(key, logger)
+    def __init__(self, key, logger, max_tokens=400, stream=False):
+        super().__init__(key, logger, stream=stream)
         # self.base_url = "https://openrouter.ai/api/v1"
         # self.model = "deepseek/deepseek-chat-v3-0324:free" 
         # updated 01/20/26 to below
@@ -35,7 +37,9 @@ class DeepSeekClient(Client):
         self.max_tokens = max_tokens
 
     #@tenacity.retry(wait=tenacity.wait_exponential(multiplier=1, min=6, max=180), stop=tenacity.stop_after_attempt(3))
-    @tenacity.retry(wait=wait_on_rate_limit, stop=tenacity.stop_after_attempt(3))
+    @tenacity.retry(wait=wait_on_rate_limit, stop=tenacity.stop_after_attempt(3),
+                    retry=tenacity.retry_if_not_exception_type(CassetteMissError), before_sleep=retries.note_retry,
+                    reraise=True)
     def chat(self, prompt_file, disaster, language, sending_agency=None, location=None, time=None, url=None):
         # Get language code from translation map or use language as is if not found
         language_code = TRANSLATION_MAP.get(language, language)
@@ -50,34 +54,71 @@ class DeepSeekClient(Client):
             url=url
         )
         
-        client = OpenAI(
-            base_url=self.base_url,
-            api_key=self.key,
-            http_client=httpx.Client(
-                headers={
-                    "HTTP-Referer": "http://localhost",
-                    "User-Agent": "OpenAI-Python"
-                }
+        request = {
+            "service": "deepseek",
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+            "max_tokens": self.token_limit(),
+            "top_p": self.top_p,
+            "stream": self.stream,
+        }
+
+        def send():
+            client = OpenAI(
+                base_url=self.base_url,
+                api_key=self.key,
+                http_client=httpx.Client(
+                    headers={
+                        "HTTP-Referer": "http://localhost",
+                        "User-Agent": "OpenAI-Python"
+                    }
+                )
             )
-        )
+            if self.stream:
+                return self._consume_stream(self._stream_events(client, prompt), self.output_char_limit(prompt_file))
 
-        try:
             completion = client.chat.completions.create(
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=self.temperature,
-                max_tokens=self.max_tokens,
+                max_tokens=self.token_limit(),
                 top_p=self.top_p,
                 extra_body={}
             )
+
+            # Guard against None or unexpected shape
+            if not completion or not hasattr(completion, "choices") or len(completion.choices) == 0:
+                raise ValueError(f"DeepSeek returned invalid response: {completion}")
+
+            return self._completion(completion.choices[0].message.content,
+                                    completion.usage.completion_tokens if completion.usage else None,
+                                    completion.choices[0].finish_reason)
+
+        try:
+            return self._request(request, send)["text"]
+        except CassetteMissError:
+            raise
         except Exception as e:
             self.logger.error(f"DeepSeek API request failed: {e}")
             return None
 
-        # Guard against None or unexpected shape
-        if not completion or not hasattr(completion, "choices") or len(completion.choices) == 0:
-            self.logger.error(f"DeepSeek returned invalid response: {completion}")
-            return None
-
-        return completion.choices[0].message.content
-
+    def _stream_events(self, client, prompt):
+        stream = client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            max_tokens=self.token_limit(),
+            top_p=self.top_p,
+            stream=True,
+            stream_options={"include_usage": True},
+            extra_body={}
+        )
+        try:
+            for chunk in stream:
+                tokens = chunk.usage.completion_tokens if getattr(chunk, "usage", None) else None
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                finish_reason = chunk.choices[0].finish_reason if chunk.choices else None
+                yield delta, tokens, finish_reason
+        finally:
+            stream.close()
@@ -1,3 +1,7 @@
 class QuotaExhaustedError(RuntimeError):
     """Non-retryable: hard quota exhausted."""
-    pass
\ No newline at end of file
+    pass
+
+class CassetteMissError(LookupError):
+    """Replay mode: the cassette has no recording for this request."""
+    pass
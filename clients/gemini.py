@@ -1,6 +1,7 @@
 import google.genai as genai
 import re, time
 from google.genai import errors as genai_errors
+from clients import cassette
 from clients.client import Client
 from clients.exceptions import QuotaExhaustedError
 
@@ -13,11 +14,11 @@ class GeminiClient(Client):
     _quota_exhausted = False   # class-wide latch
     _quota_message = None
 
-    def __init__(self, key, logger):
-        super().__init__(key, logger)
+    def __init__(self, key, logger, stream=False):
+        super().__init__(key, logger, stream=stream)
         self.model = "gemini-2.5-flash"
-        # Initialize the client at instantiation
-        self.client = genai.Client(api_key=self.key)
+        # Initialize the client at instantiation, unless responses are replayed from a cassette
+        self.client = None if cassette.is_replaying() else genai.Client(api_key=self.key)
 
     def chat(self, prompt_file, disaster, language, sending_agency=None, location=None, time=None, url=None):
         # If we already know quota is exhausted, fail fast (no waiting, no API call)
@@ -38,18 +39,39 @@ class GeminiClient(Client):
         # disable thinking because it is taking so long, disables the 'thinking' step for models that support it
         thinking_config = genai.types.ThinkingConfig(thinking_budget=0)
 
-        try:
+        request = {
+            "service": "gemini",
+            "model": self.model,
+            "contents": prompt,
+            "temperature": self.temperature,
+            "max_output_tokens": self.token_limit(),
+            "top_p": self.top_p,
+            "thinking_budget": 0,
+            "stream": self.stream,
+        }
+
+        config = genai.types.GenerateContentConfig(
+            temperature=self.temperature,
+            max_output_tokens=self.token_limit(),
+            top_p=self.top_p,
+            thinking_config=thinking_config 
+        )
+
+        def send():
+            if self.stream:
+                return self._consume_stream(self._stream_events(prompt, config), self.output_char_limit(prompt_file))
+
             response = self.client.models.generate_content(
                 model=self.model,
                 contents=prompt,
-                config = genai.types.GenerateContentConfig(
-                    temperature=self.temperature,
-                    max_output_tokens=self.max_tokens,
-                    top_p=self.top_p,
-                    thinking_config=thinking_config 
-                )
+                config=config
             )
-            return response.text
+            usage = response.usage_metadata
+            return self._completion(response.text, usage.candidates_token_count if usage else None,
+                                    self._finish_reason(response))
+
+        try:
+            return self._request(request, send)["text"]
              
         except genai_errors.ClientError as e:
             if getattr(e, "status_code", None) == 429:
@@ -72,3 +94,13 @@ class GeminiClient(Client):
                 time.sleep(float(m.group(1)) + 0.25)
             raise
 
+    def _stream_events(self, prompt, config):
+        for chunk in self.client.models.generate_content_stream(model=self.model, contents=prompt, config=config):
+            usage = getattr(chunk, "usage_metadata", None)
+            yield (chunk.text, getattr(usage, "candidates_token_count", None) if usage else None,
+                   self._finish_reason(chunk))
+
+    def _finish_reason(self, response):
+        # an enum such as FinishReason.MAX_TOKENS; keep its name so the payload stays JSON
+        reason = response.candidates[0].finish_reason if response.candidates else None
+        return getattr(reason, "name", reason)
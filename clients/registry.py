@@ -0,0 +1,123 @@
+"""
+Declarative registry of the services `collect_responses.py` can query.
+
+Each ServiceSpec declares everything the rest of the pipeline needs to know about a
+provider: how to build its client and ask it for one response, the shape of its data
+in output_file.json, and its performance characteristics (rate limits, how many cells
+one client instance should handle, how many requests may be in flight, which languages
+it supports). The scheduler in source/scheduler.py turns those declarations into an
+execution strategy, the --skip_<name> flags are generated from the registry, and the
+output schema helpers read `schema` from here.
+
+Adding a provider means adding one entry to SERVICES. Client modules are imported
+inside the factories, so importing the registry does not import any provider SDK.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Callable, FrozenSet, Optional, Union
+
+from clients.exceptions import QuotaExhaustedError
+from clients.translation_map import TRANSLATION_MAP
+
+# output_file.json shapes
+PROMPTED = "prompted"   # service / language / disaster / prompt file / [responses]
+DIRECT = "direct"       # service / language / disaster / [responses]
+
+
+@dataclass(frozen=True)
+class ServiceSpec:
+    name: str
+    schema: str
+    client_factory: Callable                # (logger, stream) -> Client
+    request: Callable                       # (client, language, disaster, prompt_file_path, logger) -> str or None
+    rpm: Optional[int] = None               # requests per minute the provider allows, None if unknown/unlimited
+    rpd: Optional[int] = None               # requests per day
+    batch_size: int = 1                     # cells handled by one client instance before a new one is built
+    max_concurrency: int = 1                # requests that may be in flight at once
+    supports_streaming: bool = False        # --stream is passed to the client factory
+    # language names (TRANSLATION_MAP keys) the service can handle; None for all of them, or a
+    # function (client) -> names for services that report it at runtime
+    supported_languages: Union[None, FrozenSet[str], Callable] = None
+    default_latency: float = 5.0            # seconds per request, used when there is no history
+
+    @property
+    def direct(self):
+        return self.schema == DIRECT
+
+    @property
+    def skip_flag(self):
+        return f"skip_{self.name}"
+
+
+def _gemini_client(logger, stream=False):
+    from clients.gemini import GeminiClient
+    return GeminiClient(key=os.getenv("GEMINI_API_KEY"), logger=logger, stream=stream)
+
+
+def _gemini_request(client, language, disaster, prompt_file_path, logger):
+    try:
+        return client.safe_chat(prompt_file=prompt_file_path, language=language, disaster=disaster)
+    except QuotaExhaustedError as e:        # to deal with quota limits
+        logger.error(f"Gemini quota exhausted; skipping Gemini for remainder of run. {e}")
+        return None
+
+
+def _chatgpt_client(logger, stream=False):
+    from clients.chatgpt import ChatGPTClient
+    return ChatGPTClient(key=os.getenv("OPENAI_API_KEY"), logger=logger, stream=stream)
+
+
+def _deepseek_client(logger, stream=False):
+    from clients.deepseek import DeepSeekClient
+    return DeepSeekClient(key=os.getenv("OPENROUTER_API_KEY"), logger=logger, stream=stream)
+
+
+def _google_translate_client(logger, stream=False):
+    from clients.cloud_translation import GoogleCloudTranslationClient
+    return GoogleCloudTranslationClient(logger=logger)
+
+
+def _deepL_client(logger, stream=False):
+    from clients.deepl import DeepLClient
+    return DeepLClient(key=os.getenv("DEEPL_API_KEY"), logger=logger)
+
+
+def _safe_chat_request(client, language, disaster, prompt_file_path, logger):
+    return client.safe_chat(prompt_file=prompt_file_path, language=language, disaster=disaster)
+
+
+def _deepL_request(client, language, disaster, prompt_file_path, logger):
+    # DeepL expects the actual text content rather than a prompt
+    with open(prompt_file_path, "r", encoding="utf-8") as file:
+        prompt_file_content = file.read()
+    return client.translate(text=prompt_file_content, target_language=language)
+
+
+def _deepL_languages(client):
+    return {language for language, code in TRANSLATION_MAP.items()
+            if code.upper() in client.supported_target_languages_ids}
+
+
+SERVICES = {spec.name: spec for spec in [
+    # Free tier: 5/min or 20/day
+    ServiceSpec("gemini", PROMPTED, _gemini_client, _gemini_request,
+                rpm=5, rpd=20, batch_size=25, max_concurrency=1,
+                supports_streaming=True, default_latency=4.0),
+    ServiceSpec("chatgpt", PROMPTED, _chatgpt_client, _safe_chat_request,
+                batch_size=25, max_concurrency=4,
+                supports_streaming=True, default_latency=4.0),
+    # OpenRouter: 20 requests per minute, 50 per day on the free models
+    ServiceSpec("deepseek", PROMPTED, _deepseek_client, _safe_chat_request,
+                rpm=20, rpd=50, batch_size=25, max_concurrency=2,
+                supports_streaming=True, default_latency=8.0),
+    ServiceSpec("google_translate", DIRECT, _google_translate_client, _safe_chat_request,
+                batch_size=25, max_concurrency=4, default_latency=0.5),
+    # the DeepL client looks up its target languages when it is built, so reuse it across cells
+    ServiceSpec("deepL", DIRECT, _deepL_client, _deepL_request,
+                batch_size=50, max_concurrency=2, supported_languages=_deepL_languages,
+                default_latency=0.8),
+]}
+
+DIRECT_SERVICES = {name for name, spec in SERVICES.items() if spec.direct}
+PROMPTED_SERVICES = {name for name, spec in SERVICES.items() if not spec.direct}
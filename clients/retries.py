@@ -0,0 +1,33 @@
+"""
+Tracks which requests are waiting to be retried, for the progress console.
+
+The tenacity decorators on the clients call `note_retry` before each backoff sleep. Requests
+are identified by the name of the thread making them (the scheduler names its workers
+`<service>-<n>`), and the scheduler calls `finished` once a request returns, retried or not.
+"""
+
+import threading
+from collections import Counter
+
+_lock = threading.Lock()
+_retrying = set()       # threads whose request is currently backing off or being retried
+_retries = Counter()    # thread name -> retries so far
+
+
+def note_retry(retry_state):
+    name = threading.current_thread().name
+    with _lock:
+        _retrying.add(name)
+        _retries[name] += 1
+
+
+def finished():
+    with _lock:
+        _retrying.discard(threading.current_thread().name)
+
+
+def retry_counts(thread_names):
+    """Returns (requests retrying now, total retries) for the given threads."""
+    with _lock:
+        return (sum(name in _retrying for name in thread_names),
+                sum(_retries[name] for name in thread_names))
@@ -1,375 +1,444 @@
-"""
-collect_responses.py
-
-This script iterates over API endpoints to Google Translate, Deepseek, ChatGPT, and Gemini in order to
-request generation of multilingual emergency alerts.
-
-Example:
-    python collect_responses.py --preserve_output --skip_chatgpt --skip_deepseek --skip_gemini --skip_google_translate --skip_deepL
-
-Functions:
-    - parse_args: Parses arguments passed into the script
-    - loop_responses: For a given language - disaster - prompt pairing, query all the APIs
-    - collect_multilingual_responses: loop over every language, disaster, and prompt to call loop_responses
-    - main: Does the thing. Outputs data to a JSON file
-
-Flags:
-    --preserve_output: If a matching output file exists, read in the existing data and append to it.
-    --skip_gemini: Forcibly skip any calls to Gemini
-    --skip_chatgpt: Forcibly skip any calls to ChatGPT
-    --skip_deepseek: Forcibly skip any calls to DeepSeek
-    --skip_google_translate: Forcibly skip any calls to Google Translate
-    --skip_deepL: Forcibly skip any calls to DeepL Translator
-"""
-
-import json
-import logging
-import argparse
-import os
-from datetime import date
-
-from dotenv import load_dotenv
-from source.helpers import chat_with_service
-from clients.translation_map import TRANSLATION_MAP
-import time
-
-try:
-    import arabic_reshaper
-    from bidi.algorithm import get_display
-except ImportError:
-    arabic_reshaper = None
-    get_display = None
-    logging.warning("arabic_reshaper or bidi.algorithm not installed. Arabic text may not display correctly.")
-
-# set custom logging levels for noisy libraries
-logging.getLogger("deepl").setLevel(logging.WARNING)
-logging.getLogger("httpx").setLevel(logging.WARNING)
-logging.getLogger("google_genai").setLevel(logging.WARNING)
-
-
-# prompts for multilingual responses to test prompt engineering. They are run for every service - language - disaster
-# dynamically find all prompt files that start with "prompt"
-PROMPT_DIR = "prompts"
-ITERATIVE_PROMPT_FILES = [
-    os.path.join(PROMPT_DIR, filename) 
-    for filename in os.listdir(PROMPT_DIR) 
-    if filename.startswith("prompt") and os.path.isfile(os.path.join(PROMPT_DIR, filename))
-]
-
-# list of right-to-left languages that need additional processing
-RTL_LANGUAGES = {
-    "arabic", "aramaic", "azeri", "divehi", "fula", "hebrew", "kurdish", "nko",
-    "persian", "rohingya", "syriac", "urdu"
-}
-
-# Extract languages from the TRANSLATION_MAP keys
-LANGUAGES = [lang for lang in TRANSLATION_MAP.keys() if lang != "English"]
-
-STANDARD_DISASTERS = [
-  "a flood",
-  "extreme wind",
-  "a fire",
-  "a boil water notice",
-  "a 911 outage",
-]
-
-
-
-# Configure logging
-logger = logging.getLogger(__name__)
-
-logging.basicConfig(
-    level=logging.INFO,
-    filename="logs/output.log",
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    filemode='w'        # the file gets so long, it will reset each time
-)
-
-def parse_args():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--output_file", type=str, default="./output_file.json",
-                      help="Filename for where JSON output of responses will be stored")
-    parser.add_argument("--total_responses", type=int, default=5,
-                        help="The number of responses to collect per service")
-    
-    # parser.add_argument("--preserve_output", action='store_true',
-    #                     help="If a matching output file exists, read in the existing data and append to it. Useful when combatting rate limits")
-    
-    parser.add_argument("--skip_gemini", action="store_true", default=False,
-                        help="Forcibly skip any calls to Gemini")
-    parser.add_argument("--skip_chatgpt", action='store_true',
-                        help="Forcibly skip any calls to ChatGPT")
-    parser.add_argument("--skip_deepseek", action='store_true', default=False,
-                    help="Forcibly skip any calls to DeepSeek")
-    parser.add_argument("--skip_google_translate", action='store_true', default=False,
-                    help="Forcibly skip any calls to Google Translate")
-    parser.add_argument("--skip_deepL", action='store_true', default=False,
-                help="Forcibly skip any calls to DeepL Translator")
-  
-    return parser.parse_args()
-
-def save_output_json(output_json, output_file, logger):
-    
-    """Saves the output JSON data to a specified file.
-
-    This function writes the current state of the output JSON to disk and logs the result. If saving fails, an error is logged.
-
-    Args:
-        output_json (dict): The output data to be saved.
-        output_file (str): The filename where the JSON will be stored.
-        logger (logging.Logger): Logger for logging progress and errors.
-
-    Returns:
-        None
-    """
-    try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(output_json, f, ensure_ascii=False, indent=4, default=str)
-            #logger.info(f"Progress saved to {output_file}")
-    except Exception as e:
-        logger.error(f"Failed to save progress: {e}")
-
-def loop_responses(skip_bool, service_name, language, disaster, prompt_file_path, logger, output_json, output_filename, total_responses):
-    """Queries a language model or translation service for a multilingual emergency alert response.
-
-    This function checks if a response for the current month already exists, and if not,
-    requests a new response from the specified service.
-    The response is then appended to the output JSON with the current date.
-
-    Args:
-        skip_bool (bool): Whether to skip querying the service.
-        service_name (str): The name of the service to query.
-        language (str): The target language for the alert.
-        disaster (str): The disaster scenario for the alert.
-        prompt_file_path (str): The prompt file to use for generation.
-        logger (logging.Logger): Logger for logging progress and errors.
-        output_json (dict): The output data structure to store responses.
-        total_responses (int): The number of responses to collect per service.
-
-    Returns:
-        bool: The updated skip status for the service.
-    """
-    if skip_bool:
-        return skip_bool
-    
-    language_name = language.replace(" ", "_").replace("(", "").replace(")", "").lower()
-    disaster_name = disaster.replace("a ", "").replace(" ", "_")
-    prompt_name = prompt_file_path.replace("prompts/", "")
-
-    # update json schema if needed
-    prepare_response_schema(service_name, logger, output_json, language_name, disaster_name)
-
-    if service_name in ["google_translate", "deepL"]:
-        existing_response_list = output_json[service_name][language_name][disaster_name]
-    else:
-        if prompt_name not in output_json[service_name][language_name][disaster_name]:
-            output_json[service_name][language_name][disaster_name][prompt_name] = []
-        existing_response_list = output_json[service_name][language_name][disaster_name][prompt_name]
-
-    # save all that work
-    save_output_json(output_json, output_filename, logger)
-
-    # Check if we already have a response for this week
-    timely_response_exists = check_for_weeks_response(existing_response_list)
-    
-    """
-    Only get a new response if:
-    1) We don't have one for this week yet
-    2) the service should be run (not forcibly skipped by commandline argument)
-    """
-    if not timely_response_exists:
-        #logger.info(f"Running {service_name}: {language_name}: {disaster_name}: {prompt_name}")
-
-        #try:
-        output = chat_with_service(service_name, language=language, disaster=disaster, prompt_file_path=prompt_file_path, logger=logger)
-
-        # TODO You must also ensure that chat_with_service is updated to return None (not an empty string) on failure, and only return an empty string if that is a valid response. If chat_with_service is in another file, update its error handling accordingly.
-        if not output:      # the deepL client returns an empty string if it fails, need to exclude it
-            logger.warning(f"{service_name} returned None for {language_name}:{disaster_name}:{prompt_name}")
-            return True  # Skip this service going forward
-        
-        if language_name in RTL_LANGUAGES and arabic_reshaper and get_display:
-            # make sure Arabic output is not broken and is left to right
-            output = get_display(arabic_reshaper.reshape(output), base_dir = "R")
-            
-        # Store response with today's date
-        response_with_date = {
-            "text": output,
-            "date": date.today().isoformat()
-        }
-        existing_response_list.append(response_with_date)
-        logger.info(f"Response added to {service_name} : {language_name} : {disaster_name} : {prompt_name}")
-        return False  # Return false if a new response was added
-        
-    else:
-        logger.info(f"Skipping {service_name} : {language_name} : {disaster_name} : {prompt_name}  - already have response for this week")
-    
-    return False 
-
-def check_for_weeks_response(existing_response_list):
-    today = date.today()
-    timely_response_exists = False
-    
-    # check if there is already a response for this week (same year and same ISO week number)
-    for response in existing_response_list:
-        if isinstance(response, dict):
-            response_date = response.get('date', '')
-        else:
-            response_date = ''
-        if response_date:
-            response_date_obj = date.fromisoformat(response_date)
-            if (response_date_obj.year == today.year and 
-                response_date_obj.isocalendar()[1] == today.isocalendar()[1]):
-                timely_response_exists = True
-                break
-    return timely_response_exists
-
-def prepare_response_schema(service_name, logger, output_json, language_name, disaster_name):
-    if service_name not in output_json:
-        output_json[service_name] = {}
-        logger.info(f"Adding {service_name} to output JSON")
-
-    if language_name not in output_json[service_name]:
-        output_json[service_name][language_name] = {}
-        logger.info(f"Adding {service_name} - {language_name} in output JSON")
-
-    if disaster_name not in output_json[service_name][language_name]:
-        if service_name in ["google_translate", "deepL"]:
-            output_json[service_name][language_name][disaster_name] = []
-            logger.info(f"Adding {service_name} - {language_name} - {disaster_name} in output JSON")
-        else:
-            output_json[service_name][language_name][disaster_name] = {}
-            logger.info(f"Adding {service_name} - {language_name} - {disaster_name} in output JSON with prompts")# return true (skipped) if a response already exists
-
-
-#TODO: skip the service if it cannot connect
-def collect_multilingual_responses(logger, output_json, skip_gemini, skip_chatgpt, skip_deepseek, skip_google_translate, skip_deepL, total_responses, output_filename):
-    services_iterative = [
-        ("gemini", skip_gemini),
-        ("chatgpt", skip_chatgpt),
-        ("deepseek", skip_deepseek)]
-    services_direct = [
-        ("google_translate", skip_google_translate),
-        ("deepL", skip_deepL)]
-
-
- 
-    for language in LANGUAGES:
-
-        # Track 429 errors for each service/language pair
-        error_counts = {service: 0 for service, _ in services_iterative + services_direct}
-        disabled_services = set()
-
-        for disaster in STANDARD_DISASTERS:
-            # Iterative services (loop through multiple prompts)
-            for prompt in ITERATIVE_PROMPT_FILES:
-                for service_name, skip_flag in services_iterative:
-                    if skip_flag or service_name in disabled_services:
-                        continue  # Skip this service if it's marked to be skipped or disabled due to errors
-                    new_skip = loop_responses(
-                        skip_flag, service_name, language, disaster, prompt,
-                        logger, output_json, output_filename, total_responses
-                    )
-                    if new_skip:
-                        error_counts[service_name] += 1
-                        if error_counts[service_name] >= 3:  # Disable after 3 consecutive errors
-                            logger.error(f"Disabling {service_name} for {language} due to repeated 429 errors.")
-                            disabled_services.add(service_name)
-                    else:  # successful API call
-                        error_counts[service_name] = 0
-                        save_output_json(output_json, output_filename, logger)
-
-            # Direct translation services (one prompt per disaster)
-            disaster_name = disaster.replace("a ", "").replace(" ", "_")
-            prompt = f"prompts/{disaster_name}.txt"
-            for service_name, skip_flag in services_direct:
-                if skip_flag or service_name in disabled_services:
-                    continue  # Skip this service if it's marked to be skipped or disabled due to errors
-                new_skip = loop_responses(
-                    skip_flag, service_name, language, disaster, prompt,
-                    logger, output_json, output_filename, total_responses
-                )
-                if new_skip:
-                    error_counts[service_name] += 1
-                    if error_counts[service_name] >= 3:  # Disable after 3 consecutive errors
-                        logger.error(f"Disabling {service_name} for {language} due to repeated 429 errors.")
-                        disabled_services.add(service_name)
-                else:
-                    save_output_json(output_json, output_filename, logger)
-
-            # Direct translations also need a short description and the original template
-            prompt = f"prompts/translate_{disaster_name}.txt"
-            for service_name, skip_flag in [("gemini", skip_gemini), ("chatgpt", skip_chatgpt), ("deepseek", skip_deepseek)]:
-                if skip_flag or service_name in disabled_services:
-                    continue  # Skip this service if it's marked to be skipped or disabled due to errors
-                new_skip = loop_responses(
-                    skip_flag, service_name, language, disaster, prompt,
-                    logger, output_json, output_filename, total_responses
-                )
-                if new_skip:
-                    error_counts[service_name] += 1
-                    if error_counts[service_name] >= 3:  # Disable after 3 consecutive errors
-                        logger.error(f"Disabling {service_name} for {language} due to repeated 429 errors.")
-                        disabled_services.add(service_name)
-                else:  # successful API call
-                    error_counts[service_name] = 0
-                    save_output_json(output_json, output_filename, logger)
-
-def print_errors():
-    # at the end of processing, write out all CRITICAL,  ERROR, and WARNING messages from logs/output.log to the file logs/errors.log for easier debugging
-    with open("logs/output.log", "r") as infile, open("logs/errors.log", "w") as outfile:
-        for line in infile:
-            if "CRITICAL" in line or "ERROR" in line or "WARNING" in line:
-                outfile.write(line)
-
-
-def main():
-    start_time = time.time()
-
-    load_dotenv()
-    args = parse_args()
-
-    output_json = {}  # Initialize with empty dict as default
-
-    try:
-        with open(args.output_file, "r", encoding="utf-8") as file:
-            output_json = json.load(file)
-        logger.info(f"Preserved existing output from {args.output_file}")
-    except FileNotFoundError:
-        logger.warning(f"Output file {args.output_file} not found. Creating new output file.")
-    # except json.JSONDecodeError:
-    #     logger.warning(f"Output file {args.output_file} contains invalid JSON. Creating new output file.")
-    except json.JSONDecodeError as e:
-        logger.error(f"Output file {args.output_file} is invalid JSON: {e}. Aborting to avoid data loss.")
-        raise SystemExit(1)
-
-    skip_gemini = args.skip_gemini
-    skip_chatgpt = args.skip_chatgpt
-    skip_deepseek = args.skip_deepseek
-    skip_google_translate = args.skip_google_translate
-    skip_deepL = args.skip_deepL
-    total_responses = args.total_responses
-
-    logger.info("**************************************************")
-    logger.info("**************************************************")
-    logger.info(f"Languages from translation map: {LANGUAGES}")
-
-    collect_multilingual_responses(logger, output_json, skip_gemini, skip_chatgpt, skip_deepseek, 
-                                 skip_google_translate, skip_deepL, total_responses, args.output_file)
-
-    # just in case there is anything left
-    save_output_json(output_json, args.output_file, logger)
-
-    elapsed_time = time.time() - start_time
-    hours, remainder = divmod(elapsed_time, 3600)
-    minutes, seconds = divmod(remainder, 60)
-
-    logger.info(f"Total execution time: {int(hours):02}:{int(minutes):02}:{int(seconds):02}")
-    print(f"Total execution time: {int(hours):02}:{int(minutes):02}:{int(seconds):02}")
-
-    print_errors()
-
-    #TODO: skip DeepL if the language is not supported
-
-if __name__ == "__main__":
+"""
+collect_responses.py
+
+This script iterates over API endpoints to Google Translate, Deepseek, ChatGPT, and Gemini in order to
+request generation of multilingual emergency alerts.
+
+Example:
+    python collect_responses.py --preserve_output --skip_chatgpt --skip_deepseek --skip_gemini --skip_google_translate --skip_deepL
+
+Functions:
+    - parse_args: Parses arguments passed into the script
+    - loop_responses: For a given language - disaster - prompt - service cell, query the API
+    - pending_cells: Drop the cells that already have a response for this week
+    - collect_multilingual_responses: run every service's pending cells through the scheduler, side by side
+    - main: Does the thing. Outputs data to a JSON file
+
+Flags:
+    --preserve_output: If a matching output file exists, read in the existing data and append to it.
+    --skip_gemini: Forcibly skip any calls to Gemini
+    --skip_chatgpt: Forcibly skip any calls to ChatGPT
+    --skip_deepseek: Forcibly skip any calls to DeepSeek
+    --skip_google_translate: Forcibly skip any calls to Google Translate
+    --skip_deepL: Forcibly skip any calls to DeepL Translator
+        (one --skip_<name> flag is generated for every service in clients/registry.py)
+    --save_every: Number of new responses that triggers a background save of the output file
+    --flush_interval: Maximum number of seconds between background saves
+    --log_json: Write logs as JSON lines instead of plain text
+    --cassette: Record provider requests/responses to, or replay them from, this cassette file
+    --cassette_mode: "record" or "replay"
+    --replay_latency_scale: Multiplier for recorded latencies during replay (0 replays instantly)
+    --grace_period: Seconds to let the in-flight request finish after SIGTERM before checkpointing
+    --dry_run: Predict requests, run time and quota use per service without calling any API
+    --stream: Stream LLM completions, recording time to first token and stopping runaway outputs
+    --no_adaptive_tokens: Use the clients' fixed max_tokens instead of per-language limits learned from usage
+    --no_progress: Turn off the live progress table (or the periodic one-line summaries when not on a terminal)
+    --progress_interval: Seconds between one-line progress summaries when stdout is not a terminal
+"""
+
+import json
+import logging
+import argparse
+import os
+from datetime import date
+
+from dotenv import load_dotenv
+from source.helpers import chat_with_service
+from source.logging_setup import configure_logging, stop_logging
+from source.planner import plan_run, format_plan
+from source.scheduler import ServiceRunner, run_services
+from source.token_limits import TokenLimits
+from source.progress import ProgressConsole
+from collector import Collector
+from clients.registry import SERVICES, DIRECT_SERVICES, PROMPTED_SERVICES
+from clients import cassette
+from clients.translation_map import TRANSLATION_MAP
+import time
+
+try:
+    import arabic_reshaper
+    from bidi.algorithm import get_display
+except ImportError:
+    arabic_reshaper = None
+    get_display = None
+    logging.warning("arabic_reshaper or bidi.algorithm not installed. Arabic text may not display correctly.")
+
+# set custom logging levels for noisy libraries
+logging.getLogger("deepl").setLevel(logging.WARNING)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("google_genai").setLevel(logging.WARNING)
+
+
+# prompts for multilingual responses to test prompt engineering. They are run for every service - language - disaster
+# dynamically find all prompt files that start with "prompt"
+PROMPT_DIR = "prompts"
+ITERATIVE_PROMPT_FILES = [
+    os.path.join(PROMPT_DIR, filename) 
+    for filename in os.listdir(PROMPT_DIR) 
+    if filename.startswith("prompt") and os.path.isfile(os.path.join(PROMPT_DIR, filename))
+]
+
+# list of right-to-left languages that need additional processing
+RTL_LANGUAGES = {
+    "arabic", "aramaic", "azeri", "divehi", "fula", "hebrew", "kurdish", "nko",
+    "persian", "rohingya", "syriac", "urdu"
+}
+
+# Extract languages from the TRANSLATION_MAP keys
+LANGUAGES = [lang for lang in TRANSLATION_MAP.keys() if lang != "English"]
+
+STANDARD_DISASTERS = [
+  "a flood",
+  "extreme wind",
+  "a fire",
+  "a boil water notice",
+  "a 911 outage",
+]
+
+
+
+# Logging is configured in main(): records go through a queue to logs/output.log and,
+# for WARNING and above, logs/errors.log. See source/logging_setup.py
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output_file", type=str, default="./output_file.json",
+                      help="Filename for where JSON output of responses will be stored")
+    parser.add_argument("--total_responses", type=int, default=5,
+                        help="The number of responses to collect per service")
+    
+    # parser.add_argument("--preserve_output", action='store_true',
+    #                     help="If a matching output file exists, read in the existing data and append to it. Useful when combatting rate limits")
+    
+    # one --skip_<name> flag per registered service
+    for name in SERVICES:
+        parser.add_argument(f"--skip_{name}", action='store_true', default=False,
+                            help=f"Forcibly skip any calls to {name}")
+    parser.add_argument("--save_every", type=int, default=5,
+                        help="Number of new responses that triggers a background save of the output file")
+    parser.add_argument("--flush_interval", type=float, default=60.0,
+                        help="Maximum number of seconds between background saves of the output file")
+    parser.add_argument("--log_json", action='store_true', default=False,
+                        help="Write logs/output.log and logs/errors.log as JSON lines")
+    parser.add_argument("--cassette", type=str, default=None,
+                        help="Cassette file to record provider responses to, or replay them from")
+    parser.add_argument("--cassette_mode", choices=cassette.MODES, default="replay",
+                        help="Record live responses into the cassette, or replay them without network access")
+    parser.add_argument("--replay_latency_scale", type=float, default=1.0,
+                        help="Multiplier for the recorded latency when replaying (0 replays instantly)")
+    parser.add_argument("--grace_period", type=float, default=60.0,
+                        help="Seconds to let the in-flight request finish after SIGTERM/SIGINT before stopping")
+    parser.add_argument("--dry_run", "--dry-run", action='store_true', default=False,
+                        help="Print the predicted requests, run time and quota use per service, then exit without calling any API")
+    parser.add_argument("--stream", action='store_true', default=False,
+                        help="Stream LLM completions to record time to first token and tokens/sec, and stop outputs that run far past the prompt's character limit")
+    parser.add_argument("--no_adaptive_tokens", dest="adaptive_tokens", action='store_false', default=True,
+                        help="Send every LLM request with the client's fixed max_tokens instead of a limit learned per language and prompt")
+    parser.add_argument("--no_progress", action='store_true', default=False,
+                        help="Do not show live progress on stdout")
+    parser.add_argument("--progress_interval", type=float, default=300.0,
+                        help="Seconds between one-line progress summaries when stdout is not a terminal (e.g. under Condor)")
+    parser.add_argument("--window_hours", type=float, default=24.0,
+                        help="Length of the Condor window the dry run checks the predicted run time against")
+  
+    return parser.parse_args()
+
+def loop_responses(skip_bool, service_name, language, disaster, prompt_file_path, logger, collector, total_responses, stream=False, client=None,
+                   token_limits=None):
+    """Queries a language model or translation service for a multilingual emergency alert response.
+
+    This function checks if a response for the current month already exists, and if not,
+    requests a new response from the specified service.
+    The response is then handed to the collector, which stores it with the current date.
+
+    Args:
+        skip_bool (bool): Whether to skip querying the service.
+        service_name (str): The name of the service to query.
+        language (str): The target language for the alert.
+        disaster (str): The disaster scenario for the alert.
+        prompt_file_path (str): The prompt file to use for generation.
+        logger (logging.Logger): Logger for logging progress and errors.
+        collector (Collector): Stores responses and persists them in the background.
+        total_responses (int): The number of responses to collect per service.
+        stream (bool): Whether LLM services should stream their completions.
+        client (Client): Client to reuse, built by the scheduler for a batch of cells.
+        token_limits (TokenLimits): Picks the output token limit for LLM services from observed usage.
+
+    Returns:
+        bool: The updated skip status for the service.
+    """
+    if skip_bool:
+        return skip_bool
+    
+    language_name, disaster_name, prompt_name = cell_names(language, disaster, prompt_file_path)
+
+    # the collector creates the schema for this cell if needed
+    existing_response_list = collector.get_responses(service_name, language_name, disaster_name, prompt_name)
+
+    # Check if we already have a response for this week
+    timely_response_exists = check_for_weeks_response(existing_response_list)
+    
+    """
+    Only get a new response if:
+    1) We don't have one for this week yet
+    2) the service should be run (not forcibly skipped by commandline argument)
+    """
+    if not timely_response_exists:
+        #logger.info(f"Running {service_name}: {language_name}: {disaster_name}: {prompt_name}")
+
+        #try:
+        max_tokens = None
+        if token_limits and service_name in PROMPTED_SERVICES:
+            max_tokens = token_limits.limit(service_name, language_name, prompt_name,
+                                            default=getattr(client, "max_tokens", None))
+
+        request_start = time.perf_counter()
+        metadata = {}
+        output = chat_with_service(service_name, language=language, disaster=disaster, prompt_file_path=prompt_file_path,
+                                   logger=logger, metadata=metadata, stream=stream, client=client,
+                                   max_tokens=max_tokens)
+        latency = time.perf_counter() - request_start
+
+        # TODO You must also ensure that chat_with_service is updated to return None (not an empty string) on failure, and only return an empty string if that is a valid response. If chat_with_service is in another file, update its error handling accordingly.
+        if not output:      # the deepL client returns an empty string if it fails, need to exclude it
+            logger.warning("%s returned None for %s:%s:%s", service_name, language_name, disaster_name, prompt_name)
+            return True  # Skip this service going forward
+        
+        if language_name in RTL_LANGUAGES and arabic_reshaper and get_display:
+            # make sure Arabic output is not broken and is left to right
+            output = get_display(arabic_reshaper.reshape(output), base_dir = "R")
+            
+        # Store response with today's date
+        if metadata.get("aborted"):
+            logger.warning("%s output for %s:%s:%s ran far past the prompt's length limit and was cut off",
+                           service_name, language_name, disaster_name, prompt_name)
+        elif metadata.get("truncated"):
+            logger.warning("%s output for %s:%s:%s stopped at the %s token limit (%s)", service_name, language_name,
+                           disaster_name, prompt_name, max_tokens or "default", metadata.get("finish_reason"))
+        if token_limits:
+            token_limits.observe(service_name, language_name, prompt_name, metadata)
+        collector.add_response(service_name, language_name, disaster_name, prompt_name, output,
+                               latency=round(latency, 3), **metadata)
+        logger.info("Response added to %s : %s : %s : %s", service_name, language_name, disaster_name, prompt_name)
+        return False  # Return false if a new response was added
+        
+    else:
+        logger.info("Skipping %s : %s : %s : %s  - already have response for this week",
+                    service_name, language_name, disaster_name, prompt_name)
+    
+    return False 
+
+def cell_names(language, disaster, prompt_file_path):
+    """Returns the (language, disaster, prompt) keys a cell is stored under in the output JSON."""
+    language_name = language.replace(" ", "_").replace("(", "").replace(")", "").lower()
+    disaster_name = disaster.replace("a ", "").replace(" ", "_")
+    prompt_name = prompt_file_path.replace("prompts/", "")
+    return language_name, disaster_name, prompt_name
+
+def check_for_weeks_response(existing_response_list):
+    today = date.today()
+    timely_response_exists = False
+    
+    # check if there is already a response for this week (same year and same ISO week number)
+    for response in existing_response_list:
+        if isinstance(response, dict):
+            response_date = response.get('date', '')
+        else:
+            response_date = ''
+        if response_date:
+            response_date_obj = date.fromisoformat(response_date)
+            if (response_date_obj.year == today.year and 
+                response_date_obj.isocalendar()[1] == today.isocalendar()[1]):
+                timely_response_exists = True
+                break
+    return timely_response_exists
+
+def plan_cells(services_iterative, services_direct):
+    """Yields every (language, disaster, prompt_file_path, service_name) cell in collection order.
+
+    services_iterative are the registry's prompted services, services_direct its direct ones.
+
+    For each language and disaster, the iterative services run through every prompt file,
+    then the direct translation services get the disaster template, then the iterative
+    services get the translation prompt (a short description plus the original template).
+    """
+    for language in LANGUAGES:
+        for disaster in STANDARD_DISASTERS:
+            # Iterative services (loop through multiple prompts)
+            for prompt in ITERATIVE_PROMPT_FILES:
+                for service_name in services_iterative:
+                    yield (language, disaster, prompt, service_name)
+
+            # Direct translation services (one prompt per disaster)
+            disaster_name = disaster.replace("a ", "").replace(" ", "_")
+            for service_name in services_direct:
+                yield (language, disaster, f"prompts/{disaster_name}.txt", service_name)
+
+            # Direct translations also need a short description and the original template
+            for service_name in services_iterative:
+                yield (language, disaster, f"prompts/translate_{disaster_name}.txt", service_name)
+
+def dry_run(output_json, args):
+    """Prints the predicted work of a run over every service, honoring the skip flags."""
+    skipped = {name for name, spec in SERVICES.items() if getattr(args, spec.skip_flag)}
+
+    cells = []
+    for language, disaster, prompt, service_name in plan_cells(
+            [name for name in SERVICES if name in PROMPTED_SERVICES],
+            [name for name in SERVICES if name in DIRECT_SERVICES]):
+        language_name, disaster_name, prompt_name = cell_names(language, disaster, prompt)
+        node = output_json.get(service_name, {}).get(language_name, {}).get(disaster_name, [])
+        existing = node if isinstance(node, list) else node.get(prompt_name, [])
+        cells.append((service_name, language_name, disaster_name, prompt_name, existing))
+
+    plan = plan_run(cells, output_json, skipped_services=skipped, cassette_path=args.cassette)
+    report = format_plan(plan, window_hours=args.window_hours)
+    logger.info(f"Dry run plan:\n{report}")
+    print(report)
+    return plan
+
+def pending_cells(cells, collector):
+    """Drops the cells that already have this week's response, logging each one like the loop used to."""
+    pending = []
+    for cell in cells:
+        language, disaster, prompt, service_name = cell
+        language_name, disaster_name, prompt_name = cell_names(language, disaster, prompt)
+        # the collector creates the schema for this cell if needed
+        if check_for_weeks_response(collector.get_responses(service_name, language_name, disaster_name, prompt_name)):
+            logger.info("Skipping %s : %s : %s : %s  - already have response for this week",
+                        service_name, language_name, disaster_name, prompt_name)
+        else:
+            pending.append(cell)
+    return pending
+
+#TODO: skip the service if it cannot connect
+def collect_multilingual_responses(logger, collector, skipped_services, total_responses, stream=False, token_limits=None,
+                                   progress=None):
+    """
+    Runs every service that is not skipped side by side, each with the execution strategy
+    its registry entry allows (see source/scheduler.py).
+
+    Returns:
+        bool: True if every cell was visited, False if the run was stopped early.
+    """
+    services_iterative = [name for name in SERVICES if name in PROMPTED_SERVICES and name not in skipped_services]
+    services_direct = [name for name in SERVICES if name in DIRECT_SERVICES and name not in skipped_services]
+    cells = list(plan_cells(services_iterative, services_direct))
+
+    # A run of this week that was stopped early left the cell each service was working on.
+    # Each service starts at its own cell and wraps around.
+    resume_points = collector.load_resume_points()
+
+    def request_cell(cell, client):
+        language, disaster, prompt, service_name = cell
+        new_skip = loop_responses(False, service_name, language, disaster, prompt, logger, collector,
+                                  total_responses, stream=stream, client=client, token_limits=token_limits)
+        return not new_skip
+
+    runners = []
+    for service_name in services_iterative + services_direct:
+        service_cells = [cell for cell in cells if cell[3] == service_name]
+        resume_point = resume_points.get(service_name)
+        if resume_point in service_cells:
+            start = service_cells.index(resume_point)
+            service_cells = service_cells[start:] + service_cells[:start]
+            logger.info(f"Resuming {service_name} at {resume_point} ({start} of {len(service_cells)} cells)")
+
+        pending = pending_cells(service_cells, collector)
+        runners.append(ServiceRunner(SERVICES[service_name], pending, request_cell, collector, logger,
+                                     stream=stream, done=len(service_cells) - len(pending)))
+
+    run_services(runners, progress=progress)
+    for runner in runners:
+        logger.info(f"{runner.spec.name}: {runner.completed} requests completed, {runner.failed} failed, "
+                    f"{runner.excluded} cells in unsupported languages")
+
+    if collector.stopping.is_set():
+        logger.warning("Stopped before every cell was visited")
+        return False
+    return True
+
+def main():
+    start_time = time.time()
+
+    load_dotenv()
+    args = parse_args()
+    log_listener = configure_logging(json_lines=args.log_json)
+    try:
+        collect(args, start_time)
+    finally:
+        # drains the queued records, also when collection raised or was stopped by a signal
+        stop_logging(log_listener)
+
+def collect(args, start_time):
+    """Everything main does between setting up and stopping the logging."""
+    output_json = {}  # Initialize with empty dict as default
+
+    try:
+        with open(args.output_file, "r", encoding="utf-8") as file:
+            output_json = json.load(file)
+        logger.info(f"Preserved existing output from {args.output_file}")
+    except FileNotFoundError:
+        logger.warning(f"Output file {args.output_file} not found. Creating new output file.")
+    # except json.JSONDecodeError:
+    #     logger.warning(f"Output file {args.output_file} contains invalid JSON. Creating new output file.")
+    except json.JSONDecodeError as e:
+        logger.error(f"Output file {args.output_file} is invalid JSON: {e}. Aborting to avoid data loss.")
+        raise SystemExit(1)
+
+    skipped_services = {name for name, spec in SERVICES.items() if getattr(args, spec.skip_flag)}
+    total_responses = args.total_responses
+
+    logger.info("**************************************************")
+    logger.info("**************************************************")
+    logger.info(f"Languages from translation map: {LANGUAGES}")
+
+    if args.dry_run:
+        dry_run(output_json, args)
+        return
+
+    if args.cassette:
+        cassette.activate(cassette.Cassette(args.cassette, mode=args.cassette_mode,
+                                            latency_scale=args.replay_latency_scale, logger=logger))
+        logger.info(f"Using cassette {args.cassette} in {args.cassette_mode} mode")
+
+    # output token limits per (service, language, prompt), learned from the usage stored with past responses
+    token_limits = TokenLimits.from_history(output_json) if args.adaptive_tokens else None
+
+    # the collector is the only thing that writes the output file
+    collector = Collector(args.output_file, logger, data=output_json, batch_size=args.save_every,
+                          flush_interval=args.flush_interval, grace_period=args.grace_period)
+    collector.start()
+    collector.install_signal_handlers()
+
+    try:
+        progress = None if args.no_progress else ProgressConsole(interval=args.progress_interval)
+        finished = collect_multilingual_responses(logger, collector, skipped_services, total_responses,
+                                                  stream=args.stream, token_limits=token_limits, progress=progress)
+        if finished:
+            collector.clear_resume_point()
+    finally:
+        # just in case there is anything left
+        collector.close()
+        logger.info(f"Collector metrics: {collector.metrics()}")
+        if cassette.active_cassette():
+            logger.info(f"Cassette stats: {cassette.active_cassette().stats()}")
+            cassette.active_cassette().close()
+            cassette.deactivate()
+
+    elapsed_time = time.time() - start_time
+    hours, remainder = divmod(elapsed_time, 3600)
+    minutes, seconds = divmod(remainder, 60)
+
+    logger.info(f"Total execution time: {int(hours):02}:{int(minutes):02}:{int(seconds):02}")
+    print(f"Total execution time: {int(hours):02}:{int(minutes):02}:{int(seconds):02}")
+
+    if collector.stop_signal:
+        # exit like the signal would have, after the checkpoint is safely on disk
+        raise SystemExit(128 + collector.stop_signal)
+
+    #TODO: skip DeepL if the language is not supported
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,77 +1,278 @@
 import json
-import datetime
 import os
-import logging
+import signal
+import threading
+import time
+from datetime import date, datetime
+
+# services that translate the template directly and therefore have no 'prompt' layer
+from clients.registry import DIRECT_SERVICES
+
 
 class Collector:
     """
-    Collects responses with a specific hierarchy for services
-    other than 'google_translate' and a simplified timestamp.
+    Single write path for collected responses.
+
+    Responses are added to the output_file.json hierarchy under a lock and persisted
+    by a background thread once `batch_size` responses are pending or `flush_interval`
+    seconds have passed. Each flush serializes a snapshot of the data, so callers
+    adding responses never wait on disk I/O. Writes go through a fsynced temp file and
+    `os.replace` so the output file is never left half-written.
+
+    On SIGTERM/SIGINT the collector sets `stopping` instead of interrupting the caller,
+    so the in-flight request can finish. If the caller has not wound down after
+    `grace_period` seconds (or a second signal arrives) the signal is raised as an
+    exception. Either way `close()` flushes and records the cell each service was on
+    in `<output_file>.resume.json` so the next run of the same week starts there.
     """
-    def __init__(self, output_file, logger, batch_size=5):
+    def __init__(self, output_file, logger, data=None, batch_size=5, flush_interval=60.0, grace_period=60.0):
         self.output_file = output_file
         self.logger = logger
         self.batch_size = batch_size
-        self.data = {}
+        self.flush_interval = flush_interval
+        self.data = data if data is not None else {}
         self.responses_added_since_last_save = 0
+        self.grace_period = grace_period
+        self.resume_file = f"{output_file}.resume.json"
+        self.resume_points = {}
+        self.stopping = threading.Event()
+        self.stop_signal = None
 
-    def _save_to_file(self):
-        output_dir = os.path.dirname(self.output_file)
-        if output_dir and not os.path.exists(output_dir):
-            try:
-                os.makedirs(output_dir)
-            except OSError as e:
-                self.logger.error(f"Error creating directory {output_dir}: {e}")
-                return
+        self._lock = threading.Lock()           # guards self.data and the counters
+        self._write_lock = threading.Lock()     # only one flush writes the file at a time
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._previous_handlers = {}
+        self._grace_timer = None
 
-        temp_file = f'{self.output_file}.tmp'
-        try:
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, indent=2, ensure_ascii=False)
-            os.replace(temp_file, self.output_file)
-            self.logger.info(f"Saved {self.responses_added_since_last_save} responses to '{self.output_file}'.")
-            self.responses_added_since_last_save = 0
-        except (IOError, OSError) as e:
-            self.logger.error(f"Error saving data to '{self.output_file}': {e}")
-            
-    def add_response(self, service, language, disaster, prompt, response):
+        # flush metrics
+        self.flush_count = 0
+        self.total_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.last_flush_latency = 0.0
+        self.last_flush_size = 0
+
+    def start(self):
+        """Starts the background flush thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="collector-flush", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            if self.responses_added_since_last_save > 0:
+                self.flush()
+
+    def close(self):
+        """Stops the flush thread, writes anything still pending and records the resume point if stopping early."""
+        if self._grace_timer is not None:
+            self._grace_timer.cancel()
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        self.flush()
+        if self.stopping.is_set():
+            self._write_resume_point()
+
+    def install_signal_handlers(self, signals=(signal.SIGTERM, signal.SIGINT)):
+        """
+        Turns SIGTERM/SIGINT into a graceful stop request (see class docstring).
+        Must be called from the main thread.
+        """
+        for signum in signals:
+            self._previous_handlers[signum] = signal.signal(signum, self._handle_signal)
+
+    def _handle_signal(self, signum, frame):
+        name = signal.Signals(signum).name
+        if self.stopping.is_set():
+            # second signal, or the grace period ran out: stop the in-flight request now
+            self.logger.warning(f"Received {name} while stopping; abandoning the in-flight request.")
+            signal.signal(signum, self._previous_handlers.get(signum, signal.SIG_DFL))
+            if signum == signal.SIGINT:
+                raise KeyboardInterrupt
+            raise SystemExit(128 + signum)
+
+        self.stop_signal = signum
+        self.stopping.set()
+        self.logger.warning(f"Received {name}; no new cells will be started. "
+                            f"Waiting up to {self.grace_period}s for the in-flight request.")
+        self._grace_timer = threading.Timer(self.grace_period, os.kill, args=(os.getpid(), signum))
+        self._grace_timer.daemon = True
+        self._grace_timer.start()
+
+    def set_resume_point(self, cell):
         """
-        Adds a new response to the hierarchical data structure based on the service name.
+        Records the (language, disaster, prompt, service) cell about to be requested; the latest
+        cell of each service becomes its resume point if the run is stopped.
         """
-        # Build the hierarchical data structure
+        with self._lock:
+            self.resume_points[cell[-1]] = list(cell)
+
+    def load_resume_points(self):
+        """Returns {service: cell} for the cells a stopped run of this ISO week was working on."""
+        try:
+            with open(self.resume_file, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            self.logger.warning(f"Ignoring unreadable resume point '{self.resume_file}': {e}")
+            return {}
+
+        if checkpoint.get("week") != self._current_week():
+            self.logger.info(f"Ignoring resume point from {checkpoint.get('week')}")
+            return {}
+        return {service: tuple(cell) for service, cell in checkpoint.get("cells", {}).items()}
+
+    def clear_resume_point(self):
+        """Removes the resume point once a run has gone through every cell."""
+        if os.path.exists(self.resume_file):
+            os.remove(self.resume_file)
+
+    def _current_week(self):
+        year, week, _ = date.today().isocalendar()
+        return f"{year}-W{week:02}"
+
+    def _write_resume_point(self):
+        checkpoint = {
+            "week": self._current_week(),
+            "cells": dict(self.resume_points),
+            "reason": signal.Signals(self.stop_signal).name if self.stop_signal else None,
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        if self._write_json(self.resume_file, checkpoint, indent=None):
+            self.logger.warning(f"Recorded resume points {self.resume_points} in '{self.resume_file}'.")
+
+    def _get_node(self, service, language, disaster, prompt):
+        # Build the hierarchical data structure, caller must hold the lock
         if service not in self.data:
             self.data[service] = {}
+            self.logger.info(f"Adding {service} to output JSON")
         if language not in self.data[service]:
             self.data[service][language] = {}
+            self.logger.info(f"Adding {service} - {language} in output JSON")
         if disaster not in self.data[service][language]:
-            self.data[service][language][disaster] = {}
+            self.data[service][language][disaster] = [] if service in DIRECT_SERVICES else {}
+            self.logger.info(f"Adding {service} - {language} - {disaster} in output JSON")
+
+        # Handle the nesting based on service name
+        if service in DIRECT_SERVICES:
+            # the list of responses is the direct value of the 'disaster' key
+            return self.data[service][language][disaster]
+
+        # All other services have a 'prompt' layer
+        if prompt not in self.data[service][language][disaster]:
+            self.data[service][language][disaster][prompt] = []
+        return self.data[service][language][disaster][prompt]
 
-        # Get the simplified timestamp
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+    def get_responses(self, service, language, disaster, prompt):
+        """Returns a copy of the responses stored so far for one cell, creating the cell if needed."""
+        with self._lock:
+            return list(self._get_node(service, language, disaster, prompt))
 
+    def add_response(self, service, language, disaster, prompt, response, **fields):
+        """
+        Adds a new response dated today to the hierarchical data structure.
+        Any extra keyword arguments are stored alongside the text.
+        """
         response_data = {
-            "response": response,
-            "timestamp": timestamp
+            "text": response,
+            "date": date.today().isoformat()
+        }
+        response_data.update(fields)
+
+        with self._lock:
+            self._get_node(service, language, disaster, prompt).append(response_data)
+            self.responses_added_since_last_save += 1
+            batch_full = self.responses_added_since_last_save >= self.batch_size
+
+        if batch_full:
+            self._wake.set()
+
+    def _snapshot(self, node):
+        # copy the containers only; stored responses are never modified after they are appended
+        if isinstance(node, dict):
+            return {key: self._snapshot(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return list(node)
+        return node
+
+    def flush(self):
+        """Writes a snapshot of the collected data to disk if anything is pending."""
+        with self._write_lock:
+            with self._lock:
+                pending = self.responses_added_since_last_save
+                if pending == 0 and os.path.exists(self.output_file):
+                    return
+                snapshot = self._snapshot(self.data)
+                self.responses_added_since_last_save = 0
+
+            start = time.perf_counter()
+            saved = self._save_to_file(snapshot)
+            latency = time.perf_counter() - start
+
+            if not saved:
+                # keep the responses pending so the next flush tries again
+                with self._lock:
+                    self.responses_added_since_last_save += pending
+                return
+
+            self.flush_count += 1
+            self.total_flush_latency += latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            self.last_flush_latency = latency
+            self.last_flush_size = pending
+            self.logger.info(f"Saved {pending} responses to '{self.output_file}' in {latency:.3f}s.")
+
+    def _save_to_file(self, snapshot):
+        output_dir = os.path.dirname(self.output_file)
+        if output_dir and not os.path.exists(output_dir):
+            try:
+                os.makedirs(output_dir)
+            except OSError as e:
+                self.logger.error(f"Error creating directory {output_dir}: {e}")
+                return False
+
+        return self._write_json(self.output_file, snapshot, indent=4)
+
+    def _write_json(self, path, data, indent):
+        # write durably: fsync the temp file, atomically rename it, then fsync the directory entry
+        temp_file = f'{path}.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=indent, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, path)
+            if hasattr(os, "O_DIRECTORY"):
+                dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+            return True
+        except (IOError, OSError) as e:
+            self.logger.error(f"Error saving data to '{path}': {e}")
+            return False
+
+    def metrics(self):
+        """Returns flush latency and queue depth (responses not yet on disk)."""
+        with self._lock:
+            queue_depth = self.responses_added_since_last_save
+        return {
+            "queue_depth": queue_depth,
+            "flush_count": self.flush_count,
+            "last_flush_latency": self.last_flush_latency,
+            "mean_flush_latency": self.total_flush_latency / self.flush_count if self.flush_count else 0.0,
+            "max_flush_latency": self.max_flush_latency,
+            "last_flush_size": self.last_flush_size,
         }
 
-        # Handle the nesting based on service name
-        if service == "google_translate":
-            # For google_translate, the list of responses is the direct value of the 'disaster' key
-            if type(self.data[service][language][disaster]) is not list:
-                 self.data[service][language][disaster] = []
-            self.data[service][language][disaster].append(response_data)
-        else:
-            # All other services have a 'prompt' layer
-            if prompt not in self.data[service][language][disaster]:
-                self.data[service][language][disaster][prompt] = []
-            self.data[service][language][disaster][prompt].append(response_data)
-            
-        self.logger.info(f"Added response for {service}/{language}/{disaster}.")
-        
-        self.responses_added_since_last_save += 1
-        if self.responses_added_since_last_save >= self.batch_size:
-            self._save_to_file()
-            
     def save_remaining(self):
-        if self.responses_added_since_last_save > 0:
-            self._save_to_file()
\ No newline at end of file
+        self.flush()
@@ -12,24 +12,60 @@ services (like ChatGPT, DeepSeek, Gemini, Google Translate) and evaluates them u
     - CHRF: Character-level n-gram F-score
 
 The script handles different translation service output formats and supports
-language-specific tokenization. Results are saved to a CSV file for further analysis.
+language-specific tokenization. All prediction groups are collected first; the neural
+metrics (BERTScore, COMET) then score the whole corpus in large batches (see metrics/neural.py)
+and the per-sample scores are scattered back to their groups. Every metric's per-sample scores
+(the match statistics for BLEU and chrF, see metrics/lexical.py) are kept in a score cache
+(metrics/score_cache.py), so a run only scores responses it has not seen before. Every
+sample's scores are saved with their full key to a Parquet file (metrics/sample_store.py), and
+the results CSV is aggregated from it; source/aggregate_samples.py re-aggregates it by any column.
+Finished groups are checkpointed block by block, so an interrupted run can continue with --resume.
+Results are saved to a CSV file for further analysis.
 
 Usage:
-    python evaluation.py <generated_path> <reference_path> [--output_csv OUTPUT_CSV] [--service_name SERVICE]
+    python evaluation.py <generated_path> <reference_path> [--output_csv OUTPUT_CSV] [--service_name SERVICE [SERVICE ...]]
+                         [--per_service_csvs]
 
 Arguments:
-    generated_path    Path to the JSON file containing generated translations
-    reference_path    Path to the JSON file containing reference translations
-    --output_csv      Path to save the evaluation results as CSV (optional)
-    --service_name    Only evaluate translations from this service (optional)
+    generated_path      Path to the JSON file containing generated translations
+    reference_path      Path to the JSON file containing reference translations
+    --output_csv        Path to save the evaluation results of every evaluated service as CSV (optional)
+    --service_name      Only evaluate translations from these services (optional, default all)
+    --per_service_csvs  Also save each service's results as results/results_<service>.csv
+    --batch_size        Most samples per batch for the neural metrics (default 64)
+    --max_tokens        Padded tokens per length-sorted batch for the neural metrics (default 8192)
+    --encoding_cache    SQLite file caching reference/source encodings between runs (default cache/encodings.sqlite)
+    --no_encoding_cache Encode references and sources with every prediction
+    --score_cache       SQLite file caching per-sample scores between runs (default cache/scores.sqlite)
+    --no_score_cache    Score every response again
+    --workers           Processes computing ROUGE, BLEU and chrF (default 1)
+    --samples_file      Parquet file with every sample's scores (default results/samples.parquet)
+    --checkpoint        JSON lines file finished groups are appended to (default cache/<output_csv name>.checkpoint.jsonl)
+    --resume            Skip the groups the checkpoint already holds (after a crash or eviction)
+    --block_size        Samples scored and checkpointed together (default 2000)
+    --shard             Only evaluate shard i/N (0-based), balanced by prediction count and text length;
+                        writes results/<output_csv name>.shard-i-of-N.json for source/merge_results.py, and
+                        its new scores and encodings to <cache>.shard-i-of-N.sqlite, which the merge folds
+                        into the caches (the shards only read those)
+    --lexical_backend   sacrebleu (default) or numpy, the vectorized n-gram engine in metrics/ngram_engine.py
+    --neural_backend    fp32 (default), or int8, onnx or onnx-int8 to run BERTScore and COMET on the CPU
+                        (metrics/cpu_backend.py); check the drift with source/validate_neural_backend.py
+    --comet_model       COMET checkpoint (default wmt22-comet-da), e.g. the distilled Unbabel/eamt22-cometinho-da
+    --metrics           Metrics to compute (default rouge bleu chrf bertscore comet); only their models are loaded
+    --tiered            Write the results with the lexical metrics first, then fill in BERTScore and COMET
+    --profile           cprofile or stacks: also write results/<output_csv name>.profile.prof (cProfile) or
+                        .profile.folded (sampled stacks for a flame graph), and trace Python allocations
 Returns:
     DataFrame containing evaluation results for each translation
 
 The script produces detailed logs in logs/evaluation.log and can evaluate
 on a per-prompt level to enable analysis by prompt, disaster type, service, or language.
+The time, calls and peak memory of every phase (loading data and models, each metric, also per
+language, aggregating, writing) are logged and saved to results/<output_csv name>.profile.json.
 
-NOTE: This script requires significant resources. Consider using the run_all_evaluations.sh script. This 
-will run each evaluation sequentially then concatenate the results.
+NOTE: This script requires significant resources, most of it loading the metric models. Evaluate
+all services in one invocation (as run_all_evaluations.sh does) so the models and the
+data are loaded once.
 """
 
 # have this at the top to supress warnings from the imports because they're annoying
@@ -40,18 +76,26 @@ logging.getLogger("pytorch_lightning").setLevel(logging.WARNING)
 
 # ruff: noqa: E402
 import pandas as pd
+from tqdm import tqdm
 import argparse
 import json
-from tqdm import tqdm
 import time
 import re
 import os
+from contextlib import nullcontext
 # import torch
 
-from evaluate import load
-from sacrebleu.tokenizers.tokenizer_spm import Flores101Tokenizer
-from sacrebleu.tokenizers.tokenizer_zh import TokenizerZh
 from clients.translation_map import TRANSLATION_MAP
+from metrics.neural import (BACKENDS as NEURAL_BACKENDS, batching_stats, bertscore_samples, bertscore_version,
+                            comet_samples, comet_version, model_load_stats)
+from metrics.encoding_cache import EncodingCache
+from metrics.lexical import (BACKENDS as LEXICAL_BACKENDS, BLEU_VERSION, CHRF_VERSION, ROUGE_VERSION,
+                             EvaluationTokenizer, LexicalPool)
+from metrics.sample_store import SAMPLE_COLUMNS, aggregate_samples, sample_frame, write_samples
+from metrics.checkpoint import EvaluationCheckpoint, group_fingerprint, group_key
+from metrics.profiling import EvaluationProfile, start_profiler, stop_profiler
+from metrics.score_cache import ScoreCache, score_key
+from metrics.tokenizers import tokenizer_name, tokenizer_stats
 
 # torch.set_float32_matmul_precision('medium')
 # torch.cuda.empty_cache()
@@ -67,21 +111,26 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-class EvaluationTokenizer:
-    def set_tokenizer_function(self, language):
-        tokenizer = None
-        match language:
-            case "chinese_traditional":
-                tokenizer = TokenizerZh()
-            case _:
-                tokenizer = Flores101Tokenizer()
-        return tokenizer
-
-    def __init__(self, language):
-        self.tokenizer_function = self.set_tokenizer_function(language)    
-    
-    def tokenize(self, text):
-        return self.tokenizer_function(text)
+METRICS = ["rouge", "bleu", "chrf", "bertscore", "comet"]
+LEXICAL_METRICS = ["rouge", "bleu", "chrf"]
+
+def load_neural_metrics(metrics, comet_model="default"):
+    """
+    Returns the (bertscore, comet) metrics among `metrics`, None for the others. `evaluate`, and
+    with it torch and the models, is only imported when one of them is needed.
+    """
+    bertscore = comet = None
+    if "bertscore" in metrics or "comet" in metrics:
+        from evaluate import load
+        if "bertscore" in metrics:
+            bertscore = load("bertscore")
+        if "comet" in metrics:
+            comet = load("comet", comet_model)
+    return bertscore, comet
+
+def phase(profile, name):
+    """profile.phase(name), or nothing when there is no profile."""
+    return profile.phase(name) if profile is not None else nullcontext()
 
 # used for ROUGE
 def tokenizer_lambda(language):
@@ -93,7 +142,7 @@ def get_results_count(generated_path, service_name=None):
     - If service_name is provided, returns a list of results for that service.
     - If service_name is None, returns a dictionary of all results, grouped by service.
     """
-    # If data is a path, load it
+    # If data is a path, load it; callers that already parsed the file pass the data itself
     if isinstance(generated_path, str):
         with open(generated_path, 'r') as f:
             json_data = json.load(f)
@@ -113,23 +162,375 @@ def get_results_count(generated_path, service_name=None):
     else:
         return 0
 
-def evaluate_generated_texts(generated_path,reference_path, output_csv=None, rouge=None,
-                             bleu=None, bertscore=None, comet=None, chrf=None, only_service=None):
-    logger.info(f"Loading reference data from {reference_path}")
-    with open(reference_path, "r", encoding="utf-8") as f:
-        reference_data = json.load(f)
+def drop_truncated(predictions, id_response):
+    """
+    Removes responses the collector flagged as cut off at the output token limit, or as aborted
+    for running far past the prompt's length; they are not scored.
+    """
+    kept = [pred for pred in predictions
+            if not (isinstance(pred, dict) and (pred.get("truncated") or pred.get("aborted")))]
+    if len(kept) < len(predictions):
+        logger.warning(f"Skipping {len(predictions) - len(kept)} truncated or aborted predictions for {id_response}")
+    return kept
+
+def load_json(path_or_data, description):
+    """Loads a JSON file, or passes through data that was already loaded."""
+    if not isinstance(path_or_data, str):
+        return path_or_data
+    logger.info(f"Loading {description} data from {path_or_data}")
+    with open(path_or_data, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def collect_groups(prediction_data, reference_data, only_service=None):
+    """
+    Phase one of the evaluation: walks the predictions and returns one group per
+    (service, language, disaster, prompt) with everything the metrics need, in the order
+    the results are reported.
+
+    Each group holds the texts every metric sees for it: `hypotheses` (used by ROUGE, BLEU and
+    BERTScore), `raw` (used by COMET and chrF), `references` and `sources`. For the translation
+    services the bracketed template variables are stripped from the hypotheses and references,
+    so the services are not penalized for translating them; COMET and chrF have always been given
+    the unstripped predictions, and still are.
+    """
+    groups = []
+    for service in prediction_data:
+        if only_service and service not in only_service:
+            continue
+        for language, values in reference_data.items():
+            # Bleu doesn't take a tokenizer directly but rather a string matching a tokenizer
+            tokenizer_string = tokenizer_name(language)
+
+            # bertscore takes a language code indicating the language being passed in
+            language_code = TRANSLATION_MAP.get(language, language)
+
+            for disaster, gold_standards in values.items():
+                if not (language in prediction_data[service] and disaster in prediction_data[service][language]):
+                    continue
+                relevant_prompts = prediction_data[service][language][disaster]
+
+                # chatgpt, deepseek, gemini
+                if isinstance(relevant_prompts, dict):
+                    for prompt, predictions in relevant_prompts.items():
+                        predictions = drop_truncated(predictions, f"{service}:{language}:{disaster}:{prompt}")
+                        if not predictions:
+                            logger.warning(f"No predictions for {language}:{service}:{disaster}:{prompt}")
+                            continue
+                        # Extract the "text" field from each prediction dict, if exists. Otherwise take entire response.
+                        predictions_text = [pred["text"] if isinstance(pred, dict) and "text" in pred else pred for pred in predictions]
+                        # we have 5 predictions and one gold standard. Just make an array of the same gold standard 5 times
+                        references = [gold_standards["reference"]] * len(predictions)
+                        groups.append(_group(service, language, disaster, prompt, predictions, predictions_text,
+                                             predictions_text, references, gold_standards["source"],
+                                             tokenizer_string, language_code, "none"))
+
+                # google translate
+                elif isinstance(relevant_prompts, list):
+                    predictions = drop_truncated(relevant_prompts, f"{service}:{language}:{disaster}")
+                    if predictions:
+                        # Extract the "text" field from each prediction dict
+                        predictions_text = [pred["text"] if isinstance(pred, dict) and "text" in pred else pred for pred in predictions]
+
+                        # google translate tranlates everything directly, even our standard variables. Let's parse out everything within square brackets to not penalize for that
+                        formatted_predictions = [re.sub(r'\[.*?\]', '', prediction) for prediction in predictions_text]
+                        # apply the same treatment to the gold standards
+                        references = [re.sub(r'\[.*?\]', '', gold_standards["reference"])] * len(predictions)
+                        groups.append(_group(service, language, disaster, "N/A", predictions, formatted_predictions,
+                                             predictions_text, references, gold_standards["source"],
+                                             tokenizer_string, language_code, "strip_brackets"))
+    return groups
+
+def _group(service, language, disaster, prompt, predictions, hypotheses, raw, references, source,
+           tokenizer_string, language_code, preprocessing):
+    # Extract date field if present
+    dates = [pred.get("date") if isinstance(pred, dict) and "date" in pred else None for pred in predictions]
+    # If all dates are the same, use that date, else None
+    date = dates[0] if dates and all(d == dates[0] for d in dates) else None
+    return {
+        "service": service,
+        "language": language,
+        "disaster": disaster,
+        "prompt": prompt,
+        "date": date,
+        "dates": dates,
+        "hypotheses": hypotheses,
+        "raw": raw,
+        "references": references,
+        "sources": [source] * len(predictions),
+        "tokenizer_string": tokenizer_string,
+        "language_code": language_code,
+        "preprocessing": preprocessing,
+    }
 
-    logger.info(f"Loading prediction data from {generated_path}")
-    with open(generated_path, "r", encoding="utf-8") as f:
-        prediction_data = json.load(f)
-    
-    results = []
+def flatten_samples(groups):
+    """Lists every sample of every group, in group order, with the group it belongs to."""
+    samples = []
+    for index, group in enumerate(groups):
+        group["first_sample"] = len(samples)
+        for hypothesis, raw, reference, source in zip(group["hypotheses"], group["raw"], group["references"], group["sources"]):
+            samples.append({
+                "group": index,
+                "hypothesis": hypothesis,
+                "raw": raw,
+                "reference": reference,
+                "source": source,
+                "language": group["language"],
+                "tokenizer_string": group["tokenizer_string"],
+                "language_code": group["language_code"],
+                "preprocessing": group["preprocessing"],
+            })
+    return samples
+
+def lexical_shards(samples, indices, shard_size=500):
+    """
+    Splits sample indices into shards of whole groups of one language, each about `shard_size`
+    samples, so the lexical metrics can score them in separate processes.
+    """
+    by_language = {}
+    for index in indices:
+        by_language.setdefault(samples[index]["language"], []).append(index)
+
+    shards = []
+    for bucket in by_language.values():
+        shard = []
+        for index in bucket:
+            # only start a new shard at a group boundary
+            if len(shard) >= shard_size and samples[index]["group"] != samples[shard[-1]]["group"]:
+                shards.append(shard)
+                shard = []
+            shard.append(index)
+        shards.append(shard)
+    return shards
+
+def score_samples(samples, bertscore, comet, score_cache, batch_size=64, encoding_cache=None, lexical_pool=None,
+                  timings=None, neural_backend="fp32", max_tokens=8192, metrics=None, profile=None):
+    """
+    Phase two: returns the per-sample pieces of every metric, {metric: [value per sample]}.
+    Only the metrics in `metrics` (default METRICS) are scored; the others get None for every sample.
+    Values come from the score cache where possible; only the misses are computed, the lexical
+    metrics in shards on `lexical_pool` (a LexicalPool) and the neural metrics in corpus-wide batches
+    on `neural_backend` (fp32, or a CPU backend from metrics/cpu_backend.py), in length-sorted batches
+    of at most `max_tokens` padded tokens.
+    The wall time of each metric is added to `timings` ({metric: seconds}) if given. With a `profile`
+    (an EvaluationProfile) each metric runs as a phase of it, and its time is also recorded per
+    language without changing how the samples are batched: the lexical shards and BERTScore's
+    language buckets are timed as they run, and COMET's time, spent on batches that mix
+    languages, is divided among the languages by the characters each one scored.
+    """
+    lexical_pool = lexical_pool if lexical_pool is not None else LexicalPool()
+
+    def lexical(metric, field):
+        def compute(indices):
+            shards = lexical_shards(samples, indices)
+            logger.info(f"Scoring {len(indices)} samples with {metric} ({lexical_pool.backend}) in {len(shards)} shards "
+                        f"on {lexical_pool.workers} workers")
+            shard_timings = []
+            scored = lexical_pool.score(metric, [
+                (samples[shard[0]]["language"], samples[shard[0]]["tokenizer_string"],
+                 [samples[i][field] for i in shard], [samples[i]["reference"] for i in shard])
+                for shard in shards
+            ], timings=shard_timings)
+            if profile is not None:
+                # time in the workers, which run in parallel
+                for language, seconds, count in shard_timings:
+                    profile.record(metric, language, seconds, count)
+            values = {}
+            for shard, shard_values in zip(shards, scored):
+                values.update(zip(shard, shard_values))
+            return [values[i] for i in indices]
+        return compute
+
+    def compute_bertscore(indices):
+        logger.info(f"Scoring {len(indices)} samples with BERTScore")
+        bucket_timings = []
+        result = bertscore_samples(bertscore, [samples[i]["hypothesis"] for i in indices],
+                                   [samples[i]["reference"] for i in indices],
+                                   [samples[i]["language_code"] for i in indices],
+                                   batch_size=batch_size, cache=encoding_cache, backend=neural_backend,
+                                   max_tokens=max_tokens, timings=bucket_timings)
+        if profile is not None:
+            # buckets are per language code, which some languages share
+            names = {}
+            for i in indices:
+                names.setdefault(samples[i]["language_code"], set()).add(samples[i]["language"])
+            for code, seconds, count in bucket_timings:
+                profile.record("bertscore", "/".join(sorted(names[code])), seconds, count)
+        return [list(scores) for scores in zip(result["precision"], result["recall"], result["f1"])]
+
+    def compute_comet(indices):
+        logger.info(f"Scoring {len(indices)} samples with COMET")
+        start = time.time()
+        values = comet_samples(comet, [samples[i]["raw"] for i in indices], [samples[i]["reference"] for i in indices],
+                               [samples[i]["source"] for i in indices], batch_size=batch_size, cache=encoding_cache,
+                               backend=neural_backend, max_tokens=max_tokens)
+        if profile is not None:
+            seconds = time.time() - start
+            characters, counts = {}, {}
+            for i in indices:
+                language = samples[i]["language"]
+                characters[language] = characters.get(language, 0) + sum(
+                    len(samples[i][field] or "") for field in ("raw", "reference", "source"))
+                counts[language] = counts.get(language, 0) + 1
+            total = sum(characters.values()) or 1
+            for language, count in counts.items():
+                profile.record("comet", language, seconds * characters[language] / total, count)
+        return values
+
+    metrics = metrics or METRICS
+    comet_model = comet_version(comet, neural_backend) if "comet" in metrics else None
+    bertscore_versions = {}
+    for sample in samples:
+        if "bertscore" in metrics and sample["language_code"] not in bertscore_versions:
+            bertscore_versions[sample["language_code"]] = bertscore_version(sample["language_code"], neural_backend)
+
+    # metric: (version of each sample, tokenizer of each sample, prediction field, uses the source, compute)
+    scorers = {
+        "rouge": (lambda s: ROUGE_VERSION, lambda s: s["tokenizer_string"], "hypothesis", False, lexical("rouge", "hypothesis")),
+        "bleu": (lambda s: BLEU_VERSION, lambda s: s["tokenizer_string"], "hypothesis", False, lexical("bleu", "hypothesis")),
+        "chrf": (lambda s: CHRF_VERSION, lambda s: None, "raw", False, lexical("chrf", "raw")),
+        "bertscore": (lambda s: bertscore_versions[s["language_code"]], lambda s: None, "hypothesis", False,
+                      compute_bertscore),
+        "comet": (lambda s: comet_model, lambda s: None, "raw", True, compute_comet),
+    }
 
-    # count iterations for progress bar
-    if only_service:
-        total = get_results_count(generated_path, service_name=only_service)
-    else:
-        total = get_results_count(generated_path)
+    values = {}
+    timings = timings if timings is not None else {}
+    for metric, (version, tokenizer, field, uses_source, compute) in scorers.items():
+        if metric not in metrics:
+            values[metric] = [None] * len(samples)
+            continue
+        metric_start = time.time()
+        with phase(profile, metric):
+            keys = [score_key(metric, version(s), tokenizer(s), s["preprocessing"], s[field], s["reference"],
+                              s["source"] if uses_source else None) for s in samples]
+            values[metric] = score_cache.fetch(metric, keys, compute)
+        timings[metric] = timings.get(metric, 0.0) + time.time() - metric_start
+    return values
+
+def metric_versions(groups, comet, neural_backend="fp32", metrics=None):
+    """The versions of the metrics in `metrics` (default METRICS) that score `groups`, for the checkpoint fingerprints."""
+    metrics = metrics or METRICS
+    versions = {"rouge": lambda: ROUGE_VERSION,
+                "bleu": lambda: BLEU_VERSION,
+                "chrf": lambda: CHRF_VERSION,
+                "bertscore": lambda: {code: bertscore_version(code, neural_backend)
+                                      for code in sorted({group["language_code"] for group in groups})},
+                "comet": lambda: comet_version(comet, neural_backend)}
+    return {metric: version() for metric, version in versions.items() if metric in metrics}
+
+def group_cost(group, per_prediction=100):
+    """Estimated scoring cost of a group: its predictions plus the characters every metric reads."""
+    return sum(per_prediction + len(raw) + len(reference) + len(source)
+               for raw, reference, source in zip(group["raw"], group["references"], group["sources"]))
+
+def shard_groups(groups, shard, shards):
+    """
+    Returns the groups of shard `shard` (0-based) out of `shards`, in their original order.
+
+    Groups are assigned largest cost first to the least loaded shard, so every shard gets about
+    the same number of predictions and characters, not just the same number of groups. The
+    partition only depends on the groups, so every node computes the same one.
+    """
+    loads = [0] * shards
+    assigned = set()
+    order = sorted(range(len(groups)), key=lambda i: (-group_cost(groups[i]), group_key(groups[i])))
+    for index in order:
+        target = min(range(shards), key=lambda s: (loads[s], s))
+        loads[target] += group_cost(groups[index])
+        if target == shard:
+            assigned.add(index)
+    logger.info(f"Shard {shard}/{shards}: {len(assigned)} of {len(groups)} groups, cost {loads[shard]} "
+                f"(shards range {min(loads)}-{max(loads)})")
+    return [group for index, group in enumerate(groups) if index in assigned]
+
+def parse_shard(value):
+    """Parses --shard i/N (0 <= i < N)."""
+    try:
+        shard, shards = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {value!r}")
+    if not 0 <= shard < shards:
+        raise argparse.ArgumentTypeError(f"shard index must be between 0 and {shards - 1}, got {shard}")
+    return shard, shards
+
+def shard_path(path, shard):
+    """results/all_results_combined.csv -> results/all_results_combined.shard-2-of-8.<ext>"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+def write_shard(path, shard, expected, df):
+    """Writes a shard's results with the keys of every group the full evaluation expects, for source/merge_results.py."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    manifest = {
+        "shard": shard[0],
+        "shards": shard[1],
+        "expected": expected,
+        "rows": df.to_dict("records"),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, default=lambda value: value.item())
+    logger.info(f"Shard results saved to: {path}")
+    print(f"Shard results saved to: {path}")
+
+def evaluation_blocks(groups, block_size):
+    """Splits groups into consecutive blocks of about `block_size` samples; each block is scored and checkpointed at once."""
+    blocks = []
+    block = []
+    count = 0
+    for group in groups:
+        if block and count + len(group["raw"]) > block_size:
+            blocks.append(block)
+            block = []
+            count = 0
+        block.append(group)
+        count += len(group["raw"])
+    if block:
+        blocks.append(block)
+    return blocks
+
+def evaluate_generated_texts(generated_path, reference_path, output_csv=None, bertscore=None, comet=None,
+                             only_service=None, batch_size=64, encoding_cache=None, score_cache=None, lexical_pool=None,
+                             samples_path=None, checkpoint=None, block_size=2000, shard=None, shard_manifest=None,
+                             neural_backend="fp32", max_tokens=8192, metrics=None, profile=None):
+    """
+    Scores every prediction group against its gold standard.
+
+    generated_path and reference_path may be file paths or already loaded data. only_service is
+    a service name or a list of them; by default every service in the predictions is evaluated.
+
+    The evaluation runs in two phases: every group is collected first, then the groups are
+    scored in blocks of about `block_size` samples. In each block every metric scores all the
+    samples at once (BERTScore and COMET in length-sorted batches of at most `max_tokens` padded
+    tokens and `batch_size` samples) and the per-sample pieces
+    are aggregated per group; the results are the same as scoring each group on its own.
+    `score_cache` (a ScoreCache) keeps those pieces between runs so only new responses are
+    scored; `encoding_cache` (an EncodingCache) lets the neural metrics reuse reference and
+    source encodings; `lexical_pool` (a LexicalPool) runs ROUGE, BLEU and chrF in worker processes;
+    `neural_backend` runs BERTScore and COMET in fp32 or on a CPU backend (metrics/cpu_backend.py).
+    Only the metrics in `metrics` (default METRICS) are scored; the others are left empty, and
+    bertscore and comet may be None when they are not among them.
+
+    Each finished block is appended to `checkpoint` (an EvaluationCheckpoint); groups it already
+    holds with the same fingerprint are not scored again. Every sample's scores are written to
+    `samples_path` (Parquet, see metrics/sample_store.py) when given, and the returned results
+    are aggregated from them.
+
+    With `shard` (i, N) only the groups of shard i are scored (see shard_groups); their results
+    and the keys of every expected group are written to `shard_manifest` for the merge step.
+
+    `profile` (an EvaluationProfile, see metrics/profiling.py) times loading the data, each
+    metric (also per language), aggregating and writing the samples, with their peak memory.
+    """
+    with phase(profile, "load data"):
+        reference_data = load_json(reference_path, "reference")
+        prediction_data = load_json(generated_path, "prediction")
+    score_cache = score_cache if score_cache is not None else ScoreCache()
+    checkpoint = checkpoint if checkpoint is not None else EvaluationCheckpoint()
+
+    if isinstance(only_service, str):
+        only_service = [only_service]
 
     """
     we want to collect fine-tuned results that tell us:
@@ -141,97 +542,72 @@ def evaluate_generated_texts(generated_path,reference_path, output_csv=None, rou
     so let's evaluate on a per-prompt level. We can then take the average to broaden the evaluation to larger categories like disaster, language
     iterate over every language - {disaster: reference_text} pair
     """
-    with tqdm(total=total, desc="Evaluating prompts") as pbar:
-        for service in prediction_data:
-            if only_service and service != only_service:
-                continue
-            for language, values in reference_data.items():
-                # Bleu doesn't take a tokenizer directly but rather a string matching a tokenizer
-                if language == "chinese_traditional":
-                    tokenizer_string = "zh"
-                else:
-                    tokenizer_string = "flores101"
-
-                #evaluation_tokenizer = tokenizer_lambda(language)
-                evaluation_tokenizer = (lambda tok: (lambda x: tok.tokenize(x)))(EvaluationTokenizer(language))
-
-                # bertscore takes a language code indicating the language being passed in
-                language_code = TRANSLATION_MAP.get(language, language)
-
-                for disaster, gold_standards in values.items():
-                    if (
-                        service in prediction_data
-                        and language in prediction_data[service]
-                        and disaster in prediction_data[service][language]
-                    ):
-                        relevant_prompts = prediction_data[service][language][disaster]
-                        
-                        # chatgpt, deepseek, gemini
-                        if isinstance(relevant_prompts, dict):
-                            for prompt, predictions in relevant_prompts.items():
-                                if not predictions:
-                                    logger.warning(f"No predictions for {language}:{service}:{disaster}:{prompt}")
-                                    continue
-                                # Extract the "text" field from each prediction dict, if exists. Otherwise take entire response.
-                                predictions_text = [pred["text"] if isinstance(pred, dict) and "text" in pred else pred for pred in predictions]
-                                total_predictions = len(predictions)
-
-                                # we have 5 predictions and one gold standard. Just make an array of the same gold standard 5 times
-                                duplicated_gold_standards = [gold_standards["reference"]] * total_predictions
-
-                                # Extract date field if present
-                                dates = [pred.get("date") if isinstance(pred, dict) and "date" in pred else None for pred in predictions]
-                                # If all dates are the same, use that date, else None
-                                date = dates[0] if dates and all(d == dates[0] for d in dates) else None
-
-                                # try:
-                                id_response = f"{service}:{language}:{disaster}:{prompt}"
-                                logger.info(f"Evaluating {id_response} with {total_predictions} predictions")
-                                rouge_result = rouge.compute(predictions=predictions_text, references=duplicated_gold_standards, tokenizer=evaluation_tokenizer)
-                                bertscore_result = bertscore.compute(predictions=predictions_text, references=duplicated_gold_standards, lang=language_code)
-                                bleu_result = bleu.compute(predictions=predictions_text, references=duplicated_gold_standards, tokenize=tokenizer_string)
-                                comet_result = comet.compute(predictions=predictions_text, references=duplicated_gold_standards, sources=[gold_standards["source"]] * total_predictions)
-                                chrf_result = chrf.compute(predictions=predictions_text, references=duplicated_gold_standards, word_order=2, lowercase=True)
-                                result = gather_results(service, language, disaster, prompt, rouge_result, bertscore_result, bleu_result, comet_result, chrf_result, date=date)
-                                results.append(result)
-                                    
-                                pbar.update(1)
-
-                        # google translate
-                        elif isinstance(relevant_prompts, list):
-                            # If relevant_prompts is a list, we assume it's a single prediction
-                            predictions = relevant_prompts
-                            if predictions:
-                                # Extract the "text" field from each prediction dict
-                                predictions_text = [pred["text"] if isinstance(pred, dict) and "text" in pred else pred for pred in predictions]
-
-                                # google translate tranlates everything directly, even our standard variables. Let's parse out everything within square brackets to not penalize for that
-                                formatted_predictions = []
-                                for prediction in predictions_text:
-                                    formatted_predictions.append(re.sub(r'\[.*?\]', '', prediction))
-
-                                total_predictions = len(formatted_predictions)
-                                # apply the same treatment to the gold standards
-                                duplicated_gold_standards = [re.sub(r'\[.*?\]', '', gold_standards["reference"])] * total_predictions
-
-                                # Extract date field if present
-                                dates = [pred.get("date") if isinstance(pred, dict) and "date" in pred else None for pred in predictions]
-                                # If all dates are the same, use that date, else None
-                                date = dates[0] if dates and all(d == dates[0] for d in dates) else None
-
-                                # try:        
-                                id_response = f"{service}:{language}:{disaster}"
-                                logger.info(f"Evaluating {id_response} with {total_predictions} predictions")
-                                rouge_result = rouge.compute(predictions=formatted_predictions, references=duplicated_gold_standards, tokenizer=evaluation_tokenizer)
-                                bertscore_result = bertscore.compute(predictions=formatted_predictions, references=duplicated_gold_standards, lang=language_code)
-                                bleu_result = bleu.compute(predictions=formatted_predictions, references=duplicated_gold_standards, tokenize=tokenizer_string)
-                                comet_result = comet.compute(predictions=predictions_text, references=duplicated_gold_standards, sources=[gold_standards["source"]] * total_predictions)
-                                chrf_result = chrf.compute(predictions=predictions_text, references=duplicated_gold_standards, word_order=2, lowercase=True)
-                                result = gather_results(service, language, disaster, "N/A", rouge_result, bertscore_result, bleu_result, comet_result, chrf_result, date=date)
-                                results.append(result)
-
-                                pbar.update(1)
-    df = pd.DataFrame(results)
+    with phase(profile, "load data"):
+        groups = collect_groups(prediction_data, reference_data, only_service)
+    expected = [group_key(group) for group in groups]
+    if shard is not None:
+        groups = shard_groups(groups, *shard)
+    versions = metric_versions(groups, comet, neural_backend, metrics)
+    fingerprints = [group_fingerprint(group, versions) for group in groups]
+    entries = [checkpoint.done(group, fingerprint) for group, fingerprint in zip(groups, fingerprints)]
+    pending = [(group, fingerprint) for group, fingerprint, entry in zip(groups, fingerprints, entries) if entry is None]
+    logger.info(f"Collected {sum(len(group['raw']) for group in groups)} samples in {len(groups)} groups; "
+                f"{len(groups) - len(pending)} groups already finished")
+
+    finished = {}
+    timings = {}
+    blocks = evaluation_blocks([group for group, _ in pending], block_size)
+    fingerprint_of = {id(group): fingerprint for group, fingerprint in pending}
+    with tqdm(total=len(pending), desc="Evaluating prompts") as pbar:
+        for block in blocks:
+            samples = flatten_samples(block)
+            values = score_samples(samples, bertscore, comet, score_cache, batch_size=batch_size,
+                                   encoding_cache=encoding_cache, lexical_pool=lexical_pool, timings=timings,
+                                   neural_backend=neural_backend, max_tokens=max_tokens, metrics=metrics,
+                                   profile=profile)
+            with phase(profile, "aggregate"):
+                sample_df = sample_frame(block, values)
+                rows = aggregate_samples(sample_df).to_dict("records")
+                stored = checkpoint.add([
+                    {
+                        "key": group_key(group),
+                        "fingerprint": fingerprint_of[id(group)],
+                        "row": row,
+                        "samples": sample_df.iloc[group["first_sample"]:group["first_sample"] + len(group["raw"])].to_dict("records"),
+                    }
+                    for group, row in zip(block, rows)
+                ])
+            for group, entry in zip(block, stored):
+                finished[id(group)] = entry
+            pbar.update(len(block))
+
+    logger.info(f"Score cache: {score_cache.stats()}")
+    for metric, dedup in score_cache.dedup_stats().items():
+        message = (f"Deduplicated {metric}: {dedup['samples']} samples scored as {dedup['unique']} distinct inputs "
+                   f"({dedup['ratio']:.0%}), about {dedup['seconds_saved']:.2f}s saved")
+        logger.info(message)
+        print(message)
+    logger.info(f"Tokenizer cache (hits, misses) in this process: {tokenizer_stats()}")
+    summary = ", ".join(f"{metric} {seconds:.2f}s" for metric, seconds in timings.items())
+    logger.info(f"Metric wall time: {summary}")
+    print(f"Metric wall time: {summary}")
+    for encoder, stats in batching_stats().items():
+        batching = (f"{encoder}: {stats['samples']} texts in {stats['batches']} batches, "
+                    f"{stats['fill']:.0%} of padded tokens filled, {stats['samples_per_second']:.1f} samples/s")
+        logger.info(f"Encoder batches of {batching}")
+        print(f"Encoder batches of {batching}")
+
+    # results come from the checkpoint entries, finished in this run or before it
+    entries = [entry if entry is not None else finished[id(group)] for group, entry in zip(groups, entries)]
+    if samples_path:
+        with phase(profile, "write samples"):
+            write_samples(pd.DataFrame([sample for entry in entries for sample in entry["samples"]], columns=SAMPLE_COLUMNS),
+                          samples_path)
+        logger.info(f"Per-sample scores saved to: {samples_path}")
+        print(f"Per-sample scores saved to: {samples_path}")
+    df = pd.DataFrame([entry["row"] for entry in entries])
+    if shard_manifest:
+        write_shard(shard_manifest, shard, expected, df)
 
     if output_csv:
         df.to_csv(output_csv, index=False)
@@ -240,23 +616,32 @@ def evaluate_generated_texts(generated_path,reference_path, output_csv=None, rou
     return df
 
 
-def gather_results(service, language, disaster, prompt, rouge_result, bertscore_result, bleu_result, comet_result, chrf_result, date=None):
-    return {
-        "SERVICE": service,
-        "LANGUAGE": language,
-        "DISASTER": disaster,
-        "PROMPT": prompt, 
-        "ROUGE-1": rouge_result["rouge1"],
-        "ROUGE-2": rouge_result["rouge2"],
-        "ROUGE-L": rouge_result["rougeL"],
-        "BLEU": bleu_result["score"],
-        "BERTScore_P": bertscore_result["precision"][0],
-        "BERTScore_R": bertscore_result["recall"][0],
-        "BERTScore_F1": bertscore_result["f1"][0],
-        "COMET": comet_result["mean_score"],
-        "CHRF": chrf_result["score"],
-        "DATE": date
-    }
+def write_results(df, output_csv=None, per_service_dir=None):
+    """
+    Writes the results of every evaluated service to output_csv and, if per_service_dir is set,
+    each service's rows to <per_service_dir>/results_<service>.csv. The combined file lists the
+    services in sorted order, as the per-service files used to be combined.
+    """
+    if df.empty:
+        if output_csv:
+            df.to_csv(output_csv, index=False)
+        return df
+
+    services = sorted(df["SERVICE"].unique())
+    if per_service_dir:
+        os.makedirs(per_service_dir, exist_ok=True)
+        for service in services:
+            service_csv = os.path.join(per_service_dir, f"results_{service}.csv")
+            df[df["SERVICE"] == service].to_csv(service_csv, index=False)
+            logger.info(f"Results for {service} saved to: {service_csv}")
+            print(f"Results for {service} saved to: {service_csv}")
+
+    combined = pd.concat([df[df["SERVICE"] == service] for service in services], ignore_index=True)
+    if output_csv:
+        combined.to_csv(output_csv, index=False)
+        logger.info(f"Results saved to: {output_csv}")
+        print(f"Results saved to: {output_csv}")
+    return combined
 
 
 def main():
@@ -264,9 +649,57 @@ def main():
     parser = argparse.ArgumentParser(description="Evaluate generated texts against reference texts")
     parser.add_argument("generated_path", help="Path generated text file")
     parser.add_argument("reference_path", help="Path reference text file")
-    parser.add_argument("--output_csv", help="Path to output CSV file", default=None)
-    parser.add_argument("--service_name", help="Only evaluate this service (chatgpt, deepseek, gemini, google_translate)")
+    parser.add_argument("--output_csv", help="Path to output CSV file with the results of every evaluated service", default=None)
+    parser.add_argument("--service_name", nargs="+", default=None,
+                        help="Only evaluate these services (chatgpt, deepseek, gemini, google_translate, deepL); default all")
+    parser.add_argument("--per_service_csvs", action="store_true", default=False,
+                        help="Also write results/results_<service>.csv for each evaluated service")
+    parser.add_argument("--batch_size", type=int, default=64,
+                        help="Most samples per batch for BERTScore and COMET, which score the whole corpus at once")
+    parser.add_argument("--max_tokens", type=int, default=8192,
+                        help="Padded tokens per batch for BERTScore and COMET; texts are sorted by length and batched up to it")
+    parser.add_argument("--encoding_cache", default="cache/encodings.sqlite",
+                        help="SQLite file that keeps BERTScore/COMET encodings of references and sources between runs")
+    parser.add_argument("--no_encoding_cache", action="store_true", default=False,
+                        help="Encode references and sources with every prediction, as the metrics do on their own")
+    parser.add_argument("--score_cache", default="cache/scores.sqlite",
+                        help="SQLite file that keeps per-sample scores between runs, so only new responses are scored")
+    parser.add_argument("--no_score_cache", action="store_true", default=False,
+                        help="Score every response again instead of reusing the cached scores")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes computing ROUGE, BLEU and chrF (default 1, in this process)")
+    parser.add_argument("--samples_file", default="results/samples.parquet",
+                        help="Parquet file with every sample's scores, which the results CSV is aggregated from")
+    parser.add_argument("--checkpoint", default=None,
+                        help="JSON lines file finished groups are appended to (default cache/<output_csv name>.checkpoint.jsonl)")
+    parser.add_argument("--resume", action="store_true", default=False,
+                        help="Skip the groups the checkpoint already holds instead of starting over")
+    parser.add_argument("--block_size", type=int, default=2000,
+                        help="Samples scored and checkpointed together (default 2000)")
+    parser.add_argument("--shard", type=parse_shard, default=None,
+                        help="Only evaluate shard i/N (0-based) of the groups; merge the shards with source/merge_results.py")
+    parser.add_argument("--lexical_backend", choices=LEXICAL_BACKENDS, default="sacrebleu",
+                        help="Compute ROUGE, BLEU and chrF with sacrebleu/rouge_score or the NumPy n-gram engine (same scores)")
+    parser.add_argument("--neural_backend", choices=NEURAL_BACKENDS, default="fp32",
+                        help="Run BERTScore and COMET in fp32, or on the CPU with int8 quantization and/or ONNX Runtime")
+    parser.add_argument("--comet_model", default="default",
+                        help="COMET checkpoint; default Unbabel/wmt22-comet-da, e.g. the distilled Unbabel/eamt22-cometinho-da")
+    parser.add_argument("--metrics", nargs="+", choices=METRICS, default=METRICS,
+                        help="Metrics to compute (default all); the models of the others are not loaded and their columns stay empty")
+    parser.add_argument("--tiered", action="store_true", default=False,
+                        help="Write the results with ROUGE, BLEU and chrF first, then load BERTScore and COMET and fill them in")
+    parser.add_argument("--profile", choices=["cprofile", "stacks"], default=None,
+                        help="Also profile this process with cProfile or a stack sampler (for a flame graph), "
+                             "and trace Python allocations per phase")
     args = parser.parse_args()
+    if args.tiered and args.shard:
+        parser.error("--tiered writes the results CSV between the passes; shards are merged by source/merge_results.py instead")
+
+    # fork the lexical workers before the metric models are loaded, and before tracemalloc starts
+    lexical_pool = LexicalPool(args.workers, args.lexical_backend)
+    profile = EvaluationProfile(trace_memory=args.profile is not None)
+    profile.start()
+    profiler = start_profiler(args.profile) if args.profile else None
 
     logger.info("**************************************************")
     logger.info("**************************************************")
@@ -275,31 +708,92 @@ def main():
     logger.info(f"Generated file: {args.generated_path}")
     logger.info(f"Reference file: {args.reference_path}")
     logger.info(f"Output CSV: {args.output_csv}")
-
-    # Load metrics
-    logger.info("Loading metrics")
-    rouge = load("rouge")
-    bleu = load("sacrebleu")
-    bertscore = load("bertscore")
-    comet = load("comet")
-    chrf = load("chrf")
+    logger.info(f"Services: {args.service_name or 'all'}")
+    logger.info(f"Metrics: {', '.join(args.metrics)}{' (tiered)' if args.tiered else ''}")
+    logger.info(f"Neural metrics: COMET {args.comet_model} on the {args.neural_backend} backend")
 
     # If output_csv is specified, put it in the results folder
     output_path = None
     if args.output_csv:
         output_path = os.path.join("results/", os.path.basename(args.output_csv))
     
+    if args.shard:
+        # shards only read the run's caches and write their own files, merged by source/merge_results.py
+        encoding_cache = None if args.no_encoding_cache else EncodingCache(shard_path(args.encoding_cache, args.shard),
+                                                                           base=args.encoding_cache)
+        score_cache = ScoreCache(None if args.no_score_cache else shard_path(args.score_cache, args.shard),
+                                 base=None if args.no_score_cache else args.score_cache)
+    else:
+        encoding_cache = None if args.no_encoding_cache else EncodingCache(args.encoding_cache)
+        score_cache = ScoreCache(None if args.no_score_cache else args.score_cache)
+    checkpoint_path = args.checkpoint
+    if checkpoint_path is None:
+        name = os.path.splitext(os.path.basename(args.output_csv))[0] if args.output_csv else "evaluation"
+        checkpoint_path = os.path.join("cache", f"{name}.checkpoint.jsonl")
+        if args.shard:
+            checkpoint_path = shard_path(checkpoint_path, args.shard)
+    checkpoint = EvaluationCheckpoint(checkpoint_path, resume=args.resume)
+    per_service_dir = "results/" if args.per_service_csvs else None
+    options = dict(only_service=args.service_name, batch_size=args.batch_size, encoding_cache=encoding_cache,
+                   score_cache=score_cache, lexical_pool=lexical_pool, block_size=args.block_size,
+                   neural_backend=args.neural_backend, max_tokens=args.max_tokens, profile=profile)
+
+    lexical = [metric for metric in args.metrics if metric in LEXICAL_METRICS]
+    if args.tiered and lexical and len(lexical) < len(args.metrics):
+        # first pass: the lexical metrics alone, before any model is loaded. Its groups are not
+        # checkpointed, so a resumed run's finished groups keep their neural scores; the second
+        # pass reuses these lexical scores from the score cache
+        lexical_df = evaluate_generated_texts(args.generated_path, args.reference_path, None, metrics=lexical, **options)
+        with profile.phase("write results"):
+            write_results(lexical_df, output_path, per_service_dir=per_service_dir)
+        message = f"Lexical results written after {time.time() - start_time:.2f} seconds; adding the neural metrics"
+        logger.info(message)
+        print(message)
+
+    # Load metrics; ROUGE, BLEU and chrF are computed per sample with rouge_score and sacrebleu (metrics/lexical.py)
+    logger.info("Loading metrics")
+    with profile.phase("load models"):
+        bertscore, comet = load_neural_metrics(args.metrics, args.comet_model)
+
+    # the results are written below, combined and per service
     df = evaluate_generated_texts(
         args.generated_path,
         args.reference_path,
-        output_path,
-        rouge,
-        bleu,
+        None,
         bertscore,
         comet,
-        chrf,
-        only_service=args.service_name
+        samples_path=shard_path(args.samples_file, args.shard) if args.shard else args.samples_file,
+        checkpoint=checkpoint,
+        shard=args.shard,
+        shard_manifest=shard_path(os.path.splitext(output_path or "results/evaluation.csv")[0] + ".json", args.shard)
+        if args.shard else None,
+        metrics=args.metrics,
+        **options
     )
+    lexical_pool.close()
+    if args.shard is None:
+        with profile.phase("write results"):
+            write_results(df, output_path, per_service_dir=per_service_dir)
+
+    # next to the results: results/<output_csv name>.profile.json, per shard when sharded
+    profile_stem = os.path.splitext(output_path or "results/evaluation.csv")[0] + ".profile"
+    if args.shard:
+        profile_stem = os.path.splitext(shard_path(profile_stem + ".json", args.shard))[0]
+    if profiler is not None:
+        path = stop_profiler(profiler, profile_stem)
+        logger.info(f"Profile saved to: {path}")
+        print(f"Profile saved to: {path}")
+    profile.stop()
+    model_loads = model_load_stats()
+    for line in profile.summary() + [f"Model load {model}: {seconds:.2f}s" for model, seconds in model_loads.items()]:
+        logger.info(f"Profile: {line}")
+    profile.write(profile_stem + ".json", model_loads=model_loads, batching=batching_stats(),
+                  dedup=score_cache.dedup_stats(), score_cache=score_cache.stats(), tokenizer_cache=tokenizer_stats())
+    logger.info(f"Profile report saved to: {profile_stem}.json")
+    print(f"Profile report saved to: {profile_stem}.json")
+    score_cache.close()
+    if encoding_cache is not None:
+        encoding_cache.close()
 
     logger.info("Evaluation complete.")
     end_time = time.time()
@@ -0,0 +1,12 @@
+# Merges the shards written by run_all.cmd into results/all_results_combined.csv and the
+# per-service CSVs, after checking every expected group was evaluated exactly once.
+# SHARDS must match run_all.cmd.
+SHARDS     = 8
+executable = ./run_all_evaluations.sh
+arguments  = merge $(SHARDS)
+getenv     = true
+error      = merge_results.error
+log        = merge_results.log
+transfer_executable = false
+request_memory = 2*1024
+queue
\ No newline at end of file
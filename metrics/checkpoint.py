@@ -0,0 +1,90 @@
+"""
+Checkpoint of finished groups for resumable evaluation.
+
+evaluation.py scores the groups in blocks and appends each finished group to a JSON lines
+file as soon as its block is done: its key, a fingerprint of everything its scores depend
+on (texts, dates, metric versions), its results row and its per-sample rows. The file is
+flushed and synced after every block, so a crash or a Condor eviction loses at most the
+block in progress.
+
+A --resume run loads the file and skips every group whose fingerprint still matches;
+groups whose responses or metrics changed are scored again. A line cut off by a crash is
+dropped when the file is loaded.
+
+The results CSVs and the samples file are always written from the checkpoint entries,
+after a JSON round trip (which is exact for floats), so a resumed run writes the same
+bytes as a clean one.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def group_key(group):
+    return [group["service"], group["language"], group["disaster"], group["prompt"]]
+
+
+def group_fingerprint(group, versions):
+    """Hashes what a group's scores depend on: its texts, dates, preprocessing and metric versions."""
+    parts = [group_key(group), group["preprocessing"], group["tokenizer_string"], group["language_code"],
+             group["hypotheses"], group["raw"], group["references"], group["sources"], group["dates"], versions]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _plain(value):
+    # numpy scalars from the aggregations
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Cannot store {type(value).__name__} in the checkpoint")
+
+
+class EvaluationCheckpoint:
+    def __init__(self, path=None, resume=False):
+        self.path = path
+        self.entries = {}
+
+        if path and resume and os.path.exists(path):
+            self._load()
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # rewrite what was loaded (dropping a cut-off line), or start empty
+            with open(path, "w", encoding="utf-8") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Dropping unreadable checkpoint line {number} in {self.path}")
+                    continue
+                self.entries[tuple(entry["key"])] = entry
+        logger.info(f"Loaded {len(self.entries)} finished groups from {self.path}")
+
+    def done(self, group, fingerprint):
+        """Returns the stored entry of `group` if it was finished with the same fingerprint."""
+        entry = self.entries.get(tuple(group_key(group)))
+        if entry is not None and entry["fingerprint"] == fingerprint:
+            return entry
+        return None
+
+    def add(self, entries):
+        """Records finished groups (dicts with key, fingerprint, row, samples) and returns them as stored."""
+        lines = [json.dumps(entry, ensure_ascii=False, default=_plain) for entry in entries]
+        stored = [json.loads(line) for line in lines]
+        for entry in stored:
+            self.entries[tuple(entry["key"])] = entry
+        if self.path and lines:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return stored
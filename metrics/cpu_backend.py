@@ -0,0 +1,158 @@
+"""
+CPU inference backends for the encoders of the neural metrics (BERTScore and COMET).
+
+The evaluation nodes have no GPU, and both metrics spend nearly all their time in the
+transformer encoder. convert_encoder returns that encoder ready to run on the CPU with one of
+
+    fp32       the PyTorch model as loaded (the reference scores)
+    int8       PyTorch dynamic quantization: Linear weights stored as int8, activations
+               quantized on the fly
+    onnx       the model exported to ONNX and run with ONNX Runtime
+    onnx-int8  the ONNX export with ONNX Runtime's dynamic int8 quantization
+
+The converted encoder keeps the call signature of the Hugging Face model, so bert_score and
+COMET use it unchanged. Only the encoder is converted; COMET's estimator stays in fp32.
+Quantized scores drift slightly from fp32, and since dynamic quantization picks its activation
+scales per batch they also vary slightly with the batch a sample is scored in;
+source/validate_neural_backend.py measures the drift on the gold set. ONNX exports are written once to cache/onnx/ and reused; delete a file
+to export it again.
+
+Needs onnxruntime for the onnx backends.
+"""
+
+import logging
+import os
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = "cache/onnx"
+OPSET = 17
+
+
+def convert_encoder(model, backend, name, hidden_states=False, export_dir=EXPORT_DIR):
+    """
+    Returns `model` (a Hugging Face encoder) converted to run on the CPU with `backend`.
+
+    Args:
+        name (str): File name of the ONNX export, unique per model and layer count.
+        hidden_states (bool): Whether callers ask for every layer's output (COMET's layerwise
+            attention) or only the last one (BERTScore, whose model is already cut at its layer).
+    """
+    if backend == "fp32":
+        return model
+    model = model.cpu().eval()
+    if backend == "int8":
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend in ("onnx", "onnx-int8"):
+        path = export_onnx(model, name, hidden_states, export_dir)
+        if backend == "onnx-int8":
+            path = quantize_onnx(path)
+        return OnnxEncoder(path, hidden_states, model.config)
+    raise ValueError(f"Unknown neural backend {backend}")
+
+
+class _Exportable(torch.nn.Module):
+    # the outputs the metrics read, as plain tensors the exporter can trace
+    def __init__(self, model, hidden_states):
+        super().__init__()
+        self.model = model
+        self.hidden_states = hidden_states
+
+    def forward(self, input_ids, attention_mask):
+        output = self.model(input_ids=input_ids, attention_mask=attention_mask,
+                            output_hidden_states=self.hidden_states, return_dict=True)
+        if self.hidden_states:
+            return output.last_hidden_state, torch.stack(output.hidden_states)
+        return output.last_hidden_state
+
+
+def export_onnx(model, name, hidden_states, export_dir=EXPORT_DIR):
+    """Exports `model` to export_dir/<name>.onnx unless it is already there, and returns the path."""
+    path = os.path.join(export_dir, f"{name}.onnx")
+    if os.path.exists(path):
+        return path
+    os.makedirs(export_dir, exist_ok=True)
+    logger.info(f"Exporting {name} to {path}")
+
+    output_names = ["last_hidden_state"] + (["hidden_states"] if hidden_states else [])
+    dynamic_axes = {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+                    "last_hidden_state": {0: "batch", 1: "sequence"}}
+    if hidden_states:
+        dynamic_axes["hidden_states"] = {1: "batch", 2: "sequence"}
+    dummy = torch.ones((2, 8), dtype=torch.long)
+
+    # export next to the final file and rename, so a shard never reads a half-written export
+    temporary = os.path.join(export_dir, f"{name}.{os.getpid()}.tmp")
+    os.makedirs(temporary, exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(_Exportable(model, hidden_states), (dummy, dummy), os.path.join(temporary, "model.onnx"),
+                          input_names=["input_ids", "attention_mask"], output_names=output_names,
+                          dynamic_axes=dynamic_axes, opset_version=OPSET, dynamo=False)
+    _save_single_file(os.path.join(temporary, "model.onnx"), path)
+    return path
+
+
+def quantize_onnx(path):
+    """Writes the dynamic int8 quantization of the ONNX model at `path` next to it, once, and returns its path."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized = path[:-len(".onnx")] + ".int8.onnx"
+    if not os.path.exists(quantized):
+        logger.info(f"Quantizing {path} to {quantized}")
+        temporary = f"{quantized}.{os.getpid()}.tmp"
+        quantize_dynamic(path, temporary, weight_type=QuantType.QInt8)
+        os.replace(temporary, quantized)
+    return quantized
+
+
+def _save_single_file(source, path):
+    # the exporter writes the weights of models over 2 GB (XLM-R large) to one file per tensor;
+    # gather them into a single <name>.onnx.data next to the model
+    import shutil
+
+    import onnx
+
+    directory = os.path.dirname(source)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    if len(os.listdir(directory)) > 1:
+        onnx.save_model(onnx.load(source), temporary, save_as_external_data=True, all_tensors_to_one_file=True,
+                        location=os.path.basename(path) + ".data")
+        os.replace(temporary, path)
+    else:
+        os.replace(source, path)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+class OnnxEncoder(torch.nn.Module):
+    """Runs an exported encoder with ONNX Runtime behind the call signature of the Hugging Face model."""
+
+    def __init__(self, path, hidden_states=False, config=None):
+        super().__init__()
+        import onnxruntime
+
+        self.path = path
+        self.hidden_states = hidden_states
+        # COMET reads the layer count and maximum length from the model config
+        self.config = config
+        self.session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        # bert_score and COMET find the device from the model's parameters
+        self.device_anchor = torch.nn.Parameter(torch.empty(0), requires_grad=False)
+
+    def forward(self, input_ids, attention_mask=None, token_type_ids=None, output_hidden_states=False,
+                return_dict=False, **kwargs):
+        if token_type_ids is not None and bool(token_type_ids.any()):
+            raise ValueError(f"{self.path} was exported without token_type_ids")
+        if output_hidden_states and not self.hidden_states:
+            raise ValueError(f"{self.path} was exported without the hidden states of every layer")
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        outputs = self.session.run(None, {"input_ids": input_ids.cpu().numpy().astype(np.int64),
+                                          "attention_mask": attention_mask.cpu().numpy().astype(np.int64)})
+        last_hidden_state = torch.from_numpy(outputs[0]).to(input_ids.device)
+        if not output_hidden_states:
+            return (last_hidden_state,)
+        # (last hidden state, pooler output, hidden states); the exported encoders have no pooler
+        return last_hidden_state, None, tuple(torch.from_numpy(outputs[1]).to(input_ids.device))
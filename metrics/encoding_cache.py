@@ -0,0 +1,128 @@
+"""
+Cache of text encodings for the neural metrics.
+
+Every prediction is scored against the same handful of gold references and English
+sources, so evaluation.py used to encode each of them about 60 times per run. The cache
+keeps one encoding per (model, text hash): BERTScore token embeddings (with their idf
+weights) and COMET sentence embeddings. Encodings are held in memory for the run and
+persisted to a SQLite file, so later runs only encode texts they have not seen before.
+
+The model string in the key must change whenever the encoding would (model name, layer,
+pooling...), otherwise stale encodings would be reused.
+
+As with the score cache, each shard of a sharded run writes its own file and reads the run's
+cache through `base`; source/merge_results.py folds the shard files into it with merge().
+"""
+
+import hashlib
+import io
+import os
+import pathlib
+import sqlite3
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _open_base(path):
+    """Opens an existing cache file read-only and without locking, or returns None."""
+    if not path or not os.path.exists(path):
+        return None
+    return sqlite3.connect(pathlib.Path(path).resolve().as_uri() + "?immutable=1", uri=True)
+
+
+class EncodingCache:
+    def __init__(self, path=None, base=None):
+        self.path = path
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.computed = 0
+
+        self._memory = {}
+        self._connection = None
+        self._base = _open_base(base)
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(path)
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS encodings (
+                       model TEXT NOT NULL,
+                       text_hash TEXT NOT NULL,
+                       encoding BLOB NOT NULL,
+                       PRIMARY KEY (model, text_hash)
+                   )"""
+            )
+            self._connection.commit()
+
+    def encode(self, model, texts, encode_fn):
+        """
+        Returns the encoding of each text, in order. Texts that are neither in memory nor on
+        disk are passed to `encode_fn` (list of texts -> list of encodings) in a single call.
+        """
+        keys = [(model, text_hash(text)) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in self._memory:
+                self.memory_hits += 1
+            elif key not in missing:
+                stored = self._load(key)
+                if stored is None:
+                    missing[key] = text
+                else:
+                    self._memory[key] = stored
+                    self.disk_hits += 1
+
+        if missing:
+            encodings = encode_fn(list(missing.values()))
+            for key, encoding in zip(missing, encodings):
+                self._memory[key] = encoding
+                self._store(key, encoding)
+            self.computed += len(missing)
+            if self._connection is not None:
+                self._connection.commit()
+        return [self._memory[key] for key in keys]
+
+    def _load(self, key):
+        row = None
+        for connection in (self._connection, self._base):
+            if connection is not None and row is None:
+                row = connection.execute(
+                    "SELECT encoding FROM encodings WHERE model = ? AND text_hash = ?", key
+                ).fetchone()
+        if row is None:
+            return None
+        import torch
+        return torch.load(io.BytesIO(row[0]), weights_only=True)
+
+    def _store(self, key, encoding):
+        if self._connection is None:
+            return
+        import torch
+        buffer = io.BytesIO()
+        torch.save(encoding, buffer)
+        self._connection.execute("INSERT OR REPLACE INTO encodings VALUES (?, ?, ?)", (*key, buffer.getvalue()))
+
+    def merge(self, paths):
+        """Copies the encodings of the cache files `paths` (e.g. a sharded run's) into this cache; returns how many."""
+        merged = 0
+        for path in paths:
+            self._connection.execute("ATTACH DATABASE ? AS other", (path,))
+            try:
+                merged += self._connection.execute(
+                    "INSERT OR REPLACE INTO encodings SELECT * FROM other.encodings").rowcount
+                self._connection.commit()
+            finally:
+                self._connection.execute("DETACH DATABASE other")
+        return merged
+
+    def stats(self):
+        return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "computed": self.computed}
+
+    def close(self):
+        for connection in (self._connection, self._base):
+            if connection is not None:
+                connection.close()
+        self._connection = self._base = None
@@ -0,0 +1,225 @@
+"""
+Per-sample ROUGE, BLEU and chrF.
+
+BLEU and chrF are corpus-level metrics: a group's score is computed from the sum of its
+sentences' match statistics. ROUGE reports the bootstrap mid of the sentences' scores.
+Computing those per-sample pieces separately from the aggregation lets evaluation.py cache
+them per sample and only score new responses. The settings are the ones the `evaluate`
+wrappers used (sacrebleu.corpus_bleu defaults, chrF++ with word_order=2 and lowercase,
+ROUGE through rouge_score with the language's tokenizer), so aggregating the cached
+pieces gives the same numbers as calling the metrics on the whole group.
+
+The per-sample pieces are pure-CPU Python work, so LexicalPool can spread them over a
+process pool. Samples are sent in shards of whole groups of one language; each worker
+builds its tokenizers and metrics once and keeps them for every shard it scores. Every
+piece depends only on its own sample, so the results are identical to the serial path.
+
+ROUGE and BLEU share the memoized tokenizers of metrics/tokenizers.py, and the BLEU and
+chrF metrics are built once per process, so no SentencePiece model is loaded per group.
+
+Two backends compute the pieces: "sacrebleu" (sacrebleu and rouge_score themselves) and
+"numpy" (metrics/ngram_engine.py, vectorized over a whole shard). They produce the same
+values, so the score cache does not distinguish them.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import time
+from importlib import metadata
+
+import numpy as np
+
+from rouge_score import scoring
+from sacrebleu.metrics import BLEU, CHRF
+from sacrebleu.utils import sum_of_lists
+
+from metrics import ngram_engine
+from metrics.tokenizers import get_tokenizer, tokenizer_name
+
+ROUGE_TYPES = ["rouge1", "rouge2", "rougeL"]
+BACKENDS = ["sacrebleu", "numpy"]
+
+
+def package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+# identify the metric settings in the score cache; change them whenever the scores would change
+ROUGE_VERSION = f"rouge_score=={package_version('rouge-score')}|types={','.join(ROUGE_TYPES)}|stemmer=0"
+BLEU_VERSION = f"sacrebleu=={package_version('sacrebleu')}|smooth=exp|case=mixed|eff=no"
+CHRF_VERSION = f"sacrebleu=={package_version('sacrebleu')}|chrF|char_order=6|word_order=2|beta=2|case=lc"
+
+
+class EvaluationTokenizer:
+    def set_tokenizer_function(self, language):
+        # the process-wide tokenizer, shared with BLEU
+        return get_tokenizer(tokenizer_name(language))
+
+    def __init__(self, language):
+        self.tokenizer_function = self.set_tokenizer_function(language)
+
+    def tokenize(self, text):
+        return self.tokenizer_function(text)
+
+
+class _Tokenizer:
+    # rouge_score expects an object with a tokenize method
+    def __init__(self, tokenizer_function):
+        self.tokenizer_function = tokenizer_function
+
+    def tokenize(self, text):
+        return self.tokenizer_function(text)
+
+
+# metrics of this process, built on first use; in a pool they live as long as the worker
+_bleu_metrics = {}
+_chrf_metrics = []
+
+
+def bleu_metric(tokenize):
+    # the metric sacrebleu.corpus_bleu builds for evaluate's sacrebleu wrapper, with the shared
+    # tokenizer in place of the one BLEU would build ("none" builds nothing worth loading)
+    if tokenize not in _bleu_metrics:
+        metric = BLEU(tokenize="none")
+        metric.tokenizer = get_tokenizer(tokenize)
+        metric.tokenizer_signature = metric.tokenizer.signature()
+        _bleu_metrics[tokenize] = metric
+    return _bleu_metrics[tokenize]
+
+
+def chrf_metric():
+    if not _chrf_metrics:
+        _chrf_metrics.append(CHRF(word_order=2, lowercase=True))
+    return _chrf_metrics[0]
+
+
+def rouge_samples(hypotheses, references, tokenizer_function):
+    """Returns {rouge_type: [precision, recall, fmeasure]} for each hypothesis/reference pair."""
+    # imported here: rouge_scorer pulls in nltk, which a run without ROUGE does not need
+    from rouge_score import rouge_scorer
+
+    scorer = rouge_scorer.RougeScorer(rouge_types=ROUGE_TYPES, use_stemmer=False,
+                                      tokenizer=_Tokenizer(tokenizer_function))
+    samples = []
+    for reference, hypothesis in zip(references, hypotheses):
+        score = scorer.score(reference, hypothesis)
+        samples.append({key: list(score[key]) for key in ROUGE_TYPES})
+    return samples
+
+
+def rouge_seed(key):
+    """A bootstrap seed derived from a group key, so a group's ROUGE does not depend on what was scored before it."""
+    return int(hashlib.sha256(json.dumps(list(key), default=str).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def rouge_aggregate(samples, seed=None):
+    """
+    Returns {rouge_type: mid fmeasure} for a group, as evaluate's ROUGE does with use_aggregator.
+    rouge_score resamples with NumPy's global generator; `seed` makes the result reproducible.
+    """
+    if seed is not None:
+        np.random.seed(seed)
+    aggregator = scoring.BootstrapAggregator()
+    for sample in samples:
+        aggregator.add_scores({key: scoring.Score(*sample[key]) for key in ROUGE_TYPES})
+    result = aggregator.aggregate()
+    return {key: result[key].mid.fmeasure for key in ROUGE_TYPES}
+
+
+def corpus_statistics(metric, hypotheses, references):
+    """Returns the sacrebleu match statistics of each hypothesis against its reference."""
+    return metric._extract_corpus_statistics(hypotheses, [references])
+
+
+def corpus_score(metric, statistics):
+    """Returns the corpus score from the per-sample statistics of a group."""
+    return metric._compute_score_from_stats(sum_of_lists(statistics)).score
+
+
+def bleu_score(statistics):
+    """Returns the BLEU of summed per-sample statistics; the tokenizer only matters when extracting them."""
+    if None not in _bleu_metrics:
+        _bleu_metrics[None] = BLEU(tokenize="none")
+    return corpus_score(_bleu_metrics[None], statistics)
+
+
+def chrf_score(statistics):
+    """Returns the chrF of summed per-sample statistics."""
+    return corpus_score(chrf_metric(), statistics)
+
+
+def score_shard(metric, language, tokenizer_string, hypotheses, references, backend="sacrebleu"):
+    """
+    Returns the per-sample pieces of `metric` ("rouge", "bleu" or "chrf") for one shard of
+    samples, computed with `backend` (one of BACKENDS).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown lexical backend: {backend}")
+    numpy = backend == "numpy"
+    if metric == "rouge":
+        tokenizer_function = EvaluationTokenizer(language).tokenize
+        if numpy:
+            return ngram_engine.rouge_scores(hypotheses, references, tokenizer_function, ROUGE_TYPES)
+        return rouge_samples(hypotheses, references, tokenizer_function)
+    if metric == "bleu":
+        if numpy:
+            return ngram_engine.bleu_statistics(hypotheses, references, get_tokenizer(tokenizer_string))
+        return corpus_statistics(bleu_metric(tokenizer_string), hypotheses, references)
+    if metric == "chrf":
+        if numpy:
+            return ngram_engine.chrf_statistics(hypotheses, references, chrf_metric())
+        return corpus_statistics(chrf_metric(), hypotheses, references)
+    raise ValueError(f"Unknown lexical metric: {metric}")
+
+
+def _timed_score_shard(*task):
+    # score_shard and its time, measured where it runs
+    start = time.time()
+    pieces = score_shard(*task)
+    return pieces, time.time() - start
+
+
+class LexicalPool:
+    """
+    Scores shards of samples with score_shard, in `workers` processes or, with one worker,
+    in this process.
+
+    Workers are forked when the pool is created, so create it before loading the neural
+    metric models to keep them small.
+    """
+
+    def __init__(self, workers=1, backend="sacrebleu"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown lexical backend: {backend}")
+        self.workers = max(1, workers or 1)
+        self.backend = backend
+        self._pool = None
+        if self.workers > 1:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in methods else None)
+            self._pool = context.Pool(self.workers)
+
+    def score(self, metric, shards, timings=None):
+        """
+        `shards` is a list of (language, tokenizer_string, hypotheses, references); returns
+        the per-sample pieces of each shard, in order. If `timings` is given, the seconds each
+        shard took (in its worker) are appended to it as (language, seconds, samples).
+        """
+        tasks = [(metric, *shard, self.backend) for shard in shards]
+        if self._pool is None:
+            results = [_timed_score_shard(*task) for task in tasks]
+        else:
+            results = self._pool.starmap(_timed_score_shard, tasks, chunksize=1)
+        if timings is not None:
+            timings.extend((shard[0], seconds, len(shard[2])) for shard, (_, seconds) in zip(shards, results))
+        return [pieces for pieces, _ in results]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
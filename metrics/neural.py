@@ -0,0 +1,331 @@
+"""
+Corpus-wide scoring for the neural metrics (BERTScore and COMET).
+
+evaluation.py used to call the metrics once per (service, language, disaster, prompt)
+group of about five predictions, so the models never saw a full batch. These helpers
+take every sample of the run at once, score them in batches of `batch_size`, and return
+one score per sample in input order; evaluation.py scatters them back to their groups.
+
+BERTScore picks its model from `lang`, so samples are bucketed by language code and each
+bucket is scored in one call. COMET uses the same model for every language and scores
+the whole corpus in one call.
+
+With an EncodingCache (metrics/encoding_cache.py) the reference side of BERTScore and the
+source and reference side of COMET are encoded once per (model, text) and reused across
+predictions and runs; only the hypotheses are encoded per prediction. The scores are
+computed with the same bert_score and COMET functions the metrics use internally.
+
+`backend` runs the encoders on the CPU in int8 and/or with ONNX Runtime (metrics/cpu_backend.py)
+instead of the fp32 PyTorch models; it is part of every version string and encoding cache
+key, so scores of different backends are never mixed.
+
+Where the encoders are called from here (the cached paths), texts are sorted by tokenized
+length and batched under a budget of `max_tokens` padded tokens (at most `batch_size` texts)
+instead of a fixed number of texts, so short Latin-script alerts are not padded to the length
+of a Burmese or Amharic one; scores are scattered back to input order. batching_stats()
+reports the fill (real over padded tokens) and samples per second of each encoder.
+"""
+
+import time
+from collections import defaultdict
+
+from metrics.lexical import package_version
+
+BACKENDS = ["fp32", "int8", "onnx", "onnx-int8"]
+
+# BERTScorer instances by (model_type, num_layers, backend), shared by every language that maps to the same model
+_bertscorers = {}
+# BatchStats by encoder, for this process
+_batch_stats = defaultdict(lambda: BatchStats())
+# seconds spent loading or converting each model in this process
+_model_loads = {}
+
+
+def token_batches(lengths, max_tokens, max_samples=None):
+    """
+    Returns batches of indices into `lengths` (tokens per text), longest first, each as large as fits
+    in `max_tokens` once padded to its longest text and at most `max_samples` long. A text longer
+    than the budget gets a batch of its own.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches, batch = [], []
+    for index in order:
+        # the first text of a batch is its longest, so it sets the padded length
+        if batch and ((len(batch) + 1) * lengths[batch[0]] > max_tokens or len(batch) == max_samples):
+            batches.append(batch)
+            batch = []
+        batch.append(index)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class BatchStats:
+    """Real and padded tokens, samples and encoder time of the batches of one encoder."""
+
+    def __init__(self):
+        self.batches = 0
+        self.samples = 0
+        self.tokens = 0
+        self.padded_tokens = 0
+        self.seconds = 0.0
+
+    def add(self, lengths, seconds):
+        self.batches += 1
+        self.samples += len(lengths)
+        self.tokens += sum(lengths)
+        self.padded_tokens += len(lengths) * max(lengths)
+        self.seconds += seconds
+
+    def summary(self):
+        return {
+            "batches": self.batches,
+            "samples": self.samples,
+            "fill": self.tokens / self.padded_tokens if self.padded_tokens else 1.0,
+            "samples_per_second": self.samples / self.seconds if self.seconds else 0.0,
+        }
+
+
+def batching_stats():
+    """Returns {encoder: {batches, samples, fill, samples_per_second}} of the batches run in this process."""
+    return {name: stats.summary() for name, stats in _batch_stats.items()}
+
+
+def model_load_stats():
+    """
+    Returns {model: seconds} spent loading the BERTScore models and converting models to a CPU
+    backend in this process. The metrics load these lazily, inside their first scoring call.
+    """
+    return dict(_model_loads)
+
+
+def bertscore_samples(bertscore, predictions, references, langs, batch_size=64, cache=None, backend="fp32",
+                      max_tokens=8192, timings=None):
+    """
+    Returns {"precision": [...], "recall": [...], "f1": [...]} with one value per sample.
+
+    Args:
+        bertscore: The loaded `evaluate` BERTScore metric.
+        predictions, references (list): Hypothesis and reference text of each sample.
+        langs (list): Language code each sample is scored with.
+        cache (EncodingCache): Reuses reference embeddings when given.
+        backend (str): One of BACKENDS; anything but fp32 runs on the CPU.
+        max_tokens (int): Padded tokens per batch of the cached path.
+        timings (list): If given, (lang, seconds, samples) of each bucket is appended to it.
+    """
+    buckets = defaultdict(list)
+    for index, lang in enumerate(langs):
+        buckets[lang].append(index)
+
+    scores = {key: [None] * len(predictions) for key in ("precision", "recall", "f1")}
+    for lang, indices in buckets.items():
+        start = time.time()
+        bucket_predictions = [predictions[i] for i in indices]
+        bucket_references = [references[i] for i in indices]
+        if cache is None and backend == "fp32":
+            result = bertscore.compute(predictions=bucket_predictions, references=bucket_references,
+                                       lang=lang, batch_size=batch_size)
+        elif cache is None:
+            P, R, F1 = _bertscorer(lang, batch_size, backend).score(bucket_predictions, bucket_references,
+                                                                     batch_size=batch_size)
+            result = {"precision": P.tolist(), "recall": R.tolist(), "f1": F1.tolist()}
+        else:
+            result = _cached_bertscore(_bertscorer(lang, batch_size, backend), bucket_predictions, bucket_references,
+                                       cache, batch_size, backend, max_tokens)
+        for key in scores:
+            for index, value in zip(indices, result[key]):
+                scores[key][index] = value
+        if timings is not None:
+            timings.append((lang, time.time() - start, len(indices)))
+    return scores
+
+
+def bertscore_version(lang, backend="fp32"):
+    """Identifies the BERTScore model and settings `lang` is scored with, for the score cache."""
+    from bert_score.utils import lang2model, model2layers
+    model_type = lang2model[lang.lower()]
+    return (f"bert_score=={package_version('bert-score')}|{model_type}|layer{model2layers[model_type]}|idf=0"
+            + _backend_suffix(backend))
+
+
+def comet_version(comet, backend="fp32"):
+    """Identifies the COMET checkpoint, for the score cache."""
+    return f"comet=={package_version('unbabel-comet')}|{getattr(comet, 'config_name', 'default')}" + _backend_suffix(backend)
+
+
+def _backend_suffix(backend):
+    # fp32 keeps the versions it had before there were backends, so existing caches stay valid
+    return "" if backend == "fp32" else f"|{backend}"
+
+
+def _export_name(*parts):
+    return "-".join(str(part).replace("/", "--") for part in parts)
+
+
+def _bertscorer(lang, batch_size, backend="fp32"):
+    # the same model and layer `evaluate`'s BERTScore picks for `lang`
+    from bert_score import BERTScorer
+    from bert_score.utils import lang2model, model2layers
+
+    model_type = lang2model[lang.lower()]
+    num_layers = model2layers[model_type]
+    if (model_type, num_layers, backend) not in _bertscorers:
+        start = time.time()
+        scorer = BERTScorer(model_type=model_type, num_layers=num_layers, lang=lang, batch_size=batch_size,
+                            device=None if backend == "fp32" else "cpu")
+        if backend != "fp32":
+            from metrics.cpu_backend import convert_encoder
+            scorer._model = convert_encoder(scorer._model, backend, _export_name("bertscore", model_type, f"layer{num_layers}"))
+        _bertscorers[(model_type, num_layers, backend)] = scorer
+        _model_loads[f"bertscore:{model_type}:{backend}"] = time.time() - start
+    return _bertscorers[(model_type, num_layers, backend)]
+
+
+def _cached_bertscore(scorer, predictions, references, cache, batch_size, backend="fp32", max_tokens=8192):
+    # follows bert_score.utils.bert_cos_score_idf, with the reference embeddings coming from the cache
+    import torch
+    from bert_score.utils import get_bert_embedding, greedy_cos_idf, sent_encode
+    from torch.nn.utils.rnn import pad_sequence
+
+    idf_dict = defaultdict(lambda: 1.0)
+    idf_dict[scorer._tokenizer.sep_token_id] = 0
+    idf_dict[scorer._tokenizer.cls_token_id] = 0
+    model_id = f"bertscore:{scorer.model_type}:layer{scorer.num_layers}" + _backend_suffix(backend).replace("|", ":")
+
+    def embed(sentences):
+        lengths = [len(sent_encode(scorer._tokenizer, sentence)) for sentence in sentences]
+        stats = [None] * len(sentences)
+        for batch in token_batches(lengths, max_tokens, batch_size):
+            start = time.time()
+            embs, masks, padded_idf = get_bert_embedding([sentences[i] for i in batch], scorer._model,
+                                                         scorer._tokenizer, idf_dict, device=scorer.device)
+            embs, masks, padded_idf = embs.cpu(), masks.cpu(), padded_idf.cpu()
+            _batch_stats[model_id].add([lengths[i] for i in batch], time.time() - start)
+            for row, i in enumerate(batch):
+                sequence_len = masks[row].sum().item()
+                stats[i] = (embs[row, :sequence_len].clone(), padded_idf[row, :sequence_len].clone())
+        return stats
+
+    def pad_batch_stats(stats, device):
+        emb = [e.to(device) for e, _ in stats]
+        idf = [i.to(device) for _, i in stats]
+        lens = torch.tensor([e.size(0) for e in emb], dtype=torch.long)
+        emb_pad = pad_sequence(emb, batch_first=True, padding_value=2.0)
+        idf_pad = pad_sequence(idf, batch_first=True)
+        pad_mask = torch.arange(int(lens.max()), dtype=torch.long).expand(len(lens), int(lens.max())) < lens.unsqueeze(1)
+        return emb_pad, pad_mask.to(device), idf_pad
+
+    ref_stats = cache.encode(model_id, references, embed)
+
+    unique_predictions = list(dict.fromkeys(predictions))
+    hyp_by_text = dict(zip(unique_predictions, embed(unique_predictions)))
+    hyp_stats = [hyp_by_text[text] for text in predictions]
+
+    # the pairs are padded to their longer side, so they are batched by it
+    device = torch.device(scorer.device)
+    lengths = [max(ref[0].size(0), hyp[0].size(0)) for ref, hyp in zip(ref_stats, hyp_stats)]
+    results = {key: [None] * len(predictions) for key in ("precision", "recall", "f1")}
+    with torch.no_grad():
+        for batch in token_batches(lengths, max_tokens, batch_size):
+            P, R, F1 = greedy_cos_idf(*pad_batch_stats([ref_stats[i] for i in batch], device),
+                                      *pad_batch_stats([hyp_stats[i] for i in batch], device))
+            for key, values in zip(("precision", "recall", "f1"), (P, R, F1)):
+                for i, value in zip(batch, values.cpu().tolist()):
+                    results[key][i] = value
+    return results
+
+
+def comet_samples(comet, predictions, references, sources, batch_size=64, gpus=None, cache=None, backend="fp32",
+                  max_tokens=8192):
+    """
+    Returns the COMET score of each sample, reusing source and reference encodings from `cache` if given.
+    With a `backend` other than fp32 the checkpoint's encoder is converted in place on first use
+    and scoring runs on the CPU.
+    """
+    if not predictions:
+        return []
+
+    scorer = getattr(comet, "scorer", None)
+    if scorer is None:
+        if backend != "fp32":
+            raise ValueError(f"The {backend} backend needs the COMET metric loaded through evaluate")
+        # the metric module was not loaded through `evaluate`; let it pick its own batch size
+        return list(comet.compute(predictions=predictions, references=references, sources=sources)["scores"])
+    _convert_comet(comet, scorer, backend)
+
+    if cache is not None and _cacheable(scorer):
+        model_id = f"comet:{getattr(comet, 'config_name', 'default')}" + _backend_suffix(backend).replace("|", ":")
+        return _cached_comet(scorer, model_id, predictions, references, sources, cache, batch_size,
+                             cuda=backend == "fp32", max_tokens=max_tokens)
+
+    if backend != "fp32":
+        gpus = 0
+    if gpus is None:
+        import torch
+        gpus = 1 if torch.cuda.is_available() else 0
+    data = [{"src": src, "mt": mt, "ref": ref} for src, mt, ref in zip(sources, predictions, references)]
+    return list(scorer.predict(data, batch_size=batch_size, gpus=gpus, progress_bar=False).scores)
+
+
+def _convert_comet(comet, scorer, backend):
+    # the scorer is converted in place, once; a second backend needs a second `load("comet")`
+    converted = getattr(scorer, "neural_backend", "fp32")
+    if converted == backend:
+        return
+    if converted != "fp32":
+        raise ValueError(f"This COMET metric already runs on the {converted} backend, not {backend}")
+    from metrics.cpu_backend import convert_encoder
+    start = time.time()
+    scorer.cpu()
+    scorer.encoder.model = convert_encoder(scorer.encoder.model, backend,
+                                           _export_name("comet", getattr(comet, "config_name", "default")),
+                                           hidden_states=True)
+    scorer.neural_backend = backend
+    _model_loads[f"comet:{getattr(comet, 'config_name', 'default')}:{backend}"] = time.time() - start
+
+
+def _cacheable(model):
+    # reference-based regression models (e.g. wmt22-comet-da) encode src, mt and ref independently;
+    # models that encode them jointly (XCOMET, unified metrics) can't reuse a cached side
+    from comet.models import RegressionMetric
+    return type(model) is RegressionMetric
+
+
+def _cached_comet(model, model_id, predictions, references, sources, cache, batch_size, cuda=True, max_tokens=8192):
+    # follows RegressionMetric.forward, with the source and reference embeddings coming from the cache
+    import torch
+
+    model.eval()
+    if cuda and torch.cuda.is_available():
+        model.to("cuda")
+    device = next(model.parameters()).device
+
+    def embed(texts):
+        lengths = [len(ids) for ids in model.encoder.tokenizer(texts, truncation=True,
+                                                                max_length=model.encoder.max_positions - 2)["input_ids"]]
+        embeddings = [None] * len(texts)
+        with torch.no_grad():
+            for batch in token_batches(lengths, max_tokens, batch_size):
+                start = time.time()
+                inputs = model.encoder.prepare_sample([texts[i] for i in batch])
+                sentence_embeddings = model.compute_sentence_embedding(inputs["input_ids"].to(device),
+                                                                       inputs["attention_mask"].to(device))
+                for i, row in zip(batch, sentence_embeddings.cpu()):
+                    embeddings[i] = row.clone()
+                _batch_stats[model_id].add([lengths[i] for i in batch], time.time() - start)
+        return embeddings
+
+    src_embeddings = cache.encode(model_id, sources, embed)
+    ref_embeddings = cache.encode(model_id, references, embed)
+    mt_embeddings = embed(predictions)
+
+    # sentence embeddings have one size, so the estimator needs no length batching
+    scores = []
+    with torch.no_grad():
+        for start in range(0, len(predictions), batch_size):
+            end = start + batch_size
+            mt = torch.stack(mt_embeddings[start:end]).to(device)
+            src = torch.stack(src_embeddings[start:end]).to(device)
+            ref = torch.stack(ref_embeddings[start:end]).to(device)
+            scores.extend(model.estimate(src, mt, ref).score.cpu().tolist())
+    return scores
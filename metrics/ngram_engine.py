@@ -0,0 +1,169 @@
+"""
+NumPy n-gram engine for BLEU, chrF++ and ROUGE-1/2/L.
+
+sacrebleu and rouge_score count n-grams with a Counter per sentence and compare them in
+Python loops. This engine produces the same per-sample pieces (see metrics/lexical.py)
+for a whole shard at once:
+
+    - tokens or characters are mapped to integer ids, and every sentence of the shard,
+      hypotheses and references, is laid out in one id array
+    - n-grams of order n are packed into integers from the (n-1)-gram id and the next
+      unit id, and made dense again with np.unique so the ids never overflow
+    - (sentence, n-gram) keys are counted with np.unique, hypothesis and reference
+      counts are clipped with np.intersect1d/np.minimum, and summed per sentence with
+      np.bincount
+
+ROUGE-L is a longest common subsequence, which does not reduce to n-gram counts; it is
+computed with the bit-parallel LCS algorithm (Hyyrö 2004) on Python integers, one
+pass over the prediction per pair instead of the full dynamic-programming table.
+
+The counts are exact integers, so BLEU and chrF statistics are identical to sacrebleu's
+and ROUGE scores are computed from the same integers with the same formulas.
+"""
+
+import numpy as np
+from rouge_score import scoring
+
+
+def _layout(sequences, units):
+    # one id array for all sequences, with the sequence each position belongs to
+    lengths = np.fromiter((len(sequence) for sequence in sequences), dtype=np.int64, count=len(sequences))
+    ids = np.fromiter((units.setdefault(unit, len(units)) for sequence in sequences for unit in sequence),
+                      dtype=np.int64, count=int(lengths.sum()))
+    segments = np.repeat(np.arange(len(sequences), dtype=np.int64), lengths)
+    starts = np.cumsum(lengths) - lengths
+    positions = np.arange(len(ids), dtype=np.int64) - starts[segments]
+    return ids, segments, positions, lengths
+
+
+def ngram_statistics(hypotheses, references, max_order):
+    """
+    Counts the n-grams of each hypothesis/reference pair of unit sequences (lists of tokens
+    or strings of characters), for orders 1..max_order.
+
+    Returns three int64 arrays of shape (max_order, pairs): the hypothesis n-gram count, the
+    reference n-gram count, and the clipped match count of each pair.
+    """
+    pairs = len(hypotheses)
+    hyp_counts = np.zeros((max_order, pairs), dtype=np.int64)
+    ref_counts = np.zeros((max_order, pairs), dtype=np.int64)
+    matches = np.zeros((max_order, pairs), dtype=np.int64)
+    if pairs == 0:
+        return hyp_counts, ref_counts, matches
+
+    # hypotheses and references share one id space, references come after the hypotheses
+    units = {}
+    ids, segments, positions, lengths = _layout(list(hypotheses) + list(references), units)
+    is_reference = segments >= pairs
+    pair = np.where(is_reference, segments - pairs, segments)
+    vocabulary = max(len(units), 1)
+
+    grams = ids
+    for order in range(1, max_order + 1):
+        valid = positions + order <= lengths[segments]
+        if order > 1:
+            following = np.zeros_like(ids)
+            following[:len(ids) - order + 1] = ids[order - 1:]
+            packed = grams * vocabulary + following
+            grams = np.zeros_like(ids)
+            _, grams[valid] = np.unique(packed[valid], return_inverse=True)
+        if not valid.any():
+            break
+
+        distinct = int(grams[valid].max()) + 1
+        keys = pair * distinct + grams
+        hyp_keys, hyp_key_counts = np.unique(keys[valid & ~is_reference], return_counts=True)
+        ref_keys, ref_key_counts = np.unique(keys[valid & is_reference], return_counts=True)
+        common, in_hyp, in_ref = np.intersect1d(hyp_keys, ref_keys, assume_unique=True, return_indices=True)
+
+        row = order - 1
+        hyp_counts[row] = np.bincount(pair[valid & ~is_reference], minlength=pairs)
+        ref_counts[row] = np.bincount(pair[valid & is_reference], minlength=pairs)
+        clipped = np.minimum(hyp_key_counts[in_hyp], ref_key_counts[in_ref])
+        matches[row] = np.bincount(common // distinct, weights=clipped, minlength=pairs).astype(np.int64)
+    return hyp_counts, ref_counts, matches
+
+
+def bleu_statistics(hypotheses, references, tokenizer, max_order=4):
+    """Returns sacrebleu's BLEU statistics [hyp_len, ref_len, correct..., total...] of each pair."""
+    hyp_tokens = [tokenizer(hypothesis.rstrip()).split() for hypothesis in hypotheses]
+    ref_tokens = [tokenizer(reference.rstrip()).split() for reference in references]
+    hyp_counts, _, matches = ngram_statistics(hyp_tokens, ref_tokens, max_order)
+    return [
+        [len(hyp), len(ref)] + matches[:, index].tolist() + hyp_counts[:, index].tolist()
+        for index, (hyp, ref) in enumerate(zip(hyp_tokens, ref_tokens))
+    ]
+
+
+def chrf_statistics(hypotheses, references, metric):
+    """
+    Returns sacrebleu's chrF statistics ([hyp, ref, match] per character order, then per
+    word order) of each pair, with the settings of the sacrebleu CHRF `metric`.
+    """
+    hyp_lines = [metric._preprocess_segment(hypothesis) for hypothesis in hypotheses]
+    ref_lines = [metric._preprocess_segment(reference) for reference in references]
+
+    blocks = [ngram_statistics([line if metric.whitespace else "".join(line.split()) for line in hyp_lines],
+                               [line if metric.whitespace else "".join(line.split()) for line in ref_lines],
+                               metric.char_order)]
+    if metric.word_order > 0:
+        blocks.append(ngram_statistics([metric._remove_punctuation(line) for line in hyp_lines],
+                                       [metric._remove_punctuation(line) for line in ref_lines],
+                                       metric.word_order))
+
+    hyp_counts = np.concatenate([block[0] for block in blocks])
+    ref_counts = np.concatenate([block[1] for block in blocks])
+    matches = np.concatenate([block[2] for block in blocks])
+    # sacrebleu does not count hypothesis n-grams of an order the reference has none of
+    hyp_counts = np.where(ref_counts > 0, hyp_counts, 0)
+    statistics = np.stack([hyp_counts, ref_counts, matches], axis=1)    # (orders, 3, pairs)
+    return [statistics[:, :, index].reshape(-1).tolist() for index in range(len(hypotheses))]
+
+
+def lcs_length(a, b):
+    """Length of the longest common subsequence of two sequences (bit-parallel, Hyyrö 2004)."""
+    if not a or not b:
+        return 0
+    masks = {}
+    for index, unit in enumerate(a):
+        masks[unit] = masks.get(unit, 0) | (1 << index)
+    full = (1 << len(a)) - 1
+    v = full
+    for unit in b:
+        u = v & masks.get(unit, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - bin(v).count("1")
+
+
+def _score(match, prediction_count, target_count):
+    # rouge_score's _score_ngrams
+    precision = match / max(prediction_count, 1)
+    recall = match / max(target_count, 1)
+    return [precision, recall, scoring.fmeasure(precision, recall)]
+
+
+def rouge_scores(hypotheses, references, tokenizer_function, rouge_types):
+    """Returns {rouge_type: [precision, recall, fmeasure]} of each pair, as rouge_score computes them."""
+    hyp_tokens = [tokenizer_function(hypothesis) for hypothesis in hypotheses]
+    ref_tokens = [tokenizer_function(reference) for reference in references]
+    orders = [int(rouge_type[5:]) for rouge_type in rouge_types if rouge_type != "rougeL"]
+    hyp_counts, ref_counts, matches = ngram_statistics(hyp_tokens, ref_tokens, max(orders, default=1))
+
+    samples = []
+    for index, (hyp, ref) in enumerate(zip(hyp_tokens, ref_tokens)):
+        sample = {}
+        for rouge_type in rouge_types:
+            if rouge_type == "rougeL":
+                if not ref or not hyp:
+                    sample[rouge_type] = [0, 0, 0]
+                    continue
+                lcs = lcs_length(ref, hyp)
+                precision = lcs / len(hyp)
+                recall = lcs / len(ref)
+                sample[rouge_type] = [precision, recall, scoring.fmeasure(precision, recall)]
+            else:
+                row = int(rouge_type[5:]) - 1
+                sample[rouge_type] = _score(int(matches[row, index]), int(hyp_counts[row, index]),
+                                            int(ref_counts[row, index]))
+        samples.append(sample)
+    return samples
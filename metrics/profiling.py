@@ -0,0 +1,222 @@
+"""
+Instrumentation of an evaluation run.
+
+EvaluationProfile records, for each phase of evaluation.py (loading data, loading models,
+scoring with each metric, aggregating, writing), its wall time, how often it ran and its peak
+memory: the peak resident set size, sampled every `interval` seconds in a background thread,
+and with `trace_memory` the peak of Python allocations traced by tracemalloc. tracemalloc
+does not see the native allocations of torch, so the RSS peak is the one to watch for the
+models. Metric time is also recorded per language.
+
+    profile = EvaluationProfile(trace_memory=True)
+    profile.start()
+    with profile.phase("load models"):
+        ...
+    profile.record("comet", "spanish", seconds, samples)
+    profile.stop()
+    profile.write("results/all_results_combined.profile.json")
+
+StackSampler and cProfile (see start_profiler) show where the time goes inside a phase.
+StackSampler writes the main thread's sampled stacks in the collapsed format of
+flamegraph.pl and speedscope; cProfile writes a .prof file for pstats or snakeviz. Both only
+see this process, not the --workers processes.
+"""
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+
+def rss_peak_bytes():
+    """The peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def rss_bytes():
+    """The resident set size of this process, or its peak where the current size can't be read."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return rss_peak_bytes()
+
+
+class EvaluationProfile:
+    def __init__(self, trace_memory=False, interval=0.1):
+        self.trace_memory = trace_memory
+        self.interval = interval
+        self.phases = {}
+        self.languages = {}
+        self.started = None
+        self.seconds = 0.0
+
+        self._active = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self.started = time.time()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._stopped.clear()
+        self._sampler = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if self.started is not None:
+            self.seconds = time.time() - self.started
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            self._update_peaks()
+
+    def _update_peaks(self):
+        rss = rss_bytes()
+        traced = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        with self._lock:
+            for phase in self._active:
+                phase["peak_rss"] = max(phase["peak_rss"], rss)
+                if traced is not None:
+                    phase["peak_traced"] = max(phase["peak_traced"] or 0, traced)
+
+    @contextmanager
+    def phase(self, name):
+        """Times the enclosed code as phase `name`; a phase entered again adds to its time and calls."""
+        phase = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0, "peak_rss": 0, "peak_traced": None})
+        # close the traced peak of the enclosing phases before restarting it for this one
+        self._update_peaks()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        with self._lock:
+            self._active.append(phase)
+        start = time.time()
+        try:
+            yield phase
+        finally:
+            phase["seconds"] += time.time() - start
+            phase["calls"] += 1
+            self._update_peaks()
+            with self._lock:
+                self._active.remove(phase)
+
+    def record(self, metric, language, seconds, samples):
+        """Adds one call of `metric` on `samples` samples of `language` that took `seconds`."""
+        entry = self.languages.setdefault(metric, {}).setdefault(language, {"seconds": 0.0, "calls": 0, "samples": 0})
+        entry["seconds"] += seconds
+        entry["calls"] += 1
+        entry["samples"] += samples
+
+    def report(self, **extra):
+        """The profile as a JSON-ready dict; `extra` entries (e.g. model loads, cache stats) are added as they are."""
+        report = {
+            "seconds": self.seconds or (time.time() - self.started if self.started else 0.0),
+            "peak_rss": rss_peak_bytes(),
+            "trace_memory": self.trace_memory,
+            "phases": self.phases,
+            "languages": self.languages,
+        }
+        report.update(extra)
+        return report
+
+    def write(self, path, **extra):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(**extra), f, indent=2)
+
+    def summary(self):
+        """One line per phase, slowest first, for the log."""
+        lines = []
+        for name, phase in sorted(self.phases.items(), key=lambda item: -item[1]["seconds"]):
+            line = (f"{name}: {phase['seconds']:.2f}s in {phase['calls']} calls, "
+                    f"peak RSS {phase['peak_rss'] / 2**20:.0f} MiB")
+            if phase["peak_traced"] is not None:
+                line += f", peak traced {phase['peak_traced'] / 2**20:.0f} MiB"
+            lines.append(line)
+        for metric, languages in self.languages.items():
+            slowest = sorted(languages.items(), key=lambda item: -item[1]["seconds"])[:5]
+            lines.append(f"{metric} slowest languages: "
+                         + ", ".join(f"{language} {entry['seconds']:.2f}s/{entry['samples']} samples"
+                                     for language, entry in slowest))
+        return lines
+
+
+class StackSampler:
+    """Samples the stack of the thread that creates it every `interval` seconds, for a flame graph."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._sample, name="stack-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        """Writes the collapsed stacks ("frame;frame;frame count" per line) flamegraph.pl and speedscope read."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def start_profiler(kind):
+    """Starts a "cprofile" or "stacks" profiler of this thread and returns it."""
+    if kind == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    if kind == "stacks":
+        profiler = StackSampler()
+        profiler.start()
+        return profiler
+    raise ValueError(f"Unknown profiler: {kind}")
+
+
+def stop_profiler(profiler, path_stem):
+    """Stops `profiler` and writes <path_stem>.prof (cProfile) or <path_stem>.folded (stacks); returns the path."""
+    if isinstance(profiler, StackSampler):
+        profiler.stop()
+        path = f"{path_stem}.folded"
+        profiler.write(path)
+        return path
+    profiler.disable()
+    path = f"{path_stem}.prof"
+    profiler.dump_stats(path)
+    return path
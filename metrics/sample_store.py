@@ -0,0 +1,178 @@
+"""
+Per-sample score store.
+
+The results CSV has one row per (service, language, disaster, prompt) group and keeps only
+aggregates (and the first prediction's BERTScore), so any other slice used to need a full
+evaluation rerun. evaluation.py now writes every sample's scores, with its full key, to a
+Parquet file, and the CSV is aggregated from it.
+
+Each row is one scored prediction: SERVICE, LANGUAGE, DISASTER, PROMPT, SAMPLE (its index
+in the group), DATE (its collection date), TEXT_HASH (sha256 of the prediction text) and
+TOKENIZER, then the per-sample pieces of every metric: ROUGE precision/recall/F, the
+sacrebleu statistics of BLEU and chrF (so corpus scores of any slice are exact), the
+BERTScore precision/recall/F1 and the COMET score. Metrics left out of a run
+(evaluation.py --metrics) have empty columns, and their aggregates are empty.
+
+    samples = read_samples("results/samples.parquet")
+    aggregate_samples(samples)                          # the results CSV
+    aggregate_samples(samples, by=["SERVICE", "DATE"])  # any other slice
+
+Writing and reading Parquet needs pyarrow.
+"""
+
+import os
+
+import pandas as pd
+
+from metrics.encoding_cache import text_hash
+from metrics.lexical import ROUGE_TYPES, bleu_score, chrf_metric, chrf_score, rouge_aggregate, rouge_seed
+
+GROUP_COLUMNS = ["SERVICE", "LANGUAGE", "DISASTER", "PROMPT"]
+KEY_COLUMNS = GROUP_COLUMNS + ["SAMPLE", "DATE", "TEXT_HASH", "TOKENIZER"]
+
+ROUGE_NAMES = dict(zip(ROUGE_TYPES, ["ROUGE-1", "ROUGE-2", "ROUGE-L"]))
+ROUGE_COLUMNS = {rouge_type: [f"{name}_{part}" for part in ("P", "R", "F")] for rouge_type, name in ROUGE_NAMES.items()}
+
+BLEU_ORDER = 4
+BLEU_COLUMNS = (["BLEU_HYP_LEN", "BLEU_REF_LEN"] + [f"BLEU_CORRECT_{n}" for n in range(1, BLEU_ORDER + 1)]
+                + [f"BLEU_TOTAL_{n}" for n in range(1, BLEU_ORDER + 1)])
+
+_chrf = chrf_metric()
+CHRF_COLUMNS = [f"CHRF_{unit}{n}_{part}"
+                for unit, orders in (("C", _chrf.char_order), ("W", _chrf.word_order))
+                for n in range(1, orders + 1)
+                for part in ("HYP", "REF", "MATCH")]
+
+BERTSCORE_COLUMNS = ["BERTScore_P", "BERTScore_R", "BERTScore_F1"]
+
+SAMPLE_COLUMNS = (KEY_COLUMNS + [column for columns in ROUGE_COLUMNS.values() for column in columns]
+                  + BLEU_COLUMNS + CHRF_COLUMNS + BERTSCORE_COLUMNS + ["COMET"])
+
+
+def gather_results(service, language, disaster, prompt, rouge_result, bertscore_result, bleu_result, comet_result, chrf_result, date=None):
+    return {
+        "SERVICE": service,
+        "LANGUAGE": language,
+        "DISASTER": disaster,
+        "PROMPT": prompt,
+        "ROUGE-1": rouge_result["rouge1"],
+        "ROUGE-2": rouge_result["rouge2"],
+        "ROUGE-L": rouge_result["rougeL"],
+        "BLEU": bleu_result["score"],
+        "BERTScore_P": bertscore_result["precision"][0],
+        "BERTScore_R": bertscore_result["recall"][0],
+        "BERTScore_F1": bertscore_result["f1"][0],
+        "COMET": comet_result["mean_score"],
+        "CHRF": chrf_result["score"],
+        "DATE": date
+    }
+
+
+def sample_frame(groups, values):
+    """
+    Returns one row per sample of `groups` (from evaluation.collect_groups/flatten_samples)
+    with the per-sample pieces in `values` ({metric: [value per sample]}).
+    """
+    rows = []
+    for group in groups:
+        start = group["first_sample"]
+        for sample, raw in enumerate(group["raw"]):
+            index = start + sample
+            row = {
+                "SERVICE": group["service"],
+                "LANGUAGE": group["language"],
+                "DISASTER": group["disaster"],
+                "PROMPT": group["prompt"],
+                "SAMPLE": sample,
+                "DATE": group["dates"][sample],
+                "TEXT_HASH": text_hash(raw),
+                "TOKENIZER": group["tokenizer_string"],
+            }
+            # a metric that was not run has None for every sample
+            if values["rouge"][index] is not None:
+                for rouge_type, columns in ROUGE_COLUMNS.items():
+                    row.update(zip(columns, values["rouge"][index][rouge_type]))
+            if values["bleu"][index] is not None:
+                row.update(zip(BLEU_COLUMNS, values["bleu"][index]))
+            if values["chrf"][index] is not None:
+                row.update(zip(CHRF_COLUMNS, values["chrf"][index]))
+            if values["bertscore"][index] is not None:
+                row.update(zip(BERTSCORE_COLUMNS, values["bertscore"][index]))
+            if values["comet"][index] is not None:
+                row["COMET"] = values["comet"][index]
+            rows.append(row)
+    return pd.DataFrame(rows, columns=SAMPLE_COLUMNS)
+
+
+def write_samples(samples, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    samples.to_parquet(path, index=False)
+
+
+def read_samples(path):
+    return pd.read_parquet(path)
+
+
+def _scored(frame, columns):
+    # False for a metric the run left out
+    return bool(frame[columns].notna().values.all())
+
+
+def _scores(frame, seed):
+    # the aggregates of one slice of samples
+    rouge_columns = [column for columns in ROUGE_COLUMNS.values() for column in columns]
+    rouge = {rouge_type: None for rouge_type in ROUGE_TYPES}
+    if _scored(frame, rouge_columns):
+        rouge = rouge_aggregate([{rouge_type: [row[column] for column in columns]
+                                  for rouge_type, columns in ROUGE_COLUMNS.items()}
+                                 for row in frame[rouge_columns].to_dict("records")],
+                                seed=seed)
+    return {
+        "rouge": rouge,
+        "bleu": {"score": bleu_score(frame[BLEU_COLUMNS].values.tolist()) if _scored(frame, BLEU_COLUMNS) else None},
+        "chrf": {"score": chrf_score(frame[CHRF_COLUMNS].values.tolist()) if _scored(frame, CHRF_COLUMNS) else None},
+        "bertscore": {key: frame[column].tolist() for key, column in zip(("precision", "recall", "f1"), BERTSCORE_COLUMNS)},
+        "comet": {"mean_score": sum(frame["COMET"].tolist()) / len(frame) if _scored(frame, ["COMET"]) else None},
+    }
+
+
+def aggregate_samples(samples, by=None):
+    """
+    Aggregates per-sample rows into a results table.
+
+    Without `by`, returns the results CSV: one row per (service, language, disaster, prompt)
+    group in the order the groups were scored, with the first prediction's BERTScore and the
+    group's DATE when all its samples share one. With `by` (a list of columns), returns one
+    row per value of those columns with the corpus ROUGE, BLEU and chrF of the slice, its mean
+    BERTScore and COMET, and its number of SAMPLES.
+
+    The ROUGE bootstrap of each row is seeded from its key, so aggregating the same samples
+    always gives the same table.
+    """
+    rows = []
+    for key, frame in samples.groupby(by or GROUP_COLUMNS, sort=by is not None, dropna=False):
+        frame = frame.sort_values("SAMPLE", kind="stable") if by is None else frame
+        scores = _scores(frame, rouge_seed(key if isinstance(key, tuple) else (key,)))
+        if by is None:
+            dates = frame["DATE"].tolist()
+            date = dates[0] if all(d == dates[0] for d in dates) else None
+            rows.append(gather_results(*key, scores["rouge"], scores["bertscore"], scores["bleu"], scores["comet"],
+                                       scores["chrf"], date=date))
+            continue
+        row = dict(zip(by, key if isinstance(key, tuple) else (key,)))
+        row.update({
+            "SAMPLES": len(frame),
+            "ROUGE-1": scores["rouge"]["rouge1"],
+            "ROUGE-2": scores["rouge"]["rouge2"],
+            "ROUGE-L": scores["rouge"]["rougeL"],
+            "BLEU": scores["bleu"]["score"],
+            "BERTScore_P": frame["BERTScore_P"].mean(),
+            "BERTScore_R": frame["BERTScore_R"].mean(),
+            "BERTScore_F1": frame["BERTScore_F1"].mean(),
+            "COMET": scores["comet"]["mean_score"],
+            "CHRF": scores["chrf"]["score"],
+        })
+        rows.append(row)
+    return pd.DataFrame(rows)
@@ -0,0 +1,183 @@
+"""
+Persistent per-sample score cache for evaluation.py.
+
+Each weekly evaluation used to re-score every response ever collected. Scores are now
+stored per sample under a content address: a hash of the metric name, the metric/model
+version, the tokenizer, the preprocessing applied to the texts, and the hashes of the
+prediction, reference and source texts. A weekly run only computes the samples whose key
+is not in the cache and rebuilds every group's result from cached plus new scores.
+
+Anything that changes a score must change the key. Metric versions include the library
+version and settings (see metrics/lexical.py and metrics/neural.py), preprocessing names
+the text treatment (e.g. bracket stripping for the translation services) and is bumped
+with PREPROCESSING_VERSION, and the text hashes cover whatever text the metric actually saw.
+Stale entries are never overwritten, they just stop being looked up.
+
+Deterministic services (Google Translate, DeepL) often return byte-identical text week after
+week, and LLMs repeat themselves too, so many samples of a run share a key. Each missing key
+is computed once and its value fanned out to every sample that has it; dedup_stats() reports
+how many samples that saved per metric.
+
+The shards of a sharded run (evaluation.py --shard) run on different nodes, and SQLite's locking
+is not reliable on the network file systems they share. Each shard therefore writes its own
+file and only reads the run's cache, opened immutable (without locks) as `base`; nothing writes
+that file until source/merge_results.py folds the shard files into it with merge().
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import time
+from datetime import datetime
+
+# bump when the preprocessing of predictions or references changes in a way the text hashes can't see
+PREPROCESSING_VERSION = 1
+
+
+def _hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest() if text is not None else ""
+
+
+def score_key(metric, version, tokenizer, preprocessing, prediction, reference, source=None):
+    """Returns the cache key of one sample's score."""
+    parts = [metric, version, tokenizer or "", f"{preprocessing}/v{PREPROCESSING_VERSION}",
+             _hash(prediction), _hash(reference), _hash(source)]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def _open_base(path):
+    """Opens an existing cache file read-only and without locking, or returns None."""
+    if not path or not os.path.exists(path):
+        return None
+    return sqlite3.connect(pathlib.Path(path).resolve().as_uri() + "?immutable=1", uri=True)
+
+
+class ScoreCache:
+    def __init__(self, path=None, base=None):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        # metric: [samples missing, unique keys computed, seconds computing them]
+        self._dedup = {}
+
+        self._memory = {}
+        self._connection = None
+        self._base = _open_base(base)
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(path)
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS scores (
+                       key TEXT PRIMARY KEY,
+                       metric TEXT NOT NULL,
+                       value TEXT NOT NULL,
+                       created_at TEXT NOT NULL
+                   )"""
+            )
+            self._connection.commit()
+
+    def fetch(self, metric, keys, compute):
+        """
+        Returns the value for each key, in order. `compute` gets the indices of the keys that
+        are not cached, one index per distinct key, and returns their values in the same order;
+        they are stored and given to every sample with that key before returning.
+        """
+        values = [None] * len(keys)
+        stored = self._load([key for key in keys if key not in self._memory])
+        missing = []
+        for index, key in enumerate(keys):
+            if key in self._memory:
+                values[index] = self._memory[key]
+            elif key in stored:
+                values[index] = self._memory[key] = stored[key]
+            else:
+                missing.append(index)
+
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            # the first sample of each distinct key is scored for all of them
+            first = {}
+            for index in missing:
+                first.setdefault(keys[index], index)
+            unique = list(first.values())
+            start = time.time()
+            computed = compute(unique)
+            seconds = time.time() - start
+            for index, value in zip(unique, computed):
+                self._memory[keys[index]] = value
+            for index in missing:
+                values[index] = self._memory[keys[index]]
+            self._store(metric, [(keys[index], value) for index, value in zip(unique, computed)])
+
+            dedup = self._dedup.setdefault(metric, [0, 0, 0.0])
+            dedup[0] += len(missing)
+            dedup[1] += len(unique)
+            dedup[2] += seconds
+        return values
+
+    def _load(self, keys, chunk_size=500):
+        stored = {}
+        unique = list(dict.fromkeys(keys))
+        for connection in (self._connection, self._base):
+            if connection is None or not unique:
+                continue
+            for start in range(0, len(unique), chunk_size):
+                chunk = unique[start:start + chunk_size]
+                placeholders = ",".join("?" * len(chunk))
+                for key, value in connection.execute(
+                        f"SELECT key, value FROM scores WHERE key IN ({placeholders})", chunk):
+                    stored[key] = json.loads(value)
+            unique = [key for key in unique if key not in stored]
+        return stored
+
+    def _store(self, metric, items):
+        if self._connection is None:
+            return
+        created_at = datetime.now().isoformat(timespec="seconds")
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)",
+            [(key, metric, json.dumps(value), created_at) for key, value in items],
+        )
+        self._connection.commit()
+
+    def merge(self, paths):
+        """Copies the scores of the cache files `paths` (e.g. a sharded run's) into this cache; returns how many."""
+        merged = 0
+        for path in paths:
+            self._connection.execute("ATTACH DATABASE ? AS other", (path,))
+            try:
+                merged += self._connection.execute("INSERT OR REPLACE INTO scores SELECT * FROM other.scores").rowcount
+                self._connection.commit()
+            finally:
+                self._connection.execute("DETACH DATABASE other")
+        return merged
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def dedup_stats(self):
+        """
+        Returns {metric: {samples, unique, ratio, seconds_saved}} for the samples computed so far:
+        how many were missing, how many distinct keys were scored for them, and the time the
+        duplicates would have taken at the metric's average time per scored key.
+        """
+        return {
+            metric: {
+                "samples": samples,
+                "unique": unique,
+                "ratio": unique / samples if samples else 1.0,
+                "seconds_saved": seconds / unique * (samples - unique) if unique else 0.0,
+            }
+            for metric, (samples, unique, seconds) in self._dedup.items()
+        }
+
+    def close(self):
+        for connection in (self._connection, self._base):
+            if connection is not None:
+                connection.close()
+        self._connection = self._base = None
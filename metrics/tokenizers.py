@@ -0,0 +1,68 @@
+"""
+Process-wide registry of the sacrebleu tokenizers used by ROUGE and BLEU.
+
+Building a Flores101Tokenizer loads its SentencePiece model, and evaluation.py used to
+build one for every language of every group, for ROUGE and again inside every BLEU
+metric. The registry builds each tokenizer once per process (once per worker in a
+LexicalPool) and hands the same instance to ROUGE and to BLEU's `tokenize`.
+
+Calls are memoized in an LRU cache per tokenizer: every reference is scored against
+about 60 predictions, and the translation services often return identical outputs, so
+most strings are tokenized once per run.
+"""
+
+import threading
+from functools import lru_cache
+
+from sacrebleu.tokenizers.tokenizer_spm import Flores101Tokenizer
+from sacrebleu.tokenizers.tokenizer_zh import TokenizerZh
+
+TOKENIZERS = {
+    "flores101": Flores101Tokenizer,
+    "zh": TokenizerZh,
+}
+
+_registry = {}
+_lock = threading.Lock()
+
+
+def tokenizer_name(language):
+    """Returns the name of the tokenizer `language` is scored with (BLEU's `tokenize` string)."""
+    if language == "chinese_traditional":
+        return "zh"
+    return "flores101"
+
+
+class SharedTokenizer:
+    """A sacrebleu tokenizer with memoized calls; usable wherever sacrebleu expects its tokenizer."""
+
+    def __init__(self, name, maxsize=2**18):
+        self.name = name
+        self._tokenizer = TOKENIZERS[name]()
+        self._tokenize = lru_cache(maxsize=maxsize)(self._tokenizer)
+
+    def signature(self):
+        return self._tokenizer.signature()
+
+    def __call__(self, line):
+        return self._tokenize(line)
+
+    def tokenize(self, text):
+        return self._tokenize(text)
+
+    def cache_info(self):
+        return self._tokenize.cache_info()
+
+
+def get_tokenizer(name):
+    """Returns this process's tokenizer `name`, building it on first use."""
+    with _lock:
+        if name not in _registry:
+            _registry[name] = SharedTokenizer(name)
+        return _registry[name]
+
+
+def tokenizer_stats():
+    """Returns {name: (hits, misses)} of the memoized tokenizers built in this process."""
+    with _lock:
+        return {name: tuple(tokenizer.cache_info()[:2]) for name, tokenizer in _registry.items()}
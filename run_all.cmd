@@ -1,7 +1,11 @@
+# Evaluates in SHARDS jobs, each scoring one balanced shard of the groups (evaluation.py --shard).
+# merge_results.cmd merges them afterwards; submit evaluation.dag to run both in order.
+SHARDS     = 8
 executable = ./run_all_evaluations.sh
+arguments  = $(Process) $(SHARDS)
 getenv     = true
-error      = all_evals.error
+error      = all_evals.$(Process).error
 log        = all_evals.log
 transfer_executable = false
 request_memory = 2*1024
-queue
\ No newline at end of file
+queue $(SHARDS)
\ No newline at end of file
@@ -2,33 +2,25 @@
 
 
 
-# Script to run Google Translate evaluation
-
-echo "Evaluating google translate results..."
-python evaluation.py output_file.json data/evaluation_gold_standards.json --output_csv results_google_translate.csv --service_name google_translate
-
-# Script to run ChatGPT evaluation
-
-echo "Evaluating chatgpt results..."
-python evaluation.py output_file.json data/evaluation_gold_standards.json --output_csv results_chatgpt.csv --service_name chatgpt
-
-# Script to run Deepseek evaluation
-
-echo "Evaluating deepseek results..."
-python evaluation.py output_file.json data/evaluation_gold_standards.json --output_csv results_deepseek.csv --service_name deepseek
-
-# Script to run Gemini evaluation
-
-echo "Evaluating gemini results..."
-python evaluation.py output_file.json data/evaluation_gold_standards.json --output_csv results_gemini.csv --service_name gemini
-
-# Script to run Gemini evaluation
-
-echo "Evaluating deepL results..."
-python evaluation.py output_file.json data/evaluation_gold_standards.json --output_csv results_deepL.csv --service_name deepL
-
-# Combine all results
-
-echo "Combining files..."
-python source/combine_all_results.py
-
+# Evaluate every service in one process so the metric models and output_file.json load once.
+# Writes results/results_<service>.csv for each service and results/all_results_combined.csv
+#
+#   ./run_all_evaluations.sh              evaluate everything on this node
+#   ./run_all_evaluations.sh <i> <N>      evaluate shard i (0-based) of N; run_all.cmd queues N of these
+#   ./run_all_evaluations.sh merge <N>    merge the N shards into the same CSVs (merge_results.cmd)
+
+SERVICES="google_translate chatgpt deepseek gemini deepL"
+
+if [ "$1" = "merge" ]; then
+    echo "Merging $2 evaluation shards..."
+    python -m source.merge_results all_results_combined.csv --shards "$2" --per_service_csvs
+elif [ -n "$2" ]; then
+    # --resume: an evicted shard picks up where it stopped; finished groups whose inputs changed are rescored
+    echo "Evaluating shard $1 of $2 ($SERVICES)..."
+    python evaluation.py output_file.json data/evaluation_gold_standards.json --output_csv all_results_combined.csv \
+        --service_name $SERVICES --shard "$1/$2" --resume
+else
+    echo "Evaluating google translate, chatgpt, deepseek, gemini and deepL results..."
+    python evaluation.py output_file.json data/evaluation_gold_standards.json --output_csv all_results_combined.csv --per_service_csvs \
+        --service_name $SERVICES
+fi
@@ -12,4 +12,9 @@ log = logs/collect_responses.log
 transfer_executable = false
 request_memory = 2*1024
 
+# On eviction Condor sends SIGTERM; collect_responses.py finishes the in-flight request
+# (--grace_period, default 60s), saves and records a resume point before exiting.
+kill_sig = SIGTERM
+job_max_vacate_time = 90
+
 queue
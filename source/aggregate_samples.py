@@ -0,0 +1,41 @@
+"""
+Re-aggregates the per-sample scores evaluation.py writes (results/samples.parquet) by any
+columns, without rerunning the metrics.
+
+Usage:
+    python -m source.aggregate_samples [samples_file] [--by COLUMN [COLUMN ...]] [--output_csv OUTPUT_CSV]
+
+Without --by the output is the results CSV itself, one row per (service, language,
+disaster, prompt). Key columns: SERVICE, LANGUAGE, DISASTER, PROMPT, SAMPLE, DATE,
+TEXT_HASH, TOKENIZER.
+"""
+
+import argparse
+import time
+
+from metrics.sample_store import KEY_COLUMNS, aggregate_samples, read_samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate per-sample evaluation scores")
+    parser.add_argument("samples_file", nargs="?", default="results/samples.parquet", help="Per-sample scores (Parquet)")
+    parser.add_argument("--by", nargs="+", default=None, choices=KEY_COLUMNS,
+                        help="Columns to aggregate by; default one row per (service, language, disaster, prompt)")
+    parser.add_argument("--output_csv", default=None, help="Write the aggregates to this CSV instead of printing them")
+    args = parser.parse_args()
+
+    start = time.time()
+    samples = read_samples(args.samples_file)
+    df = aggregate_samples(samples, by=args.by)
+    elapsed = time.time() - start
+
+    if args.output_csv:
+        df.to_csv(args.output_csv, index=False)
+        print(f"Results saved to: {args.output_csv}")
+    else:
+        print(df.to_string(index=False))
+    print(f"Aggregated {len(samples)} samples into {len(df)} rows in {elapsed:.2f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
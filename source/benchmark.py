@@ -0,0 +1,201 @@
+"""
+Measures the throughput of evaluation.py on synthetic corpora (source/synthetic_corpus.py), so
+changes can be compared and regressions caught without the real output_file.json.
+
+Every combination of --scales and --metrics runs in a fresh process, which generates the
+corpus, loads the metric models and scores the corpus with evaluate_generated_texts as
+evaluation.py does, with empty in-memory caches so every run starts cold. For each run the
+script prints and writes to --output_csv:
+
+    responses            responses in the corpus; samples/s is responses over wall seconds
+    generate seconds     time to generate the corpus, not part of the wall time
+    load seconds         time to load the models, including the ones the metrics load lazily
+    wall seconds         time of evaluate_generated_texts, from loading the data to the results
+    <metric> samples/s   responses over the metric's scoring time (model loads excluded);
+                         distinct inputs are scored once, see distinct
+    peak RSS MiB         peak resident memory of the run's process; --workers processes not included
+
+With --baseline (an earlier --output_csv) every samples/s that dropped by more than --tolerance
+is reported and the script exits with status 1.
+
+--stand_in_models replaces BERTScore and COMET with tiny untrained models (source/stand_in_models.py)
+that are built from the gold set without downloading anything, so a laptop can run the suite,
+e.g. with --scales 0.05. --bertscore_model and --comet_model benchmark other real checkpoints.
+
+Usage:
+    python -m source.benchmark [--scales SCALE ...] [--metrics METRICS ...] [--stand_in_models]
+                               [--bertscore_model MODEL --bertscore_layers N] [--comet_model MODEL]
+                               [--neural_backend BACKEND] [--lexical_backend BACKEND] [--workers N]
+                               [--output_csv OUTPUT_CSV] [--baseline BASELINE_CSV] [--tolerance FRACTION]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from evaluation import METRICS
+from metrics.lexical import BACKENDS as LEXICAL_BACKENDS
+from metrics.neural import BACKENDS as NEURAL_BACKENDS
+from source.synthetic_corpus import CENSUS, GOLD, SCALES, complete_gold, generate_corpus, read_census
+
+METRIC_SETS = ["rouge,bleu,chrf", "all"]
+
+
+def parse_metrics(value):
+    """"all" or comma-separated metrics of METRICS, in their order there."""
+    names = METRICS if value == "all" else value.split(",")
+    unknown = [name for name in names if name not in METRICS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown metrics {', '.join(unknown)}; choose from {', '.join(METRICS)} or all")
+    return [metric for metric in METRICS if metric in names]
+
+
+def run(scale, metrics, options):
+    """Generates the corpus at `scale` and evaluates it with `metrics`; returns the row of the results."""
+    from evaluation import evaluate_generated_texts, load_neural_metrics
+    from metrics.encoding_cache import EncodingCache
+    from metrics.lexical import LexicalPool
+    from metrics.neural import model_load_stats
+    from metrics.profiling import EvaluationProfile, rss_peak_bytes
+    from metrics.score_cache import ScoreCache
+
+    start = time.time()
+    with open(options["reference_path"], "r", encoding="utf-8") as f:
+        gold = complete_gold(json.load(f), options["seed"])
+    corpus, responses = generate_corpus(gold, read_census(options["census"]), scale, options["seed"])
+    generate_seconds = time.time() - start
+
+    # fork the lexical workers before the models are loaded, as evaluation.py does
+    lexical_pool = LexicalPool(options["workers"], options["lexical_backend"])
+    profile = EvaluationProfile()
+    profile.start()
+    with profile.phase("load models"):
+        if options["stand_in_models"]:
+            from source.stand_in_models import use_stand_in_models
+            texts = [gold_texts[side] for disasters in gold.values() for gold_texts in disasters.values()
+                     for side in ("reference", "source")]
+            bertscore, comet = use_stand_in_models(texts, metrics, seed=options["seed"])
+        else:
+            if options["bertscore_model"] and "bertscore" in metrics:
+                from source.stand_in_models import use_bertscore_model
+                use_bertscore_model(options["bertscore_model"], options["bertscore_layers"])
+            bertscore, comet = load_neural_metrics(metrics, options["comet_model"])
+
+    score_cache = ScoreCache()
+    start = time.time()
+    evaluate_generated_texts(corpus, gold, None, bertscore, comet, batch_size=options["batch_size"],
+                             encoding_cache=EncodingCache(), score_cache=score_cache, lexical_pool=lexical_pool,
+                             block_size=options["block_size"], neural_backend=options["neural_backend"],
+                             max_tokens=options["max_tokens"], metrics=metrics, profile=profile)
+    wall_seconds = time.time() - start
+    lexical_pool.close()
+    profile.stop()
+
+    loads = model_load_stats()
+    row = {
+        "scale": scale,
+        "metrics": ",".join(metrics),
+        "responses": responses,
+        "distinct": max((stats["unique"] for stats in score_cache.dedup_stats().values()), default=0),
+        "generate seconds": generate_seconds,
+        "load seconds": profile.phases["load models"]["seconds"] + sum(loads.values()),
+        "wall seconds": wall_seconds,
+        "samples/s": responses / wall_seconds,
+    }
+    for metric in metrics:
+        # the BERTScore models and the CPU backends are loaded inside the first scoring call
+        seconds = profile.phases[metric]["seconds"] - sum(load for model, load in loads.items()
+                                                          if model.startswith(f"{metric}:"))
+        row[f"{metric} samples/s"] = responses / seconds if seconds > 0 else None
+    row["peak RSS MiB"] = rss_peak_bytes() / 2**20
+    return row
+
+
+def regressions(df, baseline, tolerance):
+    """Lines describing every samples/s of `df` more than `tolerance` below the same run of `baseline`."""
+    lines = []
+    previous = {(row["scale"], row["metrics"]): row for row in baseline.to_dict("records")}
+    for row in df.to_dict("records"):
+        before = previous.get((row["scale"], row["metrics"]))
+        if before is None:
+            continue
+        for column in row:
+            if not column.endswith("samples/s") or pd.isna(row[column]) or pd.isna(before.get(column)):
+                continue
+            if row[column] < before[column] * (1 - tolerance):
+                lines.append(f"scale {row['scale']} {row['metrics']}: {column} {before[column]:.1f} -> {row[column]:.1f} "
+                             f"({row[column] / before[column] - 1:+.0%})")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark evaluation.py on synthetic corpora")
+    parser.add_argument("--scales", nargs="+", type=float, default=SCALES,
+                        help="Corpus sizes relative to output_file.json (default 1 10 100; e.g. 0.05 on a laptop)")
+    parser.add_argument("--metrics", nargs="+", type=parse_metrics, default=[parse_metrics(value) for value in METRIC_SETS],
+                        help="Metric sets to run, each comma-separated or all (default rouge,bleu,chrf and all)")
+    parser.add_argument("--stand_in_models", action="store_true", default=False,
+                        help="Use tiny untrained stand-ins for BERTScore and COMET, built offline from the gold set")
+    parser.add_argument("--bertscore_model", default=None,
+                        help="BERTScore model for every language instead of bert_score's choice per language")
+    parser.add_argument("--bertscore_layers", type=int, default=None, help="Layer of --bertscore_model to score with")
+    parser.add_argument("--comet_model", default="default", help="COMET checkpoint (default Unbabel/wmt22-comet-da)")
+    parser.add_argument("--neural_backend", choices=NEURAL_BACKENDS, default="fp32",
+                        help="Run BERTScore and COMET in fp32 or on a CPU backend, as in evaluation.py")
+    parser.add_argument("--lexical_backend", choices=LEXICAL_BACKENDS, default="sacrebleu",
+                        help="Compute ROUGE, BLEU and chrF with sacrebleu/rouge_score or the NumPy n-gram engine")
+    parser.add_argument("--workers", type=int, default=1, help="Processes computing ROUGE, BLEU and chrF (default 1)")
+    parser.add_argument("--batch_size", type=int, default=64, help="Most samples per batch for BERTScore and COMET")
+    parser.add_argument("--max_tokens", type=int, default=8192, help="Padded tokens per batch for BERTScore and COMET")
+    parser.add_argument("--block_size", type=int, default=2000, help="Samples scored together (default 2000)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpora (default 0)")
+    parser.add_argument("--reference_path", default=GOLD, help=f"Gold set the corpora are built from (default {GOLD})")
+    parser.add_argument("--census", default=CENSUS, help=f"Responses per cell of output_file.json (default {CENSUS})")
+    parser.add_argument("--output_csv", default="results/benchmark.csv", help="Where to write the results")
+    parser.add_argument("--baseline", default=None, help="Earlier --output_csv to compare the samples/s against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Fraction a samples/s may drop below the baseline before it counts as a regression (default 0.2)")
+    args = parser.parse_args()
+    if args.bertscore_model and args.bertscore_layers is None:
+        parser.error("--bertscore_model needs --bertscore_layers")
+
+    options = {key: getattr(args, key) for key in ("stand_in_models", "bertscore_model", "bertscore_layers", "comet_model",
+                                                   "neural_backend", "lexical_backend", "workers", "batch_size",
+                                                   "max_tokens", "block_size", "seed", "reference_path", "census")}
+    rows = []
+    for scale in args.scales:
+        for metrics in args.metrics:
+            print(f"Benchmarking scale {scale:g} with {', '.join(metrics)}")
+            # a fresh process per run, so models and peak memory do not carry over
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                rows.append(executor.submit(run, scale, metrics, options).result())
+
+    df = pd.DataFrame(rows)
+    # the metric columns in METRICS order, whichever run had them
+    metric_columns = [f"{metric} samples/s" for metric in METRICS if f"{metric} samples/s" in df]
+    df = df[[column for column in df if column not in metric_columns and column != "peak RSS MiB"]
+            + metric_columns + ["peak RSS MiB"]]
+    print(df.to_string(index=False, float_format=lambda value: f"{value:.4g}"))
+    directory = os.path.dirname(args.output_csv)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    df.to_csv(args.output_csv, index=False)
+    print(f"Results saved to: {args.output_csv}")
+
+    if args.baseline:
+        lines = regressions(df, pd.read_csv(args.baseline), args.tolerance)
+        for line in lines:
+            print(f"Regression: {line}")
+        if lines:
+            sys.exit(1)
+        print(f"No samples/s dropped more than {args.tolerance:.0%} below {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
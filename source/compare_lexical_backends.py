@@ -0,0 +1,84 @@
+"""
+Checks that the NumPy n-gram engine (metrics/ngram_engine.py) reproduces sacrebleu and
+rouge_score on a predictions file, and times both backends.
+
+Every sample is scored with both backends; the script prints, per metric, the wall time
+of each backend, the number of samples whose pieces differ, and the largest difference
+between the per-group scores (BLEU, chrF, and the mean ROUGE F-measure of each group).
+
+Usage:
+    python -m source.compare_lexical_backends <generated_path> <reference_path> [--service_name SERVICE ...]
+"""
+
+import argparse
+import time
+
+from evaluation import collect_groups, flatten_samples, lexical_shards, load_json
+from metrics.lexical import ROUGE_TYPES, bleu_metric, chrf_metric, corpus_score, score_shard
+
+FIELDS = {"rouge": "hypothesis", "bleu": "hypothesis", "chrf": "raw"}
+
+
+def score(samples, metric, backend):
+    values = [None] * len(samples)
+    for shard in lexical_shards(samples, range(len(samples))):
+        first = samples[shard[0]]
+        pieces = score_shard(metric, first["language"], first["tokenizer_string"],
+                             [samples[i][FIELDS[metric]] for i in shard], [samples[i]["reference"] for i in shard],
+                             backend)
+        for index, piece in zip(shard, pieces):
+            values[index] = piece
+    return values
+
+
+def group_scores(groups, metric, values):
+    scores = []
+    for group in groups:
+        pieces = values[group["first_sample"]:group["first_sample"] + len(group["hypotheses"])]
+        if metric == "bleu":
+            scores.append(corpus_score(bleu_metric(group["tokenizer_string"]), pieces))
+        elif metric == "chrf":
+            scores.append(corpus_score(chrf_metric(), pieces))
+        else:
+            scores.append([sum(piece[key][2] for piece in pieces) / len(pieces) for key in ROUGE_TYPES])
+    return scores
+
+
+def largest_difference(a, b):
+    if isinstance(a, list):
+        return max((largest_difference(x, y) for x, y in zip(a, b)), default=0.0)
+    return abs(a - b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the sacrebleu and NumPy backends of the lexical metrics")
+    parser.add_argument("generated_path", help="Path generated text file")
+    parser.add_argument("reference_path", help="Path reference text file")
+    parser.add_argument("--service_name", nargs="+", default=None, help="Only compare these services; default all")
+    args = parser.parse_args()
+
+    groups = collect_groups(load_json(args.generated_path, "prediction"), load_json(args.reference_path, "reference"),
+                            args.service_name)
+    samples = flatten_samples(groups)
+    print(f"{len(samples)} samples in {len(groups)} groups")
+
+    for metric in FIELDS:
+        results = {}
+        for backend in ("sacrebleu", "numpy"):
+            start = time.time()
+            results[backend] = score(samples, metric, backend)
+            print(f"{metric:6} {backend:10} {time.time() - start:8.2f}s")
+
+        reference, engine = results["sacrebleu"], results["numpy"]
+        if metric == "rouge":
+            differing = sum(
+                largest_difference([a[key] for key in ROUGE_TYPES], [b[key] for key in ROUGE_TYPES]) > 1e-12
+                for a, b in zip(reference, engine))
+        else:
+            differing = sum(a != b for a, b in zip(reference, engine))
+        difference = largest_difference(group_scores(groups, metric, reference), group_scores(groups, metric, engine))
+        print(f"{metric:6} samples differing: {differing}, largest group score difference: {difference:.3g}")
+
+
+if __name__ == "__main__":
+    main()
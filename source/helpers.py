@@ -3,83 +3,37 @@ Miscellaneous methods mostly used to interface between the primary logic in `col
 and the actual Clients themselves.
 """
 
-import os
-from clients.gemini import GeminiClient
-from clients.deepseek import DeepSeekClient
-from clients.chatgpt import ChatGPTClient
-from clients.cloud_translation import GoogleCloudTranslationClient
-from clients.deepl import DeepLClient
-from clients.exceptions import QuotaExhaustedError
+from clients.registry import SERVICES
 
-def chat_with_service(service_name, language, disaster, prompt_file_path, logger):
-    try:
-        match service_name:
-            case "gemini":
-                return chat_gemini(language, disaster, prompt_file_path, logger)
-            case "chatgpt":
-                return chat_chatgpt(language, disaster, prompt_file_path, logger)
-            case "deepseek":
-                return chat_deepseek(language, disaster, prompt_file_path, logger)
-            case "google_translate":
-                return chat_google_translate(language, disaster, prompt_file_path, logger)
-            case "deepL":
-                return chat_deepL(language, disaster, prompt_file_path, logger)
-            case _:
-                logger.error(f"Unknown service requested: {service_name}")
-                return None
-    except Exception as e:
-        logger.exception(f"{service_name} request failed for {language}:{disaster}: {e}")
+def chat_with_service(service_name, language, disaster, prompt_file_path, logger, metadata=None, stream=False, client=None,
+                      max_tokens=None):
+    """
+    Requests one response from a service and returns its text, or None on failure.
+
+    The service is looked up in clients.registry. Pass `client` to reuse a client built with
+    the service's client_factory; otherwise a new one is built for this request.
+    If `metadata` is a dict it is updated with what the client reported besides the
+    text (e.g. time to first token when `stream` is set for the LLM services, usage and
+    finish reason). `max_tokens` overrides the client's output token limit for this request.
+    """
+    spec = SERVICES.get(service_name)
+    if spec is None:
+        logger.error(f"Unknown service requested: {service_name}")
         return None
 
-def chat_gemini(language, disaster, prompt_file_path, logger):
-    gemini_client = GeminiClient(key=os.getenv("GEMINI_API_KEY"), logger=logger)
     try:
-        return gemini_client.safe_chat(prompt_file=prompt_file_path, language=language, disaster=disaster)
-    except QuotaExhaustedError as e:        # to deal with quota limits
-        logger.error(f"Gemini quota exhausted; skipping Gemini for remainder of run. {e}")
+        if client is None:
+            client = spec.client_factory(logger, stream=stream)
+        client.response_metadata = {}
+        client.output_token_limit = max_tokens
+        output = spec.request(client, language, disaster, prompt_file_path, logger)
+    except Exception as e:
+        logger.exception(f"{service_name} request failed for {language}:{disaster}: {e}")
         return None
-    #return gemini_client.safe_chat(prompt_file=prompt_file_path, language=language, disaster=disaster)
-
-def chat_deepseek(language, disaster, prompt_file_path, logger):
-    deepseek_client = DeepSeekClient(key=os.getenv("OPENROUTER_API_KEY"), logger=logger)
-    return deepseek_client.safe_chat(prompt_file=prompt_file_path, language=language, disaster=disaster)
-
-# def chat_chatgpt(language, disaster, prompt_file_path, logger):
-#     chatgpt_client = ChatGPTClient(key=os.getenv("AZURE_OPENAI_API_KEY"),
-#                                    base_url=os.getenv("AZURE_OPENAI_ENDPOINT"),
-#                                    deployment_name=os.getenv("AZURE_DEPLOYMENT_NAME"),
-#                                    logger=logger)
-#     return chatgpt_client.safe_chat(prompt_file=prompt_file_path, language=language, disaster=disaster)
-
-def chat_chatgpt(language, disaster, prompt_file_path, logger):
-    chatgpt_client = ChatGPTClient(
-        key=os.getenv("OPENAI_API_KEY"),
-        logger=logger,
-    )
-
-    return chatgpt_client.safe_chat(
-        prompt_file=prompt_file_path,
-        language=language,
-        disaster=disaster,
-    )
-
-def chat_google_translate(language, disaster, prompt_file_path, logger):
-    google_translate_client = GoogleCloudTranslationClient(logger=logger)
-    return google_translate_client.safe_chat(prompt_file=prompt_file_path, language=language, disaster=disaster)
-
-
-def chat_deepL(language, disaster, prompt_file_path, logger):
-    #extract the text from the prompt file
-    with open(prompt_file_path, "r", encoding="utf-8") as file:
-                prompt_file_content = file.read()
-
-    deepL_client = DeepLClient(key=os.getenv("DEEPL_API_KEY"), logger=logger)
 
-    # Directly call the 'translate' method, which now has tenacity built-in
-    return deepL_client.translate(
-            text=prompt_file_content, # DeepL expects actual text content
-            target_language=language
-    )
+    if metadata is not None:
+        metadata.update(client.response_metadata)
+    return output
 
 """
 hand-crafted dictionary to set up a JSON output schema for the first time. It's organized by:
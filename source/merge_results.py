@@ -0,0 +1,164 @@
+"""
+Merges the shards of a sharded evaluation (evaluation.py --shard i/N) into the results CSVs.
+
+Each shard writes results/<name>.shard-i-of-N.json with its result rows and the keys of
+every group the full evaluation expects, and results/samples.shard-i-of-N.parquet with its
+per-sample scores. The merge checks that all N shards are there and agree on the expected
+groups, and that every expected (service, language, disaster, prompt) group appears in
+exactly one shard and nothing else does. It then writes the same files an unsharded run
+writes: the combined CSV, the per-service CSVs and the samples file. Replaces
+source/combine_all_results.py.
+
+The scores and encodings each shard computed are in cache/scores.shard-i-of-N.sqlite and
+cache/encodings.shard-i-of-N.sqlite (the shards only read the shared caches); they are folded
+into --score_cache and --encoding_cache and removed, so the next run finds them.
+
+Usage:
+    python -m source.merge_results [output_csv] [--shards N] [--per_service_csvs] [--samples_file SAMPLES_FILE]
+                                   [--score_cache SCORE_CACHE] [--encoding_cache ENCODING_CACHE]
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+from collections import Counter
+
+import pandas as pd
+
+from evaluation import shard_path, write_results
+from metrics.encoding_cache import EncodingCache
+from metrics.sample_store import GROUP_COLUMNS, read_samples, write_samples
+from metrics.score_cache import ScoreCache
+
+
+class MergeError(Exception):
+    pass
+
+
+def _shard_files(path, shards=None):
+    # results/all_results_combined.csv -> {index: results/all_results_combined.shard-i-of-N.json}
+    stem = os.path.splitext(path)[0]
+    pattern = re.compile(re.escape(os.path.basename(stem)) + r"\.shard-(\d+)-of-(\d+)\.json$")
+    found = {}
+    counts = set()
+    for file in glob.glob(f"{glob.escape(stem)}.shard-*-of-*.json"):
+        match = pattern.search(os.path.basename(file))
+        if match:
+            index, count = int(match.group(1)), int(match.group(2))
+            if shards is None or count == shards:
+                found[index] = file
+                counts.add(count)
+    if not found:
+        raise MergeError(f"No shard files found for {path}")
+    if len(counts) > 1:
+        raise MergeError(f"Shard files of different runs found ({sorted(counts)} shards); pass --shards")
+    count = counts.pop()
+    missing = sorted(set(range(count)) - set(found))
+    if missing:
+        raise MergeError(f"Missing shards {missing} of {count}")
+    return count, [found[index] for index in range(count)]
+
+
+def merge_shards(files):
+    """Returns the merged result rows in the order an unsharded run reports them, after validating the shards."""
+    manifests = []
+    for file in files:
+        with open(file, "r", encoding="utf-8") as f:
+            manifests.append(json.load(f))
+
+    expected = [tuple(key) for key in manifests[0]["expected"]]
+    for file, manifest in zip(files, manifests):
+        if [tuple(key) for key in manifest["expected"]] != expected:
+            raise MergeError(f"{file} was evaluated on different predictions than {files[0]}")
+
+    seen = Counter()
+    rows = {}
+    for manifest in manifests:
+        for row in manifest["rows"]:
+            key = tuple(row[column] for column in GROUP_COLUMNS)
+            seen[key] += 1
+            rows[key] = row
+
+    problems = []
+    expected_keys = set(expected)
+    missing = [key for key in expected if key not in seen]
+    duplicated = [key for key, count in seen.items() if count > 1]
+    unexpected = [key for key in seen if key not in expected_keys]
+    for name, keys in (("missing", missing), ("in more than one shard", duplicated), ("not expected", unexpected)):
+        if keys:
+            problems.append(f"{len(keys)} groups {name}, e.g. {', '.join(':'.join(map(str, key)) for key in keys[:5])}")
+    if problems:
+        raise MergeError("; ".join(problems))
+    return expected, [rows[key] for key in expected]
+
+
+def merge_samples(samples_file, shards, expected):
+    files = [f"{os.path.splitext(samples_file)[0]}.shard-{index}-of-{shards}{os.path.splitext(samples_file)[1]}"
+             for index in range(shards)]
+    present = [file for file in files if os.path.exists(file)]
+    if not present:
+        return None
+    if len(present) < len(files):
+        raise MergeError(f"Missing sample files {sorted(set(files) - set(present))}")
+    samples = pd.concat([read_samples(file) for file in present], ignore_index=True)
+    position = {key: index for index, key in enumerate(expected)}
+    order = samples[GROUP_COLUMNS].apply(lambda row: position[tuple(row)], axis=1)
+    samples = samples.iloc[order.argsort(kind="stable")].reset_index(drop=True)
+    write_samples(samples, samples_file)
+    return samples_file
+
+
+def merge_caches(cache_class, path, shards):
+    """Folds the shard files of the cache at `path` into it and removes them; returns (files, entries) merged."""
+    files = [file for file in (shard_path(path, (index, shards)) for index in range(shards)) if os.path.exists(file)]
+    if not files:
+        return 0, 0
+    cache = cache_class(path)
+    try:
+        merged = cache.merge(files)
+    finally:
+        cache.close()
+    for file in files:
+        os.remove(file)
+    return len(files), merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the shards of a sharded evaluation")
+    parser.add_argument("output_csv", nargs="?", default="all_results_combined.csv",
+                        help="Combined CSV name the shards were run with (saved under results/)")
+    parser.add_argument("--shards", type=int, default=None, help="Number of shards; default from the shard files")
+    parser.add_argument("--per_service_csvs", action="store_true", default=False,
+                        help="Also write results/results_<service>.csv for each service")
+    parser.add_argument("--samples_file", default="results/samples.parquet",
+                        help="Per-sample scores file the shards were run with")
+    parser.add_argument("--score_cache", default="cache/scores.sqlite",
+                        help="Score cache the shards were run with; their shard files are merged into it")
+    parser.add_argument("--encoding_cache", default="cache/encodings.sqlite",
+                        help="Encoding cache the shards were run with; their shard files are merged into it")
+    args = parser.parse_args()
+
+    output_path = os.path.join("results/", os.path.basename(args.output_csv))
+    try:
+        shards, files = _shard_files(output_path, args.shards)
+        expected, rows = merge_shards(files)
+        samples_file = merge_samples(args.samples_file, shards, expected)
+    except MergeError as e:
+        print(f"Merge failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    write_results(pd.DataFrame(rows), output_path, per_service_dir="results/" if args.per_service_csvs else None)
+    if samples_file:
+        print(f"Per-sample scores saved to: {samples_file}")
+    for cache_class, path in ((ScoreCache, args.score_cache), (EncodingCache, args.encoding_cache)):
+        files, merged = merge_caches(cache_class, path, shards)
+        if files:
+            print(f"Merged {merged} entries from {files} shard caches into {path}")
+    print(f"Merged {len(rows)} groups from {shards} shards")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,7 +18,7 @@ common token styles used in alert systems, including braces, angle brackets,
 percent-style specifiers, and other service-specific markers.
 
 Usage:
-    python placeholder_inventory.py [--input INPUT] [--output OUTPUT] [--summary-output SUMMARY]
+    python -m source.placeholder_inventory [--input INPUT] [--output OUTPUT] [--summary-output SUMMARY]
 """
 import argparse
 import csv
@@ -28,6 +28,8 @@ from collections import Counter, defaultdict
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Sequence, Tuple
 
+from clients.registry import DIRECT_SERVICES, PROMPTED_SERVICES
+
 # Regex patterns for identifying various placeholder formats
 PLACEHOLDER_PATTERNS = [
     r"\{\{.*?\}\}",      # {{name}}
@@ -42,9 +44,9 @@ PLACEHOLDER_PATTERNS = [
 # Compiled regex combining all placeholder patterns
 PLACEHOLDER_RE = re.compile("|".join(f"(?:{p})" for p in PLACEHOLDER_PATTERNS))
 
-# Service categories by data schema
-SCHEMA1_SERVICES = {"deepl", "google_translate"}
-SCHEMA2_SERVICES = {"chatgpt", "gemini", "deepseek"}
+# Service categories by data schema, from clients/registry.py
+SCHEMA1_SERVICES = DIRECT_SERVICES
+SCHEMA2_SERVICES = PROMPTED_SERVICES
 
 # Common field names for extracting text content from records
 DEFAULT_TEXT_KEYS = [
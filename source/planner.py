@@ -0,0 +1,196 @@
+"""
+Dry-run planning for `collect_responses.py --dry_run`.
+
+Given the cells a run would visit and what output_file.json already holds, predicts for
+each service how many requests the run will send, how long they will take and how much
+of the provider's daily quota they use, without calling any API.
+
+Latency comes from history: the "latency" stored with each response (seconds for the
+request, recorded since collect_responses started timing calls) and, if a cassette is
+given, the latencies recorded there. Services without history fall back to the
+`default_latency` of their entry in clients/registry.py, which also provides the rate
+limits and the concurrency the scheduler will actually use.
+
+Cells are excluded when the service is skipped or when history shows the service has
+never answered for that language (e.g. DeepL for a language it does not support).
+"""
+
+import json
+import sqlite3
+import statistics
+from collections import defaultdict
+
+from clients.registry import SERVICES
+from source.scheduler import execution_strategy
+
+# requests per minute / per day, None when there is no limit we know of
+SERVICE_LIMITS = {name: {"rpm": spec.rpm, "rpd": spec.rpd} for name, spec in SERVICES.items()}
+
+# seconds per request when there is no recorded latency
+DEFAULT_LATENCY = {name: spec.default_latency for name, spec in SERVICES.items()}
+
+CONCURRENCY_LEVELS = (1, 2, 4, 8)
+
+
+def history_latencies(output_json, cassette_path=None):
+    """Collects observed request latencies per service from stored responses and an optional cassette."""
+    latencies = defaultdict(list)
+
+    def walk(service, node):
+        if isinstance(node, dict):
+            for value in node.values():
+                walk(service, value)
+        elif isinstance(node, list):
+            for response in node:
+                if isinstance(response, dict) and isinstance(response.get("latency"), (int, float)):
+                    latencies[service].append(float(response["latency"]))
+
+    for service, node in output_json.items():
+        walk(service, node)
+
+    if cassette_path:
+        connection = sqlite3.connect(cassette_path)
+        try:
+            for service, latency in connection.execute("SELECT service, latency FROM interactions"):
+                latencies[service].append(latency)
+        finally:
+            connection.close()
+    return latencies
+
+
+def unsupported_languages(output_json):
+    """Returns {service: {language}} for languages whose cells exist but have never held a response."""
+    def count(node):
+        if isinstance(node, dict):
+            return sum(count(value) for value in node.values())
+        if isinstance(node, list):
+            return len(node)
+        return 0
+
+    unsupported = defaultdict(set)
+    for service, languages in output_json.items():
+        if not isinstance(languages, dict):
+            continue
+        for language, node in languages.items():
+            if node and count(node) == 0:
+                unsupported[service].add(language)
+    return unsupported
+
+
+def plan_run(cells, output_json, skipped_services=(), cassette_path=None, concurrency_levels=CONCURRENCY_LEVELS,
+             limits=SERVICE_LIMITS):
+    """
+    Predicts the work of a collection run.
+
+    Args:
+        cells (list): (service, language_name, disaster_name, prompt_name, existing_responses) tuples
+        output_json (dict): The current output data, for history.
+        skipped_services (iterable): Services disabled by the command line.
+        cassette_path (str): Optional cassette with recorded latencies.
+        concurrency_levels (iterable): Concurrency settings to predict wall time for.
+
+    Returns:
+        dict: per-service predictions plus totals per concurrency level and for the
+        strategy the scheduler picks.
+    """
+    # imported here, collect_responses imports this module
+    from collect_responses import check_for_weeks_response
+
+    latencies = history_latencies(output_json, cassette_path)
+    unsupported = unsupported_languages(output_json)
+    services = {}
+
+    for service, language_name, disaster_name, prompt_name, existing in cells:
+        entry = services.setdefault(service, {"cells": 0, "done": 0, "excluded": 0, "pending": 0})
+        entry["cells"] += 1
+        if service in skipped_services or language_name in unsupported.get(service, ()):
+            entry["excluded"] += 1
+        elif check_for_weeks_response(existing):
+            entry["done"] += 1
+        else:
+            entry["pending"] += 1
+
+    for service, entry in services.items():
+        observed = latencies.get(service, [])
+        latency = statistics.median(observed) if observed else DEFAULT_LATENCY.get(service, 5.0)
+        rpm = limits.get(service, {}).get("rpm")
+        rpd = limits.get(service, {}).get("rpd")
+        pending = entry["pending"]
+
+        entry["latency"] = latency
+        entry["latency_source"] = f"{len(observed)} observed" if observed else "default"
+        entry["requests"] = pending
+        entry["rpm"] = rpm
+        entry["rpd"] = rpd
+        entry["quota_used"] = pending / rpd if rpd else None
+        entry["days_needed"] = -(-pending // rpd) if rpd else (1 if pending else 0)
+
+        # a service can't go faster than its rate limit no matter how many requests are in flight
+        rate_floor = pending / rpm * 60 if rpm else 0.0
+        entry["seconds"] = {
+            c: max(pending * latency / c, rate_floor) for c in concurrency_levels
+        }
+
+        if service in SERVICES:
+            strategy = execution_strategy(SERVICES[service], pending, latency)
+            entry["strategy"] = strategy
+            entry["scheduled_seconds"] = max(pending * latency / strategy["workers"], rate_floor)
+
+    totals = {
+        # if the services ran one after another, each at the given concurrency
+        "sequential": {c: sum(e["seconds"][c] for e in services.values()) for c in concurrency_levels},
+        # lower bound if every service runs side by side
+        "parallel_services": {c: max((e["seconds"][c] for e in services.values()), default=0.0)
+                              for c in concurrency_levels},
+        # what the scheduler does: services side by side, each with its own strategy
+        "scheduled": max((e.get("scheduled_seconds", 0.0) for e in services.values()), default=0.0),
+    }
+    return {"services": services, "totals": totals, "concurrency_levels": list(concurrency_levels)}
+
+
+def _hours(seconds):
+    return f"{seconds / 3600:.2f}h"
+
+
+def format_plan(plan, window_hours=24.0):
+    """Renders a plan as a plain-text report."""
+    levels = plan["concurrency_levels"]
+    lines = []
+    header = f"{'service':<18}{'cells':>7}{'done':>7}{'excl':>7}{'pending':>9}{'lat(s)':>8}  {'quota/day':<14}"
+    header += "".join(f"{'c=' + str(c):>10}" for c in levels)
+    lines.append(header)
+    lines.append("-" * len(header))
+
+    for service, e in sorted(plan["services"].items()):
+        if e["rpd"]:
+            quota = f"{e['requests']}/{e['rpd']} ({e['days_needed']}d)"
+        else:
+            quota = f"{e['requests']}/-"
+        row = f"{service:<18}{e['cells']:>7}{e['done']:>7}{e['excluded']:>7}{e['pending']:>9}{e['latency']:>8.2f}  {quota:<14}"
+        row += "".join(f"{_hours(e['seconds'][c]):>10}" for c in levels)
+        lines.append(row)
+
+    lines.append("-" * len(header))
+    for name, label in (("sequential", "one service at a time"), ("parallel_services", "services in parallel")):
+        row = f"{label:<71}"
+        row += "".join(f"{_hours(plan['totals'][name][c]):>10}" for c in levels)
+        lines.append(row)
+
+    lines.append("")
+    for service, e in sorted(plan["services"].items()):
+        if "strategy" in e:
+            strategy = e["strategy"]
+            lines.append(f"{service}: {strategy['name']}, {strategy['workers']} worker(s), batches of "
+                         f"{strategy['batch_size']}, rpm limit {strategy['rpm']} -> {_hours(e['scheduled_seconds'])}")
+
+    scheduled = plan["totals"]["scheduled"]
+    verdict = "fits" if scheduled <= window_hours * 3600 else "does NOT fit"
+    lines.append(f"\nThe scheduled run ({_hours(scheduled)}) {verdict} the {window_hours:g}h window.")
+    over_quota = [s for s, e in plan["services"].items() if e["rpd"] and e["requests"] > e["rpd"]]
+    if over_quota:
+        lines.append(f"Daily quota exceeded by: {', '.join(sorted(over_quota))}")
+    return "\n".join(lines)
+
+
+def plan_as_json(plan):
+    return json.dumps(plan, indent=2, default=str)
@@ -0,0 +1,106 @@
+"""
+Live progress for `collect_responses.py`.
+
+ProgressConsole polls the ServiceRunners from a daemon thread and shows, per service:
+cells done and pending, requests started in the last minute against the service's rpm
+limit, open circuits (languages disabled after repeated failures), requests currently
+being retried, and an ETA from the rate the service has finished cells so far. The run
+ETA is the slowest service's, since services run side by side.
+
+On a TTY the table is redrawn in place every `refresh` seconds. Otherwise (e.g. under
+Condor, where stdout goes to a file) one summary line is written every `interval`
+seconds. Rendering only reads counters the runners already keep, so the request loop
+does not wait on it.
+"""
+
+import sys
+import threading
+import time
+
+
+def _duration(seconds):
+    if seconds is None:
+        return "--:--:--"
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
+class ProgressConsole:
+    def __init__(self, stream=None, interval=300.0, refresh=1.0, tty=None):
+        self.stream = stream or sys.stdout
+        self.tty = self.stream.isatty() if tty is None else tty
+        self.interval = refresh if self.tty else interval
+        self.runners = []
+        self.started_at = None
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._lines_drawn = 0
+
+    def start(self, runners):
+        self.runners = list(runners)
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="progress", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops refreshing and renders the final state once."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.render()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.render()
+
+    def render(self):
+        statuses = [runner.status() for runner in self.runners]
+        try:
+            if self.tty:
+                self._draw_table(statuses)
+            else:
+                self.stream.write(self.summary_line(statuses) + "\n")
+            self.stream.flush()
+        except (OSError, ValueError):
+            # the console went away (closed pipe or stream); progress is not worth failing the run for
+            self._stop.set()
+
+    def _eta(self, statuses):
+        etas = [status["eta"] for status in statuses]
+        return None if None in etas else max(etas, default=0.0)
+
+    def summary_line(self, statuses):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        parts = []
+        for s in statuses:
+            limit = s["rpm_limit"] if s["rpm_limit"] else "-"
+            part = f"{s['service']} {s['done']}/{s['done'] + s['pending']} {s['rpm']}/{limit}rpm"
+            if s["failed"]:
+                part += f" {s['failed']} failed"
+            if s["open_circuits"]:
+                part += f" {len(s['open_circuits'])} open"
+            if s["retrying"]:
+                part += f" {s['retrying']} retrying"
+            parts.append(part)
+        return f"[{_duration(elapsed)}] " + " | ".join(parts) + f" | ETA {_duration(self._eta(statuses))}"
+
+    def _draw_table(self, statuses):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        lines = [f"{'service':<18}{'done':>7}{'pending':>9}{'failed':>8}{'rpm':>10}{'retrying':>10}  {'ETA':<10}open circuits"]
+        for s in statuses:
+            rpm = f"{s['rpm']}/{s['rpm_limit'] or '-'}"
+            retrying = f"{s['retrying']} ({s['retries']})"
+            circuits = ", ".join(s["open_circuits"]) or "-"
+            lines.append(f"{s['service']:<18}{s['done']:>7}{s['pending']:>9}{s['failed']:>8}{rpm:>10}{retrying:>10}  "
+                         f"{_duration(s['eta']):<10}{circuits}")
+        lines.append(f"elapsed {_duration(elapsed)}, ETA {_duration(self._eta(statuses))}")
+
+        # move the cursor back over the previous table and overwrite it line by line
+        out = f"\x1b[{self._lines_drawn}F" if self._lines_drawn else ""
+        out += "".join(f"\x1b[2K{line}\n" for line in lines)
+        self.stream.write(out)
+        self._lines_drawn = len(lines)
@@ -0,0 +1,258 @@
+"""
+Runs the collection cells of each service with the execution strategy its registry entry allows.
+
+Every service gets its own ServiceRunner, and all runners work side by side. Within a
+runner the strategy follows the ServiceSpec declarations in clients/registry.py:
+
+    - workers:    up to `max_concurrency` threads, fewer when the rate limit would keep
+                  extra workers waiting anyway
+    - batching:   each worker takes `batch_size` cells at a time and builds one client
+                  for the whole batch instead of one per request
+    - pacing:     request starts are spaced to stay under `rpm`, and a run sends at most
+                  `rpd` requests; every attempt counts, including the clients' retries, since
+                  each client waits on its runner's limiter in `Client._request`
+    - streaming:  --stream only reaches the clients of services with `supports_streaming`
+    - languages:  cells for languages outside `supported_languages` are never requested
+
+A (service, language) pair whose requests fail `failure_limit` times in a row is
+disabled for the rest of the run (the circuit opens), as the sequential loop used to do.
+Workers stop picking up cells once `collector.stopping` is set.
+"""
+
+import math
+import queue
+import threading
+import time
+from collections import deque
+
+from clients import retries
+
+
+class RateLimiter:
+    """
+    Spaces request starts so that no more than `rpm` begin in any minute, and lets no more
+    than `rpd` start in total (one run is assumed to fit in a day, see the planner).
+    """
+    def __init__(self, rpm=None, rpd=None):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self.rpd = rpd
+        self.started = 0
+        self.starts = deque(maxlen=1000)    # monotonic start of recent requests, for rpm
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Waits for the next start; returns False without waiting once the daily quota is used."""
+        with self._lock:
+            if self.rpd is not None and self.started >= self.rpd:
+                return False
+            self.started += 1
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+            self.starts.append(start)
+        if start > now:
+            time.sleep(start - now)
+        return True
+
+    def exhausted(self):
+        return self.rpd is not None and self.started >= self.rpd
+
+
+def execution_strategy(spec, pending, latency=None):
+    """Returns the number of workers and batch size to use for `pending` cells of a service."""
+    latency = latency or spec.default_latency
+    workers = max(1, min(spec.max_concurrency, pending))
+    if spec.rpm:
+        # workers beyond what the rate limit can keep busy would only wait on the limiter
+        useful = math.ceil(spec.rpm * latency / 60.0)
+        workers = max(1, min(workers, useful))
+    return {
+        "name": "sequential" if workers == 1 else "concurrent",
+        "workers": workers,
+        "batch_size": spec.batch_size,
+        "rpm": spec.rpm,
+    }
+
+
+class ServiceRunner:
+    """
+    Requests the pending cells of one service.
+
+    Args:
+        spec (ServiceSpec): The service's registry entry.
+        cells (list): Pending (language, disaster, prompt_file_path, service_name) cells, in order.
+        request_cell (callable): (cell, client) -> bool, requests and stores one response.
+        collector (Collector): Provides the stop flag and the resume point.
+        logger (logging.Logger): Logger for progress and errors.
+        stream (bool): Passed to the client factory if the service supports streaming.
+        failure_limit (int): Consecutive failures that disable a language for this service.
+        done (int): Cells of this service that already had this week's response, for progress.
+    """
+    def __init__(self, spec, cells, request_cell, collector, logger, stream=False, failure_limit=3, done=0):
+        self.spec = spec
+        self.cells = cells
+        self.request_cell = request_cell
+        self.collector = collector
+        self.logger = logger
+        self.stream = stream and spec.supports_streaming
+        self.failure_limit = failure_limit
+
+        self.limiter = RateLimiter(spec.rpm, spec.rpd)
+        self.strategy = execution_strategy(spec, len(cells))
+        self.disabled_languages = set()
+        self.done = done
+        self.completed = 0
+        self.failed = 0
+        self.excluded = 0
+        self.skipped = 0        # cells not requested because their language's circuit was open
+        self.quota_reached = False
+        self.started_at = None
+
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._batches = queue.SimpleQueue()
+        self._threads = []
+
+    def start(self):
+        self.started_at = time.monotonic()
+        cells = self._supported(self.cells)
+        batch_size = self.strategy["batch_size"]
+        for i in range(0, len(cells), batch_size):
+            self._batches.put(cells[i:i + batch_size])
+
+        self.logger.info(f"{self.spec.name}: {len(cells)} cells, {self.strategy['name']} strategy with "
+                         f"{self.strategy['workers']} worker(s), batches of {batch_size}, rpm limit {self.spec.rpm}")
+        for i in range(self.strategy["workers"]):
+            # daemon threads, so a forced stop does not wait on a hung request
+            thread = threading.Thread(target=self._work, name=f"{self.spec.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def is_alive(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _supported(self, cells):
+        supported = self.spec.supported_languages
+        if callable(supported):
+            try:
+                supported = supported(self._build_client())
+            except Exception as e:
+                self.logger.error(f"Could not look up the languages {self.spec.name} supports: {e}")
+                supported = None
+        if supported is None:
+            return cells
+
+        kept = [cell for cell in cells if cell[0] in supported]
+        self.excluded = len(cells) - len(kept)
+        if self.excluded:
+            skipped = sorted({cell[0] for cell in cells if cell[0] not in supported})
+            self.logger.info(f"{self.spec.name}: skipping {self.excluded} cells in unsupported languages {skipped}")
+        return kept
+
+    def _build_client(self):
+        client = self.spec.client_factory(self.logger, stream=self.stream)
+        client.limiter = self.limiter
+        return client
+
+    def _work(self):
+        while not self.collector.stopping.is_set():
+            try:
+                batch = self._batches.get_nowait()
+            except queue.Empty:
+                return
+
+            client = None
+            for cell in batch:
+                if self.collector.stopping.is_set():
+                    return
+                language = cell[0]
+                if language in self.disabled_languages:
+                    with self._lock:
+                        self.skipped += 1
+                    continue
+
+                if self.limiter.exhausted():
+                    with self._lock:
+                        if not self.quota_reached:
+                            self.quota_reached = True
+                            self.logger.error(f"{self.spec.name}: {self.spec.rpd} requests per day used; "
+                                              f"leaving the remaining cells for the next run.")
+                    return
+
+                try:
+                    if client is None:
+                        client = self._build_client()
+                except Exception as e:
+                    self.logger.error(f"Could not create a {self.spec.name} client: {e}")
+                    self._record(language, False)
+                    continue
+
+                self.collector.set_resume_point(cell)
+                success = self.request_cell(cell, client)
+                retries.finished()
+                self._record(language, success)
+
+    def status(self):
+        """Returns a snapshot of this runner's progress for the progress console."""
+        now = time.monotonic()
+        with self._lock:
+            finished = self.completed + self.failed
+            skipped = self.skipped
+            snapshot = {
+                "service": self.spec.name,
+                "done": self.done + self.completed,
+                "failed": self.failed,
+                "pending": max(0, len(self.cells) - self.excluded - finished - skipped),
+                "excluded": self.excluded,
+                "open_circuits": sorted(self.disabled_languages),
+            }
+        snapshot["rpm"] = sum(1 for started in list(self.limiter.starts) if 0 <= now - started <= 60.0)
+        snapshot["rpm_limit"] = self.spec.rpm
+        snapshot["retrying"], snapshot["retries"] = retries.retry_counts([thread.name for thread in self._threads])
+        snapshot["alive"] = self.is_alive()
+
+        elapsed = now - self.started_at if self.started_at else 0.0
+        if not snapshot["alive"] or not snapshot["pending"]:
+            snapshot["eta"] = 0.0
+        elif finished and elapsed > 0:
+            snapshot["eta"] = snapshot["pending"] * elapsed / finished
+        else:
+            snapshot["eta"] = None
+        return snapshot
+
+    def _record(self, language, success):
+        with self._lock:
+            if success:
+                self.completed += 1
+                self._failures[language] = 0
+                return
+
+            self.failed += 1
+            self._failures[language] = self._failures.get(language, 0) + 1
+            if self._failures[language] >= self.failure_limit and language not in self.disabled_languages:
+                self.logger.error(f"Disabling {self.spec.name} for {language} due to repeated 429 errors.")
+                self.disabled_languages.add(language)
+
+
+def run_services(runners, poll_interval=0.5, progress=None):
+    """
+    Starts every runner and waits for all of them; the main thread stays responsive to signals.
+    `progress` (a ProgressConsole) is started with the runners and stopped once they finish.
+    """
+    for runner in runners:
+        runner.start()
+    if progress is not None:
+        progress.start(runners)
+    try:
+        while any(runner.is_alive() for runner in runners):
+            for runner in runners:
+                runner.join(poll_interval)
+    finally:
+        if progress is not None:
+            progress.stop()
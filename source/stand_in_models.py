@@ -0,0 +1,119 @@
+"""
+Tiny stand-ins for the BERTScore and COMET models, so source/benchmark.py can run the neural
+metrics on a laptop and without downloading anything.
+
+build_stand_in_models trains a WordPiece (BERT) and a Unigram (XLM-R) tokenizer on the texts it
+is given and saves randomly initialized two-layer encoders with them; use_stand_in_models points
+BERTScore at the first for every language and builds a COMET regression model on the second.
+Their scores mean nothing, but they go through the same code as the real models (tokenization,
+token-budget batching, the encoding cache, greedy matching and COMET's estimator) at a fraction
+of the cost, so they show the overhead around the models. Benchmark the real models before
+drawing conclusions about model time.
+"""
+
+import os
+
+DIRECTORY = "cache/stand_in_models"
+LAYERS = 2
+
+
+def build_stand_in_models(texts, directory=DIRECTORY, vocab_size=4000, seed=0):
+    """Builds the stand-in models in `directory` unless they are there, and returns (bert_path, xlmr_path)."""
+    bert_path = os.path.join(directory, "bert")
+    xlmr_path = os.path.join(directory, "xlmr")
+    if not os.path.exists(os.path.join(bert_path, "config.json")):
+        _build_bert(texts, bert_path, vocab_size, seed)
+    if not os.path.exists(os.path.join(xlmr_path, "config.json")):
+        _build_xlmr(texts, xlmr_path, vocab_size, seed)
+    return bert_path, xlmr_path
+
+
+def _build_bert(texts, path, vocab_size, seed):
+    import torch
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors, trainers
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    specials = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    tokenizer = Tokenizer(models.WordPiece(unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.BertNormalizer(lowercase=False)
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer.train_from_iterator(texts, trainers.WordPieceTrainer(vocab_size=vocab_size, special_tokens=specials))
+    cls, sep = tokenizer.token_to_id("[CLS]"), tokenizer.token_to_id("[SEP]")
+    tokenizer.post_processor = processors.TemplateProcessing(single="[CLS] $A [SEP]", pair="[CLS] $A [SEP] $B:1 [SEP]:1",
+                                                             special_tokens=[("[CLS]", cls), ("[SEP]", sep)])
+    BertTokenizerFast(tokenizer_object=tokenizer, model_max_length=512, do_lower_case=False).save_pretrained(path)
+
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=tokenizer.get_vocab_size(), hidden_size=64, num_hidden_layers=LAYERS,
+                        num_attention_heads=4, intermediate_size=128, max_position_embeddings=512)
+    BertModel(config).save_pretrained(path)
+
+
+def _build_xlmr(texts, path, vocab_size, seed):
+    import torch
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors, trainers
+    from transformers import XLMRobertaConfig, XLMRobertaModel, XLMRobertaTokenizerFast
+
+    # XLM-R's special token ids
+    specials = ["<s>", "<pad>", "</s>", "<unk>", "<mask>"]
+    tokenizer = Tokenizer(models.Unigram())
+    tokenizer.normalizer = normalizers.NFKC()
+    tokenizer.pre_tokenizer = pre_tokenizers.Metaspace()
+    tokenizer.train_from_iterator(texts, trainers.UnigramTrainer(vocab_size=vocab_size, special_tokens=specials,
+                                                                 unk_token="<unk>"))
+    tokenizer.post_processor = processors.TemplateProcessing(single="<s> $A </s>", pair="<s> $A </s> </s> $B </s>",
+                                                             special_tokens=[("<s>", 0), ("</s>", 2)])
+    XLMRobertaTokenizerFast(tokenizer_object=tokenizer, model_max_length=512).save_pretrained(path)
+
+    torch.manual_seed(seed)
+    config = XLMRobertaConfig(vocab_size=tokenizer.get_vocab_size(), hidden_size=64, num_hidden_layers=LAYERS,
+                              num_attention_heads=4, intermediate_size=128, max_position_embeddings=514,
+                              pad_token_id=1, bos_token_id=0, eos_token_id=2)
+    XLMRobertaModel(config, add_pooling_layer=False).save_pretrained(path)
+
+
+class StandInBERTScore:
+    """Takes the place of `evaluate`'s BERTScore metric; scores with the model use_stand_in_models set for every language."""
+
+    def compute(self, predictions, references, lang, batch_size=64):
+        from metrics.neural import _bertscorer
+        P, R, F1 = _bertscorer(lang, batch_size).score(predictions, references, batch_size=batch_size)
+        return {"precision": P.tolist(), "recall": R.tolist(), "f1": F1.tolist()}
+
+
+class StandInCOMET:
+    """Takes the place of `evaluate`'s COMET metric: an untrained COMET regression model on the stand-in XLM-R."""
+
+    config_name = "stand-in"
+
+    def __init__(self, xlmr_path, seed=0):
+        import torch
+        from comet.models import RegressionMetric
+
+        torch.manual_seed(seed)
+        self.scorer = RegressionMetric(encoder_model="XLM-RoBERTa", pretrained_model=xlmr_path, layer="mix",
+                                       pool="avg", hidden_sizes=[64], load_pretrained_weights=True)
+        self.scorer.eval()
+
+
+def use_bertscore_model(model_type, num_layers):
+    """Makes BERTScore (bert_score, and so metrics/neural.py) use `model_type` at layer `num_layers` for every language."""
+    from bert_score import utils
+
+    for lang in list(utils.lang2model):
+        utils.lang2model[lang] = model_type
+    utils.lang2model.default_factory = lambda: model_type
+    utils.model2layers[model_type] = num_layers
+
+
+def use_stand_in_models(texts, metrics, directory=DIRECTORY, seed=0):
+    """Builds the stand-in models if needed and returns the (bertscore, comet) metrics among `metrics`, None for the others."""
+    bertscore = comet = None
+    if "bertscore" in metrics or "comet" in metrics:
+        bert_path, xlmr_path = build_stand_in_models(texts, directory, seed=seed)
+        if "bertscore" in metrics:
+            use_bertscore_model(os.path.abspath(bert_path), LAYERS)
+            bertscore = StandInBERTScore()
+        if "comet" in metrics:
+            comet = StandInCOMET(xlmr_path, seed)
+    return bertscore, comet
@@ -0,0 +1,281 @@
+"""
+Generates synthetic corpora shaped like output_file.json, for benchmarking evaluation.py
+(source/benchmark.py) without the real responses.
+
+Scale 1 has as many responses as output_file.json: every (service, language, disaster, prompt)
+cell of data/freshness_report.csv, the census report_output_json.py writes, gets its count of
+responses (about 64,000 in the gold languages), and scale 10 or 100 multiplies every count.
+Fractional scales (e.g. 0.01 on a laptop) round each cell's scaled count up or down at random,
+so the total is still about right.
+
+Responses are built from the gold references, so every language has its real script and
+length: LLM responses edit 5-35% of the reference's words (characters in Chinese, Japanese,
+Thai, Lao, Khmer and Burmese), sometimes add an English preamble or note, and the _360 prompts
+are cut to 360 characters. Translation services edit a few words, translate the bracketed
+placeholders, and mostly return last week's response again, as Google Translate and DeepL do.
+The gold set leaves some languages empty; they get a synthetic reference in the language's
+script, about as long as the English source times the language's usual expansion, and the
+completed gold set is written next to the corpus.
+
+The same seed always gives the same corpus, and each cell is generated on its own.
+
+Usage:
+    python -m source.synthetic_corpus <output_path> [--scale SCALE] [--seed SEED]
+                                      [--reference_path GOLD] [--census CENSUS]
+"""
+
+import argparse
+import csv
+import json
+import random
+import re
+import time
+import unicodedata
+from datetime import date, timedelta
+
+GOLD = "data/evaluation_gold_standards.json"
+CENSUS = "data/freshness_report.csv"
+SCALES = [1, 10, 100]
+# the date of the latest responses; earlier responses are one week apart
+LATEST = date(2026, 4, 13)
+
+# letters of each script, by code point range; each range is picked equally often
+SCRIPTS = {
+    "latin": [(0x61, 0x7A)],
+    "cyrillic": [(0x430, 0x44F)],
+    "arabic": [(0x627, 0x64A)],
+    "hebrew": [(0x5D0, 0x5EA)],
+    "devanagari": [(0x905, 0x939), (0x93E, 0x94C)],
+    "gurmukhi": [(0xA05, 0xA39), (0xA3E, 0xA4C)],
+    "tamil": [(0xB85, 0xBB9), (0xBBE, 0xBCC)],
+    "telugu": [(0xC05, 0xC39), (0xC3E, 0xC4C)],
+    "thai": [(0xE01, 0xE30), (0xE40, 0xE44)],
+    "lao": [(0xE81, 0xEB0), (0xEC0, 0xEC4)],
+    "myanmar": [(0x1000, 0x102A), (0x102B, 0x1035)],
+    "ethiopic": [(0x1200, 0x135A)],
+    "khmer": [(0x1780, 0x17B3), (0x17B6, 0x17C5)],
+    "hangul": [(0xAC00, 0xD7A3)],
+    "cjk": [(0x4E00, 0x9FFF)],
+    "japanese": [(0x3041, 0x3096), (0x30A1, 0x30FA), (0x4E00, 0x9FFF)],
+}
+
+# language: (script, whether words are separated by spaces, length of a translation relative to the English source)
+LANGUAGES = {
+    "spanish": ("latin", True, 1.15), "haitian_creole": ("latin", True, 1.0), "vietnamese": ("latin", True, 1.0),
+    "arabic": ("arabic", True, 0.9), "chinese_traditional": ("cjk", False, 0.35), "chinese_simplified": ("cjk", False, 0.35),
+    "russian": ("cyrillic", True, 1.15), "ukrainian": ("cyrillic", True, 1.1), "tagalog": ("latin", True, 1.2),
+    "hindi": ("devanagari", True, 1.1), "korean": ("hangul", True, 0.6), "french": ("latin", True, 1.2),
+    "portuguese": ("latin", True, 1.1), "german": ("latin", True, 1.15), "italian": ("latin", True, 1.2),
+    "samoan": ("latin", True, 1.2), "marshallese": ("latin", True, 1.2), "punjabi": ("gurmukhi", True, 1.0),
+    "telegu": ("telugu", True, 1.0), "amharic": ("ethiopic", True, 0.7), "cambodian": ("khmer", False, 1.1),
+    "japanese": ("japanese", False, 0.45), "chuukese": ("latin", True, 1.2), "pashto": ("arabic", True, 1.0),
+    "tamil": ("tamil", True, 1.25), "tigrinya": ("ethiopic", True, 0.75), "urdu": ("arabic", True, 1.0),
+    "turkish": ("latin", True, 1.0), "swahili": ("latin", True, 1.1), "hebrew": ("hebrew", True, 0.8),
+    "lao": ("lao", False, 1.0), "romanian": ("latin", True, 1.1), "nepali": ("devanagari", True, 1.05),
+    "hmong": ("latin", True, 1.2), "burmese": ("myanmar", False, 1.2), "thai": ("thai", False, 0.9),
+    "oromo": ("latin", True, 1.25), "karen": ("myanmar", False, 1.2),
+}
+
+PREAMBLES = ["Here is the translation:", "Translation:", "Sure! Here is the alert translated:",
+             "**EMERGENCY ALERT**", "Below is the translated message."]
+NOTES = ["Note: the placeholders in brackets were left in English.",
+         "(Translated for a general audience; adjust local terms as needed.)",
+         "Note: [TIME] and [LOCATION] should be filled in by the sending agency."]
+PLACEHOLDER = re.compile(r"\[.*?\]")
+
+
+def read_census(path=CENSUS):
+    """Returns [(service, language, disaster, prompt, count)] of every cell; prompt is None for the translation services."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return [(row["service"], row["language"], row["alert"], None if row["prompt"] == "-" else row["prompt"],
+                 int(row["count"])) for row in csv.DictReader(f)]
+
+
+def alphabet(script):
+    """The letters and marks of `script`, one list per range of SCRIPTS."""
+    return [[chr(point) for point in range(start, end + 1) if unicodedata.category(chr(point))[0] in "LM"]
+            for start, end in SCRIPTS[script]]
+
+
+def split_text(text, spaced):
+    """Words of a space-separated language, characters of the others."""
+    return (text.split(), " ") if spaced else (list(text), "")
+
+
+def synthetic_words(language, count, seed=0):
+    """`count` made-up words in the script of `language`, about as long as its real words."""
+    script, spaced, _ = LANGUAGES[language]
+    ranges = alphabet(script)
+    starts = [letter for letters in ranges for letter in letters if unicodedata.category(letter)[0] == "L"]
+    rng = random.Random(f"{seed}:{language}:words")
+    lengths = (2, 9) if spaced else (1, 3)
+    return [rng.choice(starts) + "".join(rng.choice(rng.choice(ranges)) for _ in range(rng.randint(*lengths) - 1))
+            for _ in range(count)]
+
+
+def synthetic_reference(source, language, seed=0):
+    """
+    A stand-in translation of `source`: its placeholders and punctuation kept, every English word
+    replaced by a made-up word (the same one each time), scaled to the language's usual length.
+    """
+    _, spaced, ratio = LANGUAGES[language]
+    words = synthetic_words(language, 500, seed)
+    rng = random.Random(f"{seed}:{language}:reference:{source}")
+    translated = []
+    for token in re.findall(r"\[.*?\]|\w+|[^\w\s]", source):
+        if token.startswith("[") or not token[0].isalnum():
+            translated.append(token)
+        else:
+            # the same English word always gets the same word
+            translated.append(words[sum(map(ord, token.lower())) % len(words)])
+    joiner = " " if spaced else ""
+    text = joiner.join(translated)
+    # pad to the expected length, and cut what runs more than 10% over it
+    target = int(len(source) * ratio)
+    while len(text) < target:
+        text += joiner + rng.choice(words)
+    if len(text) > target * 1.1:
+        text = text[:int(target * 1.1)]
+    return text
+
+
+def complete_gold(gold, seed=0):
+    """The gold set with every empty reference replaced by a synthetic_reference of its source."""
+    completed = {}
+    for language, disasters in gold.items():
+        completed[language] = {}
+        for disaster, texts in disasters.items():
+            texts = dict(texts)
+            if not texts.get("reference", "").strip() and language in LANGUAGES:
+                texts["reference"] = synthetic_reference(texts["source"], language, seed)
+            completed[language][disaster] = texts
+    return completed
+
+
+def edit(tokens, vocabulary, rate, rng):
+    """Drops, replaces or inserts about `rate` of the tokens."""
+    tokens = list(tokens)
+    edits = min(len(tokens), int(len(tokens) * rate * rng.uniform(0.5, 1.5)))
+    for position in sorted(rng.sample(range(len(tokens)), edits), reverse=True):
+        operation = rng.random()
+        if operation < 0.4:
+            del tokens[position]
+        elif operation < 0.8:
+            tokens[position] = rng.choice(vocabulary)
+        else:
+            tokens.insert(position, rng.choice(vocabulary))
+    return tokens
+
+
+def cut(text, limit, joiner):
+    # at the last word boundary before the limit, as a model asked for `limit` characters would stop
+    if len(text) <= limit:
+        return text
+    text = text[:limit]
+    return text.rsplit(joiner, 1)[0] if joiner and joiner in text else text
+
+
+def llm_response(reference, vocabulary, spaced, prompt, rng):
+    tokens, joiner = split_text(reference, spaced)
+    # plain translation prompts stay closer to the reference than the open ones
+    rate = rng.uniform(0.05, 0.15) if prompt.startswith("translate_") else rng.uniform(0.1, 0.35)
+    text = joiner.join(edit(tokens, vocabulary, rate, rng))
+    if rng.random() < 0.25:
+        text = f"{rng.choice(PREAMBLES)}\n\n{text}"
+    if "_360" in prompt:
+        return cut(text, 360, joiner or " ")
+    if rng.random() < 0.15:
+        text = f"{text}\n\n{rng.choice(NOTES)}"
+    return text
+
+
+def translation_response(reference, vocabulary, spaced, rng):
+    tokens, joiner = split_text(reference, spaced)
+    text = joiner.join(edit(tokens, vocabulary, rng.uniform(0.0, 0.08), rng))
+    # translation services translate the placeholders too
+    return PLACEHOLDER.sub(lambda match: "[" + rng.choice(vocabulary) + "]", text)
+
+
+def generate_cell(service, language, disaster, prompt, count, reference, vocabulary, seed=0):
+    """The `count` responses of one cell, oldest first, each {"text": ..., "date": ...}."""
+    spaced = LANGUAGES[language][1] if language in LANGUAGES else True
+    rng = random.Random(f"{seed}:{service}:{language}:{disaster}:{prompt}")
+    responses = []
+    for week in range(count):
+        if prompt is not None:
+            text = llm_response(reference, vocabulary, spaced, prompt, rng)
+        elif responses and rng.random() < 0.9:
+            text = responses[-1]["text"]
+        else:
+            text = translation_response(reference, vocabulary, spaced, rng)
+        responses.append({"text": text, "date": (LATEST - timedelta(weeks=count - 1 - week)).isoformat()})
+    return responses
+
+
+def vocabularies(gold, seed=0):
+    """{language: words (characters for unspaced languages) of its references, plus made-up words in its script}."""
+    result = {}
+    for language, disasters in gold.items():
+        spaced = LANGUAGES[language][1] if language in LANGUAGES else True
+        words = [token for texts in disasters.values() for token in split_text(texts["reference"], spaced)[0]
+                 if not PLACEHOLDER.fullmatch(token)]
+        if language in LANGUAGES:
+            words += synthetic_words(language, 50, seed)
+        result[language] = words or ["-"]
+    return result
+
+
+def generate_corpus(gold, census, scale=1.0, seed=0):
+    """
+    Returns (corpus, responses): an output_file.json-shaped corpus with `scale` times the
+    responses of every census cell whose language and disaster are in `gold`.
+    """
+    words = vocabularies(gold, seed)
+    corpus = {}
+    total = 0
+    for service, language, disaster, prompt, count in census:
+        if language not in gold or disaster not in gold[language]:
+            continue
+        expected = count * scale
+        rng = random.Random(f"{seed}:{service}:{language}:{disaster}:{prompt}:count")
+        scaled = int(expected) + (rng.random() < expected - int(expected))
+        if count and not scaled:
+            # only the cells that are empty in output_file.json are empty here
+            continue
+        count = scaled
+        responses = generate_cell(service, language, disaster, prompt, count, gold[language][disaster]["reference"],
+                                  words[language], seed)
+        cells = corpus.setdefault(service, {}).setdefault(language, {})
+        if prompt is None:
+            cells[disaster] = responses
+        else:
+            cells.setdefault(disaster, {})[prompt] = responses
+        total += count
+    return corpus, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic output_file.json for benchmarking evaluation.py")
+    parser.add_argument("output_path", help="Where to write the corpus; the completed gold set goes to <output_path stem>.gold.json")
+    parser.add_argument("--scale", type=float, default=1, help="Responses relative to output_file.json (1, 10, 100, or a fraction)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the corpus (default 0)")
+    parser.add_argument("--reference_path", default=GOLD, help=f"Gold set (default {GOLD})")
+    parser.add_argument("--census", default=CENSUS, help=f"Responses per cell of output_file.json (default {CENSUS})")
+    args = parser.parse_args()
+
+    start = time.time()
+    with open(args.reference_path, "r", encoding="utf-8") as f:
+        gold = complete_gold(json.load(f), args.seed)
+    corpus, total = generate_corpus(gold, read_census(args.census), args.scale, args.seed)
+    gold_path = re.sub(r"\.json$", "", args.output_path) + ".gold.json"
+    with open(args.output_path, "w", encoding="utf-8") as f:
+        json.dump(corpus, f, ensure_ascii=False)
+    with open(gold_path, "w", encoding="utf-8") as f:
+        json.dump(gold, f, ensure_ascii=False, indent=2)
+    print(f"Generated {total} responses in {len(gold)} languages in {time.time() - start:.2f} seconds.")
+    print(f"Corpus saved to: {args.output_path}")
+    print(f"Gold set saved to: {gold_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Adaptive output-token limits for the LLM services.
+
+The same 360-character alert costs several times more output tokens in Burmese, Amharic,
+Tigrinya, Khmer or Lao than in Spanish, so one fixed `max_tokens` truncates some languages
+and over-allocates others. TokenLimits learns a limit per (service, language, prompt) from
+the "output_tokens" and "truncated" fields the clients store with each response:
+
+    - the limit is the 95th percentile of complete outputs plus `headroom`
+    - an output that was truncated needed more than it got, so it pushes the limit to
+      at least `growth` times its length
+    - an output that was aborted (a streamed response stopped for running far past the
+      prompt's length) is not observed: its length shows a runaway, not what the cell needs
+    - cells with fewer than `min_observations` responses borrow the observations of the
+      same service and language across prompts, and fall back to the client's default
+    - limits are rounded up to a multiple of `step` so they do not change with every
+      response (cassettes store the limit but do not key on it, see clients/cassette.py)
+
+Observations are seeded from output_file.json and updated as responses come in.
+"""
+
+import math
+import threading
+from collections import defaultdict
+
+
+class TokenLimits:
+    def __init__(self, min_observations=3, headroom=1.25, growth=2.0, step=32, floor=64, ceiling=2048):
+        self.min_observations = min_observations
+        self.headroom = headroom
+        self.growth = growth
+        self.step = step
+        self.floor = floor
+        self.ceiling = ceiling
+
+        self._cells = defaultdict(list)         # (service, language, prompt) -> [(tokens, truncated)]
+        self._languages = defaultdict(list)     # (service, language) -> [(tokens, truncated)]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_history(cls, output_json, **kwargs):
+        """Seeds the observations from the prompted services' responses in output_file.json."""
+        limits = cls(**kwargs)
+        for service, languages in output_json.items():
+            if not isinstance(languages, dict):
+                continue
+            for language, disasters in languages.items():
+                for prompts in (disasters or {}).values():
+                    if not isinstance(prompts, dict):
+                        continue    # direct services have no prompt layer and no token limit
+                    for prompt, responses in prompts.items():
+                        for response in responses:
+                            if isinstance(response, dict):
+                                limits.observe(service, language, prompt, response)
+        return limits
+
+    def observe(self, service, language, prompt, record):
+        """Adds the usage of one stored response (or its metadata) to the observations."""
+        tokens = record.get("output_tokens")
+        if not isinstance(tokens, int) or record.get("aborted"):
+            return
+        observation = (tokens, bool(record.get("truncated")))
+        with self._lock:
+            self._cells[(service, language, prompt)].append(observation)
+            self._languages[(service, language)].append(observation)
+
+    def limit(self, service, language, prompt, default):
+        """Returns the output-token limit to request for one cell, or `default` without enough history."""
+        with self._lock:
+            observations = list(self._cells.get((service, language, prompt), ()))
+            if len(observations) < self.min_observations:
+                observations = list(self._languages.get((service, language), ()))
+        if len(observations) < self.min_observations:
+            return default
+
+        complete = sorted(tokens for tokens, truncated in observations if not truncated)
+        needed = 0.0
+        if complete:
+            # nearest-rank 95th percentile
+            needed = complete[max(0, math.ceil(0.95 * len(complete)) - 1)] * self.headroom
+        truncated = [tokens for tokens, truncated in observations if truncated]
+        if truncated:
+            needed = max(needed, max(truncated) * self.growth)
+
+        needed = min(max(needed, self.floor), self.ceiling)
+        return int(math.ceil(needed / self.step) * self.step)
+
+    def summary(self):
+        """Returns {(service, language): (responses, truncated)} for the run log."""
+        with self._lock:
+            return {key: (len(obs), sum(truncated for _, truncated in obs)) for key, obs in self._languages.items()}
@@ -0,0 +1,125 @@
+"""
+Measures how far the CPU backends of the neural metrics (metrics/cpu_backend.py) and an
+alternative COMET checkpoint drift from the fp32 scores, so the speed/accuracy trade-off
+can be chosen from data.
+
+Every sample of the predictions file is scored against the gold set with BERTScore and
+COMET in fp32 (the default COMET checkpoint), then with each candidate backend (and
+--comet_model for COMET). For each candidate the script prints, per metric:
+
+    seconds, samples/s     wall time of the candidate, and its speed-up over fp32
+    pearson, spearman      correlation of the per-sample scores with fp32
+    mean |d|, max |d|      absolute drift of the per-sample scores from fp32
+    group mean |d|         absolute drift of the value in the results CSV (COMET's group mean,
+                           the first prediction's BERTScore F1), averaged over the groups
+
+No cache is used, so every candidate is timed from scratch. The first run of an ONNX
+backend also includes the export.
+
+Usage:
+    python -m source.validate_neural_backend <generated_path> <reference_path> [--backends BACKEND ...]
+                                              [--comet_model MODEL] [--service_name SERVICE ...]
+                                              [--max_samples N] [--batch_size N] [--output_csv OUTPUT_CSV]
+"""
+
+import argparse
+import time
+
+import pandas as pd
+from evaluate import load
+
+from evaluation import collect_groups, flatten_samples, load_json
+from metrics.neural import BACKENDS, bertscore_samples, comet_samples
+
+
+def limit_groups(groups, max_samples):
+    # whole groups, so the group scores stay comparable
+    kept, count = [], 0
+    for group in groups:
+        if max_samples is not None and count + len(group["raw"]) > max_samples:
+            break
+        kept.append(group)
+        count += len(group["raw"])
+    return kept
+
+
+def score(metric, samples, backend, comet_model, batch_size):
+    """Returns (per-sample scores, seconds) of `metric` on `backend`."""
+    start = time.time()
+    if metric == "bertscore":
+        scores = bertscore_samples(load("bertscore"), [s["hypothesis"] for s in samples], [s["reference"] for s in samples],
+                                   [s["language_code"] for s in samples], batch_size=batch_size, backend=backend)["f1"]
+    else:
+        # a fresh metric per candidate, since the backend converts the checkpoint in place
+        scores = comet_samples(load("comet", comet_model), [s["raw"] for s in samples], [s["reference"] for s in samples],
+                               [s["source"] for s in samples], batch_size=batch_size, backend=backend)
+    return list(scores), time.time() - start
+
+
+def group_values(metric, groups, scores):
+    # the value each group reports in the results CSV
+    values = []
+    for group in groups:
+        group_scores = scores[group["first_sample"]:group["first_sample"] + len(group["raw"])]
+        values.append(group_scores[0] if metric == "bertscore" else sum(group_scores) / len(group_scores))
+    return pd.Series(values)
+
+
+def compare(reference, candidate):
+    reference, candidate = pd.Series(reference), pd.Series(candidate)
+    drift = (candidate - reference).abs()
+    return {
+        "pearson": reference.corr(candidate),
+        "spearman": reference.rank().corr(candidate.rank()),
+        "mean |d|": drift.mean(),
+        "max |d|": drift.max(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the CPU backends of BERTScore and COMET against fp32")
+    parser.add_argument("generated_path", help="Path generated text file")
+    parser.add_argument("reference_path", help="Path reference text file (the gold set)")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["int8", "onnx", "onnx-int8"],
+                        help="Candidate backends; default every CPU backend")
+    parser.add_argument("--comet_model", default="default",
+                        help="COMET checkpoint of the candidates, e.g. the distilled Unbabel/eamt22-cometinho-da; "
+                             "the fp32 reference always uses the default checkpoint")
+    parser.add_argument("--metrics", nargs="+", choices=["bertscore", "comet"], default=["bertscore", "comet"],
+                        help="Metrics to compare; default both")
+    parser.add_argument("--service_name", nargs="+", default=None, help="Only use these services' predictions; default all")
+    parser.add_argument("--max_samples", type=int, default=None, help="Stop after the groups holding this many samples")
+    parser.add_argument("--batch_size", type=int, default=64, help="Samples per batch (default 64)")
+    parser.add_argument("--output_csv", default=None, help="Also write the comparison to this CSV")
+    args = parser.parse_args()
+
+    groups = collect_groups(load_json(args.generated_path, "prediction"), load_json(args.reference_path, "reference"),
+                            args.service_name)
+    groups = limit_groups(groups, args.max_samples)
+    samples = flatten_samples(groups)
+    print(f"{len(samples)} samples in {len(groups)} groups")
+
+    rows = []
+    for metric in args.metrics:
+        reference, reference_seconds = score(metric, samples, "fp32", "default", args.batch_size)
+        reference_groups = group_values(metric, groups, reference)
+        rows.append({"metric": metric, "candidate": "fp32", "seconds": reference_seconds,
+                     "samples/s": len(samples) / reference_seconds, "speed-up": 1.0})
+        for backend in args.backends:
+            name = backend if metric == "bertscore" or args.comet_model == "default" else f"{args.comet_model} {backend}"
+            candidate, seconds = score(metric, samples, backend, args.comet_model, args.batch_size)
+            row = {"metric": metric, "candidate": name, "seconds": seconds, "samples/s": len(samples) / seconds,
+                   "speed-up": reference_seconds / seconds}
+            row.update(compare(reference, candidate))
+            row["group mean |d|"] = (group_values(metric, groups, candidate) - reference_groups).abs().mean()
+            rows.append(row)
+
+    df = pd.DataFrame(rows)
+    print(df.to_string(index=False, float_format=lambda value: f"{value:.4g}"))
+    if args.output_csv:
+        df.to_csv(args.output_csv, index=False)
+        print(f"Results saved to: {args.output_csv}")
+
+
+if __name__ == "__main__":
+    main()